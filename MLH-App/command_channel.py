@@ -0,0 +1,158 @@
+import socket
+import struct
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+# ==========================================
+# CONFIGURATION
+# ==========================================
+# Where the robot (or the local echo stand-in) listens for commands
+COMMAND_HOST = "127.0.0.1"
+COMMAND_PORT = 4210
+
+# Wire format (little endian, fixed 30 bytes):
+#   magic[4] seq:u32 capture_us:u64 send_us:u64 steer:i16 throttle:i16 color:u8 flags:u8
+# steer is -1000 (full left) .. 1000 (full right), throttle is 0 .. 1000
+PACKET = struct.Struct("<4sIQQhhBB")
+MAGIC = b"WOPS"
+FLAG_TRACKING = 0x01
+
+# Color ids on the wire (0 = nothing tracked)
+COLOR_IDS = {"Red": 1, "Blue": 2, "Green": 3, "Yellow": 4}
+
+# Steering: nav_angle 90 is straight ahead, +/- MAX_DEVIATION is full lock
+MAX_DEVIATION = 45.0
+STEER_ALPHA = 0.5        # EMA weight of the newest angle
+STEER_SLEW = 0.25        # max steering change per command (fraction of full lock)
+
+# Throttle: cruise while tracking, slow down in turns, stop when the target is lost
+CRUISE_THROTTLE = 0.6
+TURN_SLOWDOWN = 0.5
+LOST_TIMEOUT = 0.5       # seconds without a target before throttle drops to 0
+
+LATENCY_WINDOW = 300     # commands kept for latency statistics
+
+def now_us():
+    return time.time_ns() // 1000
+
+class CommandChannel:
+    """
+    Turns the HUD's nav angle into smoothed steering/throttle commands and
+    sends them as fixed-size UDP datagrams. Records capture -> send latency
+    for every command, and round-trip time when the receiver echoes back.
+    """
+
+    def __init__(self, host=COMMAND_HOST, port=COMMAND_PORT):
+        self.addr = (host, port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.seq = 0
+        self.steer = 0.0
+        self.last_seen = None
+        self.latency_ms = deque(maxlen=LATENCY_WINDOW)
+        self.rtt_ms = deque(maxlen=LATENCY_WINDOW)
+        self._sent_at = {}
+
+    def _smooth(self, target_steer):
+        blended = STEER_ALPHA * target_steer + (1.0 - STEER_ALPHA) * self.steer
+        delta = max(-STEER_SLEW, min(STEER_SLEW, blended - self.steer))
+        self.steer = max(-1.0, min(1.0, self.steer + delta))
+        return self.steer
+
+    def send(self, nav_angle, color, capture_t, capture_us):
+        """
+        Send one command for a processed frame.
+        capture_t is the perf_counter() time the frame arrived, capture_us the
+        matching wall-clock timestamp that goes on the wire.
+        """
+        tracking = color is not None
+        if tracking:
+            self.last_seen = capture_t
+            deviation = (nav_angle - 90.0) / MAX_DEVIATION
+            steer = self._smooth(max(-1.0, min(1.0, deviation)))
+        else:
+            steer = self._smooth(0.0)
+
+        if self.last_seen is not None and capture_t - self.last_seen < LOST_TIMEOUT:
+            throttle = CRUISE_THROTTLE * (1.0 - TURN_SLOWDOWN * abs(steer))
+        else:
+            throttle = 0.0
+
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        flags = FLAG_TRACKING if tracking else 0
+        packet = PACKET.pack(MAGIC, self.seq, capture_us, now_us(),
+                             int(steer * 1000), int(throttle * 1000),
+                             COLOR_IDS.get(color, 0), flags)
+        try:
+            self.sock.sendto(packet, self.addr)
+        except OSError:
+            return None
+
+        sent_t = time.perf_counter()
+        self.latency_ms.append((sent_t - capture_t) * 1000.0)
+        self._sent_at[self.seq] = sent_t
+        self._poll_echoes()
+        return steer, throttle
+
+    def _poll_echoes(self):
+        while True:
+            try:
+                data = self.sock.recv(PACKET.size)
+            except (BlockingIOError, OSError):
+                break
+            if len(data) != PACKET.size:
+                continue
+            magic, seq = PACKET.unpack(data)[:2]
+            sent_t = self._sent_at.pop(seq, None)
+            if magic == MAGIC and sent_t is not None:
+                self.rtt_ms.append((time.perf_counter() - sent_t) * 1000.0)
+        # Forget commands whose echo never came back
+        if len(self._sent_at) > LATENCY_WINDOW:
+            for seq in sorted(self._sent_at)[:-LATENCY_WINDOW]:
+                del self._sent_at[seq]
+
+    def stats(self):
+        """Latency summary in ms: capture -> send, and send -> echo round trip."""
+        out = {}
+        for name, samples in (("capture_to_send", self.latency_ms), ("round_trip", self.rtt_ms)):
+            if samples:
+                arr = np.fromiter(samples, dtype=np.float64)
+                out[name] = {
+                    "p50": float(np.percentile(arr, 50)),
+                    "p95": float(np.percentile(arr, 95)),
+                    "max": float(arr.max()),
+                }
+        return out
+
+    def close(self):
+        self.sock.close()
+
+def run_echo(host=COMMAND_HOST, port=COMMAND_PORT):
+    """Local stand-in for the robot: prints commands and echoes them back."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((host, port))
+    print(f"Echoing commands on udp://{host}:{port}")
+    last_seq = None
+    while True:
+        data, addr = sock.recvfrom(64)
+        if len(data) != PACKET.size:
+            continue
+        magic, seq, capture_us, send_us, steer, throttle, color, flags = PACKET.unpack(data)
+        if magic != MAGIC:
+            continue
+        sock.sendto(data, addr)
+
+        lost = 0 if last_seq is None else (seq - last_seq - 1) & 0xFFFFFFFF
+        last_seq = seq
+        age_ms = (now_us() - capture_us) / 1000.0
+        print(f"#{seq} steer={steer:+5d} throttle={throttle:4d} color={color} "
+              f"age={age_ms:.1f}ms lost={lost}")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "echo":
+        run_echo()
+    else:
+        print("Usage: python command_channel.py echo")
@@ -2,7 +2,15 @@ import cv2
 import numpy as np
 import urllib.request
 import time
-import pygame
+
+try:
+    import pygame
+except ImportError:
+    # Headless use (e.g. the training pipeline's HSV labeler) only needs the detectors
+    pygame = None
+
+from command_channel import CommandChannel, COMMAND_HOST, COMMAND_PORT
+from profiler_hook import install_profiler
 
 # ==========================================
 # CONFIGURATION
@@ -10,6 +18,21 @@ import pygame
 STREAM_URL = 'http://192.168.38.209:81/stream'
 MIN_AREA = 1000 
 
+# Coarse-to-fine mode: segment at 1/PYRAMID_SCALE resolution, then refine at
+# full resolution inside each candidate window (padded by PYRAMID_MARGIN px).
+# Coarse blobs are kept down to PYRAMID_AREA_SLACK * MIN_AREA so borderline
+# targets still get a full-resolution look.
+PYRAMID_MODE = False
+PYRAMID_SCALE = 4
+PYRAMID_MARGIN = 12
+PYRAMID_AREA_SLACK = 0.5
+# Downscaling averages a thin strip with the floor around it, so the coarse
+# pass accepts saturation/brightness down to this fraction of each lower bound
+PYRAMID_SV_SLACK = 0.5
+# Allowed difference from the full-resolution pass (px, deg)
+PYRAMID_CENTER_TOL = 2.0
+PYRAMID_ANGLE_TOL = 2.0
+
 # Dashboard Geometry (Tweak these to calibrate the "Floor" view)
 TOP_WIDTH = 100   
 HORIZON = 120     
@@ -35,6 +58,9 @@ COLORS = {
 LOWER_WHITE = np.array([0, 0, 200])
 UPPER_WHITE = np.array([180, 50, 255])
 
+# Robot command output (set SEND_COMMANDS = False to only draw the HUD)
+SEND_COMMANDS = True
+
 # Drawing Colors for Dashboard (RGB)
 DASH_COLORS = {
     "Red": (255, 50, 50),
@@ -58,7 +84,12 @@ def get_bird_eye_matrix(w, h):
 # ==========================================
 # STREAM PARSING
 # ==========================================
-def get_frame(stream):
+def get_frame_timed(stream):
+    """
+    Like get_frame, but also returns (perf_counter, wall-clock us) of the
+    moment the JPEG's last bytes arrived, before decode/resize, so latency
+    measured from it includes decoding.
+    """
     bytes_data = b''
     while True:
         try:
@@ -67,11 +98,16 @@ def get_frame(stream):
             if a != -1:
                 b = bytes_data.find(b'\xff\xd9', a)
                 if b != -1:
+                    capture_t = time.perf_counter()
+                    capture_us = time.time_ns() // 1000
                     jpg = bytes_data[a:b+2]
                     frame = cv2.imdecode(np.frombuffer(jpg, dtype=np.uint8), cv2.IMREAD_COLOR)
-                    return cv2.resize(frame, (400, 300))
+                    return cv2.resize(frame, (400, 300)), capture_t, capture_us
         except Exception:
-            return None
+            return None, None, None
+
+def get_frame(stream):
+    return get_frame_timed(stream)[0]
 
 # ... (Previous imports and config)
 
@@ -154,46 +190,155 @@ def draw_navigation_path(screen, color, angle, center_x):
     pygame.draw.lines(screen, color, False, points_l, 3)
     pygame.draw.lines(screen, color, False, points_r, 3)
 
-def detect_objects_with_angle(frame):
+def color_mask(hsv, ranges, kernel=None):
+    mask = np.zeros(hsv.shape[:2], dtype="uint8")
+    for (lower, upper) in ranges:
+        mask = cv2.bitwise_or(mask, cv2.inRange(hsv, lower, upper))
+    if kernel is None:
+        return mask
+    return cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+
+def add_detections(mask, color_name, output_frame, detections, offset=(0, 0)):
+    """Rotated-rect detections for one colour mask. offset maps ROI coords back to the frame."""
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=offset)
+    
+    for cnt in contours:
+        if cv2.contourArea(cnt) < MIN_AREA: continue
+        
+        # Use MinAreaRect to get Angle
+        rect = cv2.minAreaRect(cnt)
+        (center, (w, h), angle) = rect
+        box = cv2.boxPoints(rect)
+        box = np.int32(box)
+        
+        # Draw Rotated Rect
+        cv2.drawContours(output_frame, [box], 0, (0, 255, 0), 2)
+        cv2.putText(output_frame, f"{color_name} {int(angle)}deg", (box[0][0], box[0][1]), 
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+        
+        # Normalize Angle logic (OpenCV returns -90 to 0 usually)
+        # Make sure W > H to define "Orientation"
+        if w < h:
+            angle = angle + 90
+            
+        detections.append({'color': color_name, 'angle': angle, 'center': center})
+
+def detect_objects_with_angle(frame, pyramid=False):
+    if pyramid:
+        return detect_objects_pyramid(frame)
+
     output_frame = frame.copy()
     detections = []
     
     blur = cv2.GaussianBlur(frame, (5, 5), 0)
     hsv = cv2.cvtColor(blur, cv2.COLOR_BGR2HSV)
+    kernel = np.ones((5, 5), np.uint8)
     
     for color_name, ranges in COLORS.items():
-        mask = np.zeros(hsv.shape[:2], dtype="uint8")
-        for (lower, upper) in ranges:
-            mask = cv2.bitwise_or(mask, cv2.inRange(hsv, lower, upper))
-            
-        kernel = np.ones((5, 5), np.uint8)
-        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
-        
-        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        for cnt in contours:
-            if cv2.contourArea(cnt) < MIN_AREA: continue
-            
-            # Use MinAreaRect to get Angle
-            rect = cv2.minAreaRect(cnt)
-            (center, (w, h), angle) = rect
-            box = cv2.boxPoints(rect)
-            box = np.int0(box)
-            
-            # Draw Rotated Rect
-            cv2.drawContours(output_frame, [box], 0, (0, 255, 0), 2)
-            cv2.putText(output_frame, f"{color_name} {int(angle)}deg", (box[0][0], box[0][1]), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-            
-            # Normalize Angle logic (OpenCV returns -90 to 0 usually)
-            # Make sure W > H to define "Orientation"
-            if w < h:
-                angle = angle + 90
-                
-            detections.append({'color': color_name, 'angle': angle, 'center': center})
+        mask = color_mask(hsv, ranges, kernel)
+        add_detections(mask, color_name, output_frame, detections)
                 
     return output_frame, detections
 
+# ==========================================
+# COARSE-TO-FINE (PYRAMID) MODE
+# ==========================================
+def merge_windows(windows):
+    """Merge overlapping (x0, y0, x1, y1) windows so no blob is refined twice."""
+    windows = list(windows)
+    merged = True
+    while merged:
+        merged = False
+        out = []
+        for win in windows:
+            for i, other in enumerate(out):
+                if win[0] < other[2] and other[0] < win[2] and win[1] < other[3] and other[1] < win[3]:
+                    out[i] = (min(win[0], other[0]), min(win[1], other[1]),
+                              max(win[2], other[2]), max(win[3], other[3]))
+                    merged = True
+                    break
+            else:
+                out.append(win)
+        windows = out
+    return windows
+
+def detect_objects_pyramid(frame, scale=PYRAMID_SCALE, margin=PYRAMID_MARGIN,
+                           area_slack=PYRAMID_AREA_SLACK, sv_slack=PYRAMID_SV_SLACK):
+    """
+    Two-level version of detect_objects_with_angle. Colours are segmented at
+    1/scale resolution to find candidate blobs; angle and centroid are then
+    measured at full resolution only inside the (padded) candidate windows.
+    """
+    output_frame = frame.copy()
+    detections = []
+    h, w = frame.shape[:2]
+
+    # 1. Coarse pass
+    small = cv2.resize(frame, (w // scale, h // scale), interpolation=cv2.INTER_AREA)
+    small_hsv = cv2.cvtColor(cv2.GaussianBlur(small, (3, 3), 0), cv2.COLOR_BGR2HSV)
+    small_kernel = np.ones((3, 3), np.uint8)
+    min_small_area = MIN_AREA * area_slack / (scale * scale)
+
+    kernel = np.ones((5, 5), np.uint8)
+    for color_name, ranges in COLORS.items():
+        # No opening here: at 1/scale a thin strip is only a pixel or two wide and
+        # a 3x3 open erases it. Dilating instead rejoins strips that came out
+        # broken; specks are dropped by the area test.
+        coarse_ranges = [((lower * [1, sv_slack, sv_slack]).astype(lower.dtype), upper) for lower, upper in ranges]
+        small_mask = cv2.dilate(color_mask(small_hsv, coarse_ranges), small_kernel)
+        contours, _ = cv2.findContours(small_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        windows = []
+        for cnt in contours:
+            if cv2.contourArea(cnt) < min_small_area: continue
+            x, y, bw, bh = cv2.boundingRect(cnt)
+            windows.append((max(0, x * scale - margin), max(0, y * scale - margin),
+                            min(w, (x + bw) * scale + margin), min(h, (y + bh) * scale + margin)))
+
+        # 2. Fine pass inside each candidate window
+        for (x0, y0, x1, y1) in merge_windows(windows):
+            roi = frame[y0:y1, x0:x1]
+            hsv = cv2.cvtColor(cv2.GaussianBlur(roi, (5, 5), 0), cv2.COLOR_BGR2HSV)
+            mask = color_mask(hsv, ranges, kernel)
+            add_detections(mask, color_name, output_frame, detections, offset=(x0, y0))
+
+    return output_frame, detections
+
+def compare_detections(full, coarse, center_tol=PYRAMID_CENTER_TOL, angle_tol=PYRAMID_ANGLE_TOL):
+    """
+    Check pyramid results against the full-resolution pass. Returns the list
+    of full-resolution detections with no pyramid match within tolerance.
+    """
+    missing = []
+    unused = list(coarse)
+    for det in full:
+        for other in unused:
+            if other['color'] != det['color']: continue
+            dx = other['center'][0] - det['center'][0]
+            dy = other['center'][1] - det['center'][1]
+            da = abs(other['angle'] - det['angle']) % 180
+            if dx * dx + dy * dy <= center_tol * center_tol and min(da, 180 - da) <= angle_tol:
+                unused.remove(other)
+                break
+        else:
+            missing.append(det)
+    return missing
+
+def check_pyramid(frames, center_tol=PYRAMID_CENTER_TOL, angle_tol=PYRAMID_ANGLE_TOL):
+    """
+    Run both passes on every frame and hold the pyramid output to the
+    tolerances. Returns (full-resolution detections checked, [(frame index,
+    missing detection)]).
+    """
+    checked = 0
+    failures = []
+    for i, frame in enumerate(frames):
+        _, full = detect_objects_with_angle(frame)
+        _, coarse = detect_objects_pyramid(frame)
+        checked += len(full)
+        failures += [(i, det) for det in compare_detections(full, coarse, center_tol, angle_tol)]
+    return checked, failures
+
 def main():
     pygame.init()
     screen = pygame.display.set_mode((400, 600))
@@ -207,16 +352,22 @@ def main():
         print(f"Error connecting to stream: {e}")
         return
 
+    commands = CommandChannel(COMMAND_HOST, COMMAND_PORT) if SEND_COMMANDS else None
+    last_report = time.time()
+
+    # Press 'p' (or `kill -USR1 <pid>`) to profile the next few seconds
+    profiler = install_profiler()
+
     running = True
     while running:
         for event in pygame.event.get():
             if event.type == pygame.QUIT: running = False
             
-        frame = get_frame(stream)
+        frame, capture_t, capture_us = get_frame_timed(stream)
         if frame is None: continue
         
         # Vision
-        vis_frame, objects = detect_objects_with_angle(frame)
+        vis_frame, objects = detect_objects_with_angle(frame, pyramid=PYRAMID_MODE)
         
         # Dashboard
         screen.fill((10, 10, 20)) # Deep Space Grey
@@ -225,6 +376,7 @@ def main():
         nav_color = (60, 60, 60)
         nav_text = "SEARCHING..."
         nav_angle = 0
+        col_name = None
         
         # Logic: Find the LARGEST object to follow
         if objects:
@@ -238,6 +390,14 @@ def main():
                 
             nav_text = f"TRACKING: {col_name.upper()} ({int(nav_angle)} deg)"
             
+        # Send the command before any drawing so HUD work isn't counted as latency
+        if commands:
+            commands.send(nav_angle, col_name, capture_t, capture_us)
+            if time.time() - last_report > 5:
+                last_report = time.time()
+                for name, s in commands.stats().items():
+                    print(f"[latency] {name}: p50 {s['p50']:.1f}ms  p95 {s['p95']:.1f}ms  max {s['max']:.1f}ms")
+            
         # Draw Dynamic Road
         draw_navigation_path(screen, nav_color, nav_angle, 200)
         
@@ -252,8 +412,12 @@ def main():
         cv2.imshow("Camera Feed", vis_frame)
         pygame.display.flip()
         
-        if cv2.waitKey(1) & 0xFF == ord('q'): break
+        key = cv2.waitKey(1) & 0xFF
+        if key == ord('p'): profiler.toggle()
+        if key == ord('q'): break
             
+    if commands:
+        commands.close()
     cv2.destroyAllWindows()
     pygame.quit()
 
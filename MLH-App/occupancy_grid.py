@@ -0,0 +1,171 @@
+import cv2
+import numpy as np
+import urllib.request
+
+from mlh_color_detector import (
+    STREAM_URL, COLORS, LOWER_WHITE, UPPER_WHITE, get_bird_eye_matrix, get_frame
+)
+
+# ==========================================
+# CONFIGURATION
+# ==========================================
+# Size of the bird's-eye warp (matches get_bird_eye_matrix for a 400x300 frame)
+WARP_W, WARP_H = 400, 600
+
+# One grid cell covers CELL_PX x CELL_PX warped pixels -> 40 x 60 cells
+CELL_PX = 10
+
+# Fixed-point (Q8) temporal filter: evidence = evidence * DECAY + observation * GAIN
+# (both factors are out of 256)
+# 230/256 ~= 0.9 per frame, so a cell that stops being seen fades in ~20 frames
+DECAY_Q8 = 230
+GAIN_Q8 = 64
+
+# Evidence level (0-255) at which a cell counts as "occupied"
+OCCUPIED_LEVEL = 128
+
+# Semantic layers: each one is the union of its HSV ranges
+GRID_LAYERS = {
+    "lane": [(LOWER_WHITE, UPPER_WHITE)],
+    "obstacle": COLORS["Red"],
+    "target": COLORS["Blue"] + COLORS["Green"] + COLORS["Yellow"],
+}
+
+class OccupancyGrid:
+    """
+    Rolling robot-centric floor map. Every frame's colour masks are warped
+    to the bird's-eye view, area-averaged into cells and blended into the
+    evidence grid. All buffers are allocated once up front.
+    """
+
+    def __init__(self, frame_w=400, frame_h=300, layers=GRID_LAYERS):
+        self.layer_names = list(layers.keys())
+        self.layer_ranges = list(layers.values())
+        self.rows = WARP_H // CELL_PX
+        self.cols = WARP_W // CELL_PX
+        self.M = get_bird_eye_matrix(frame_w, frame_h)
+
+        n = len(self.layer_names)
+        shape = (n, self.rows, self.cols)
+        self.evidence = np.zeros(shape, dtype=np.uint8)
+        self._obs = np.zeros(shape, dtype=np.uint8)
+        self._acc = np.zeros(shape, dtype=np.uint16)
+        self._gain = np.zeros(shape, dtype=np.uint16)
+
+        self._blur = np.zeros((frame_h, frame_w, 3), dtype=np.uint8)
+        self._hsv = np.zeros((frame_h, frame_w, 3), dtype=np.uint8)
+        self._mask = np.zeros((frame_h, frame_w), dtype=np.uint8)
+        self._tmp = np.zeros((frame_h, frame_w), dtype=np.uint8)
+        self._warped = np.zeros((WARP_H, WARP_W), dtype=np.uint8)
+        self._kernel = np.ones((5, 5), np.uint8)
+
+    def update(self, frame):
+        """Fold one BGR frame into the grid (in place)."""
+        cv2.GaussianBlur(frame, (5, 5), 0, dst=self._blur)
+        cv2.cvtColor(self._blur, cv2.COLOR_BGR2HSV, dst=self._hsv)
+
+        for i, ranges in enumerate(self.layer_ranges):
+            lower, upper = ranges[0]
+            cv2.inRange(self._hsv, lower, upper, dst=self._mask)
+            for (lower, upper) in ranges[1:]:
+                cv2.inRange(self._hsv, lower, upper, dst=self._tmp)
+                cv2.bitwise_or(self._mask, self._tmp, dst=self._mask)
+            cv2.morphologyEx(self._mask, cv2.MORPH_OPEN, self._kernel, dst=self._mask)
+
+            cv2.warpPerspective(self._mask, self.M, (WARP_W, WARP_H), dst=self._warped,
+                                flags=cv2.INTER_NEAREST)
+            # INTER_AREA gives the fraction of each cell covered (0-255)
+            cv2.resize(self._warped, (self.cols, self.rows), dst=self._obs[i],
+                       interpolation=cv2.INTER_AREA)
+
+        # evidence = min(255, (evidence * DECAY >> 8) + (obs * GAIN >> 8)), all layers at once
+        # Each product is <= 255 * 255 so the uint16 scratch never overflows.
+        np.multiply(self.evidence, DECAY_Q8, out=self._acc, dtype=np.uint16)
+        np.right_shift(self._acc, 8, out=self._acc)
+        np.multiply(self._obs, GAIN_Q8, out=self._gain, dtype=np.uint16)
+        np.right_shift(self._gain, 8, out=self._gain)
+        np.add(self._acc, self._gain, out=self._acc)
+        np.minimum(self._acc, 255, out=self._acc)
+        np.copyto(self.evidence, self._acc, casting='unsafe')
+
+    def reset(self):
+        self.evidence.fill(0)
+
+    # ---------- Queries ----------
+
+    def layer(self, name):
+        """Evidence for one layer as a (rows, cols) view. Do not modify."""
+        return self.evidence[self.layer_names.index(name)]
+
+    def floor_to_cell(self, x, y):
+        """Warped (bird's-eye) pixel -> (row, col), or None if off the map."""
+        row, col = int(y) // CELL_PX, int(x) // CELL_PX
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            return row, col
+        return None
+
+    def cell_to_robot(self, row, col):
+        """
+        Cell centre in robot-centric floor pixels: (lateral, forward).
+        The robot sits at the bottom-centre of the warp; +lateral is right.
+        """
+        lateral = (col + 0.5) * CELL_PX - WARP_W / 2
+        forward = WARP_H - (row + 0.5) * CELL_PX
+        return lateral, forward
+
+    def is_occupied(self, name, row, col, level=OCCUPIED_LEVEL):
+        return self.layer(name)[row, col] >= level
+
+    def occupied_cells(self, name, level=OCCUPIED_LEVEL):
+        """(N, 2) array of (row, col) for every cell above the level."""
+        return np.argwhere(self.layer(name) >= level)
+
+    def nearest(self, name, level=OCCUPIED_LEVEL):
+        """Closest occupied cell to the robot as (row, col), or None."""
+        cells = self.occupied_cells(name, level)
+        if len(cells) == 0:
+            return None
+        d_row = self.rows - 0.5 - cells[:, 0]
+        d_col = cells[:, 1] + 0.5 - self.cols / 2
+        return tuple(cells[np.argmin(d_row * d_row + d_col * d_col)])
+
+    def render(self, scale=CELL_PX):
+        """BGR debug image: lane = white, obstacle = red, target = green."""
+        vis = np.zeros((self.rows, self.cols, 3), dtype=np.uint8)
+        if "lane" in self.layer_names:
+            vis[:] = self.layer("lane")[:, :, None]
+        if "obstacle" in self.layer_names:
+            vis[:, :, 2] = np.maximum(vis[:, :, 2], self.layer("obstacle"))
+        if "target" in self.layer_names:
+            vis[:, :, 1] = np.maximum(vis[:, :, 1], self.layer("target"))
+        return cv2.resize(vis, (self.cols * scale, self.rows * scale),
+                          interpolation=cv2.INTER_NEAREST)
+
+def main():
+    print(f"Connecting to ESP32 Camera at: {STREAM_URL}")
+    try:
+        stream = urllib.request.urlopen(STREAM_URL)
+    except Exception as e:
+        print(f"Error connecting to stream: {e}")
+        return
+
+    grid = OccupancyGrid()
+    while True:
+        frame = get_frame(stream)
+        if frame is None: continue
+
+        grid.update(frame)
+
+        target = grid.nearest("target")
+        if target is not None:
+            lateral, forward = grid.cell_to_robot(*target)
+            print(f"Nearest target: {lateral:+.0f}px lateral, {forward:.0f}px ahead")
+
+        cv2.imshow("Camera Feed", frame)
+        cv2.imshow("Occupancy Grid", grid.render())
+        if cv2.waitKey(1) & 0xFF == ord('q'): break
+
+    cv2.destroyAllWindows()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+import cv2
+import numpy as np
+import urllib.request
+import argparse
+import concurrent.futures
+import glob
+import os
+import time
+
+from mlh_color_detector import STREAM_URL, get_bird_eye_matrix, get_frame
+from profiler_hook import install_profiler
+
+# ==========================================
+# CONFIGURATION
+# ==========================================
+# Lane tape colour (same blue tape range as the test6 curve fitter)
+LANE_LOWER = np.array([90, 50, 50])
+LANE_UPPER = np.array([130, 255, 255])
+
+# Frames are normalised to the live stream size before warping
+FRAME_W, FRAME_H = 400, 300
+WARP_W, WARP_H = 400, 600
+
+# Sliding-window lane search (see find_lane_curvature in test6.py)
+NWINDOWS = 9
+MARGIN = 50
+MINPIX = 50
+MIN_LANE_PIXELS = 200
+
+# Lateral distance (warped px) between the lane and the robot centre line
+# before the robot counts as drifting
+DRIFT_LIMIT = 60
+
+# Debounce (seconds): a drift must last ENTER_SEC to count as one event, and
+# the robot must be back on the lane for EXIT_SEC before another can start
+ENTER_SEC = 0.5
+EXIT_SEC = 1.0
+
+# Same statuses the web referee uses for OFF_PATH_COUNT
+ON_TRACK = "on_track"
+OFF_TRACK = "off_track"
+DRIFTING_LEFT = "drifting_left"
+DRIFTING_RIGHT = "drifting_right"
+
+def fit_lane(warped_binary):
+    """
+    Sliding-window lane fit from test6.find_lane_curvature without the
+    drawing. Returns the 2nd order polynomial x = f(y), or None.
+    """
+    h = warped_binary.shape[0]
+    histogram = np.count_nonzero(warped_binary[h // 2:, :], axis=0)
+    current_x = int(np.argmax(histogram))
+
+    nonzeroy, nonzerox = warped_binary.nonzero()
+    if len(nonzerox) < MIN_LANE_PIXELS:
+        return None
+
+    window_height = h // NWINDOWS
+    lane_inds = []
+    for window in range(NWINDOWS):
+        win_y_low = h - (window + 1) * window_height
+        win_y_high = h - window * window_height
+        good_inds = ((nonzeroy >= win_y_low) & (nonzeroy < win_y_high) &
+                     (nonzerox >= current_x - MARGIN) & (nonzerox < current_x + MARGIN)).nonzero()[0]
+        lane_inds.append(good_inds)
+        if len(good_inds) > MINPIX:
+            current_x = int(np.mean(nonzerox[good_inds]))
+
+    lane_inds = np.concatenate(lane_inds)
+    if len(lane_inds) < MIN_LANE_PIXELS:
+        return None
+    try:
+        return np.polyfit(nonzeroy[lane_inds], nonzerox[lane_inds], 2)
+    except Exception:
+        return None
+
+class OffPathCounter:
+    """
+    Debounced off-path event counter. Holds O(1) state per match, so it can
+    be fed one frame at a time from a live stream or a decoded video.
+    """
+
+    def __init__(self, enter_sec=ENTER_SEC, exit_sec=EXIT_SEC):
+        self.enter_sec = enter_sec
+        self.exit_sec = exit_sec
+        self.count = 0
+        self.frames = 0
+        self.status = ON_TRACK
+        self._off = False           # currently inside a counted event
+        self._since = None          # when the current raw on/off run started
+        self._raw_off = False
+
+    def update(self, status, t):
+        """Feed one classified frame (status, timestamp in seconds)."""
+        self.frames += 1
+        self.status = status
+        raw_off = status != ON_TRACK
+
+        if raw_off != self._raw_off or self._since is None:
+            self._raw_off = raw_off
+            self._since = t
+
+        held = t - self._since
+        if raw_off and not self._off and held >= self.enter_sec:
+            self._off = True
+            self.count += 1
+        elif not raw_off and self._off and held >= self.exit_sec:
+            self._off = False
+        return self.count
+
+class OffPathDetector:
+    """Classifies frames against the lane and counts debounced off-path events."""
+
+    def __init__(self, enter_sec=ENTER_SEC, exit_sec=EXIT_SEC):
+        self.M = get_bird_eye_matrix(FRAME_W, FRAME_H)
+        self.counter = OffPathCounter(enter_sec, exit_sec)
+        self.kernel = np.ones((5, 5), np.uint8)
+        self.offset = None
+
+    def classify(self, frame):
+        if frame.shape[1] != FRAME_W or frame.shape[0] != FRAME_H:
+            frame = cv2.resize(frame, (FRAME_W, FRAME_H))
+        blurred = cv2.GaussianBlur(frame, (5, 5), 0)
+        hsv = cv2.cvtColor(blurred, cv2.COLOR_BGR2HSV)
+        mask = cv2.inRange(hsv, LANE_LOWER, LANE_UPPER)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, self.kernel)
+        warped = cv2.warpPerspective(mask, self.M, (WARP_W, WARP_H), flags=cv2.INTER_NEAREST)
+
+        fit = fit_lane(warped)
+        if fit is None:
+            self.offset = None
+            return OFF_TRACK
+
+        # Where the lane crosses the robot's position (bottom of the warp)
+        y = WARP_H - 1
+        lane_x = fit[0] * y * y + fit[1] * y + fit[2]
+        self.offset = lane_x - WARP_W / 2
+        if self.offset > DRIFT_LIMIT:
+            return DRIFTING_LEFT     # lane is off to the right -> we drifted left
+        if self.offset < -DRIFT_LIMIT:
+            return DRIFTING_RIGHT
+        return ON_TRACK
+
+    def update(self, frame, t):
+        return self.counter.update(self.classify(frame), t)
+
+    @property
+    def count(self):
+        return self.counter.count
+
+# ==========================================
+# LIVE (MJPEG) MODE
+# ==========================================
+def run_live(url=STREAM_URL):
+    print(f"Connecting to ESP32 Camera at: {url}")
+    try:
+        stream = urllib.request.urlopen(url)
+    except Exception as e:
+        print(f"Error connecting to stream: {e}")
+        return
+
+    detector = OffPathDetector()
+    # 'p' or `kill -USR1 <pid>` samples the loop for a few seconds
+    profiler = install_profiler()
+    while True:
+        frame = get_frame(stream)
+        if frame is None: continue
+
+        detector.update(frame, time.time())
+        status = detector.counter.status
+        color = (0, 255, 0) if status == ON_TRACK else (0, 0, 255)
+        cv2.putText(frame, f"{status.upper()}  OFF_PATH_COUNT: {detector.count}", (10, 25),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+        cv2.imshow("Off-Path Detector", frame)
+        key = cv2.waitKey(1) & 0xFF
+        if key == ord('q'): break
+        if key == ord('p'): profiler.toggle()
+
+    cv2.destroyAllWindows()
+    print(f"OFF_PATH_COUNT: {detector.count}")
+
+# ==========================================
+# BATCH (ARCHIVE) MODE
+# ==========================================
+def _position_sec(cap, index, fps):
+    # Container timestamp of the last grabbed frame. Browser-recorded webm is
+    # variable-frame-rate and often reports a bogus CAP_PROP_FPS (e.g. 1000),
+    # so index / fps is only the fallback when the backend gives no position.
+    msec = cap.get(cv2.CAP_PROP_POS_MSEC)
+    if msec and msec > 0:
+        return msec / 1000.0
+    return index / fps
+
+def count_video(video_path, stride=1):
+    """
+    Worker: off-path count for one archived match. Only every `stride`-th
+    frame is decoded; the rest are grabbed and dropped. Debouncing runs on
+    video timestamps, so the count does not depend on the stride.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        return {"video": video_path, "error": "could not open"}
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    detector = OffPathDetector()
+    index = 0
+    video_sec = 0.0
+    start = time.time()
+    while True:
+        if index % stride:
+            if not cap.grab():
+                break
+        else:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            video_sec = _position_sec(cap, index, fps)
+            detector.update(frame, video_sec)
+        index += 1
+    video_sec = max(video_sec, _position_sec(cap, index - 1, fps)) if index else 0.0
+    cap.release()
+
+    elapsed = time.time() - start
+    return {
+        "video": video_path,
+        "off_path_count": detector.count,
+        "frames": index,
+        "speed": video_sec / elapsed if elapsed > 0 else 0.0,
+    }
+
+def run_batch(videos, workers=None, stride=1, csv_path=None):
+    """Recompute OFF_PATH_COUNT for many matches, one match per process."""
+    workers = workers or os.cpu_count() or 1
+    print(f"Counting off-path events in {len(videos)} matches with {workers} workers...")
+
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(count_video, v, stride): v for v in videos}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                res = future.result()
+            except Exception as e:
+                res = {"video": futures[future], "error": str(e)}
+            results.append(res)
+            name = os.path.basename(res["video"])
+            if "error" in res:
+                print(f"{name}: ERROR {res['error']}")
+            else:
+                print(f"{name}: {res['off_path_count']} off-path events "
+                      f"({res['frames']} frames, {res['speed']:.1f}x real-time)")
+
+    if csv_path:
+        with open(csv_path, "w") as f:
+            f.write("video,off_path_count,frames\n")
+            for res in sorted(results, key=lambda r: r["video"]):
+                if "error" not in res:
+                    f.write(f"{os.path.basename(res['video'])},{res['off_path_count']},{res['frames']}\n")
+        print(f"Wrote {csv_path}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute OFF_PATH_COUNT live or from archived matches")
+    parser.add_argument("videos", nargs="*", help="archived .webm files or directories (omit for live mode)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--stride", type=int, default=1, help="decode every Nth frame in batch mode")
+    parser.add_argument("--csv", default=None, help="write batch results to this CSV file")
+    args = parser.parse_args()
+
+    if not args.videos:
+        run_live()
+        return
+
+    videos = []
+    for path in args.videos:
+        if os.path.isdir(path):
+            videos.extend(sorted(glob.glob(os.path.join(path, "*.webm"))))
+        else:
+            videos.append(path)
+    run_batch(videos, args.workers, max(1, args.stride), args.csv)
+
+if __name__ == "__main__":
+    main()
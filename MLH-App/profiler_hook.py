@@ -0,0 +1,140 @@
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+# ==========================================
+# CONFIGURATION
+# ==========================================
+PROFILE_DIR = "profiles"
+PROFILE_SECONDS = 10
+SAMPLE_INTERVAL = 0.005     # 200 Hz
+TOP_ALLOCATORS = 25
+# tracemalloc records this many frames on EVERY allocation while sampling.
+# The report groups by allocating line, so 1 frame is all it needs; deeper
+# tracebacks slow the vision loop several-fold and skew the stack samples.
+# Set to 0 to skip allocation tracing entirely.
+TRACEMALLOC_FRAMES = 1
+
+class SamplingProfiler:
+    """
+    Low-overhead wall-clock sampler for a running vision loop.
+
+    A daemon thread periodically reads sys._current_frames() and counts the
+    stacks it sees; nothing is injected into the sampled threads, so the
+    capture thread keeps running undisturbed. Samples are written as
+    collapsed stacks (flamegraph.pl / speedscope format) together with a
+    tracemalloc snapshot of the top allocators over the same window.
+    """
+
+    def __init__(self, seconds=PROFILE_SECONDS, interval=SAMPLE_INTERVAL,
+                 out_dir=PROFILE_DIR, skip_threads=()):
+        self.seconds = seconds
+        self.interval = interval
+        self.out_dir = out_dir
+        self.skip_threads = set(skip_threads)
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds=None):
+        with self._lock:
+            if self.active:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(seconds or self.seconds,),
+                                            name="sampling-profiler", daemon=True)
+            self._thread.start()
+        print(f"[profiler] Sampling for {seconds or self.seconds}s...")
+
+    def stop(self):
+        self._stop.set()
+
+    def toggle(self):
+        if self.active:
+            self.stop()
+        else:
+            self.start()
+
+    def _run(self, seconds):
+        own = threading.get_ident()
+        names = {}
+        stacks = Counter()
+        started_tracemalloc = TRACEMALLOC_FRAMES > 0 and not tracemalloc.is_tracing()
+        if started_tracemalloc:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+
+        start = time.perf_counter()
+        deadline = start + seconds
+        samples = 0
+        while not self._stop.is_set() and time.perf_counter() < deadline:
+            for t in threading.enumerate():
+                names[t.ident] = t.name
+            for ident, frame in sys._current_frames().items():
+                name = names.get(ident, str(ident))
+                if ident == own or name in self.skip_threads:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(name)
+                stacks[";".join(reversed(stack))] += 1
+            samples += 1
+            time.sleep(self.interval)
+        elapsed = time.perf_counter() - start
+
+        snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        if started_tracemalloc:
+            tracemalloc.stop()
+        self._write(stacks, snapshot, samples, elapsed)
+
+    def _write(self, stacks, snapshot, samples, elapsed):
+        os.makedirs(self.out_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d_%H%M%S")
+        stack_path = os.path.join(self.out_dir, f"profile_{stamp}.collapsed")
+        alloc_path = os.path.join(self.out_dir, f"alloc_{stamp}.txt")
+
+        with open(stack_path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        if snapshot is None:
+            print(f"[profiler] {samples} samples in {elapsed:.1f}s -> {stack_path}")
+            return
+        with open(alloc_path, "w") as f:
+            f.write(f"Top {TOP_ALLOCATORS} allocators after {elapsed:.1f}s\n")
+            for stat in snapshot.statistics("lineno")[:TOP_ALLOCATORS]:
+                f.write(f"{stat}\n")
+
+        print(f"[profiler] {samples} samples in {elapsed:.1f}s -> {stack_path}, {alloc_path}")
+
+def install_profiler(sig=getattr(signal, "SIGUSR1", None), **kwargs):
+    """
+    Create a profiler and bind it to a signal (SIGUSR1 by default), e.g.
+    `kill -USR1 <pid>`. Loops with a key handler can also call toggle().
+    The handler only sets an event; a watcher thread does the toggling, so
+    a signal landing while the main thread is inside start() can't deadlock.
+    """
+    kwargs["skip_threads"] = set(kwargs.get("skip_threads", ())) | {"profiler-signal"}
+    profiler = SamplingProfiler(**kwargs)
+    if sig is not None and threading.current_thread() is threading.main_thread():
+        requested = threading.Event()
+
+        def watch():
+            while True:
+                requested.wait()
+                requested.clear()
+                profiler.toggle()
+
+        threading.Thread(target=watch, name="profiler-signal", daemon=True).start()
+        signal.signal(sig, lambda signum, frame: requested.set())
+    return profiler
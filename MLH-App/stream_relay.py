@@ -0,0 +1,234 @@
+import cv2
+import numpy as np
+import urllib.request
+import argparse
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from mlh_color_detector import STREAM_URL, detect_objects_with_angle
+from profiler_hook import install_profiler
+
+# ==========================================
+# CONFIGURATION
+# ==========================================
+RELAY_HOST = "0.0.0.0"
+RELAY_PORT = 8081
+
+# Frames buffered per viewer. A viewer that falls further behind loses its
+# oldest frames instead of slowing down the camera or the detector.
+CLIENT_QUEUE_SIZE = 2
+
+# Same size the detector scripts work at
+FRAME_SIZE = (400, 300)
+JPEG_QUALITY = 80
+
+BOUNDARY = b"frame"
+
+# ==========================================
+# UPSTREAM
+# ==========================================
+def iter_jpegs(stream, chunk=4096):
+    """Yield complete JPEG byte strings from an MJPEG stream, keeping leftovers."""
+    buf = b''
+    while True:
+        data = stream.read(chunk)
+        if not data:
+            return
+        buf += data
+        while True:
+            a = buf.find(b'\xff\xd8')
+            if a == -1:
+                # No start marker: keep only a possible partial marker
+                buf = buf[-1:]
+                break
+            b = buf.find(b'\xff\xd9', a)
+            if b == -1:
+                buf = buf[a:]
+                break
+            yield buf[a:b+2]
+            buf = buf[b+2:]
+
+class Channel:
+    """One MJPEG feed. Each frame is published once and shared by every viewer."""
+
+    def __init__(self, name):
+        self.name = name
+        self.clients = set()
+        self.lock = threading.Lock()
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        with self.lock:
+            self.clients.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.clients.discard(q)
+
+    def publish(self, jpg):
+        """Non-blocking fan-out: slow viewers drop their oldest frame."""
+        self.published += 1
+        with self.lock:
+            clients = list(self.clients)
+        for q in clients:
+            try:
+                q.put_nowait(jpg)
+            except queue.Full:
+                try:
+                    q.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+                try:
+                    q.put_nowait(jpg)
+                except queue.Full:
+                    pass
+
+class StreamRelay:
+    """
+    Holds the single connection to the ESP32-CAM and re-serves the raw and
+    annotated feeds. The upstream reader never waits on the detector or on
+    viewers; the detector always works on the newest frame.
+    """
+
+    def __init__(self, url=STREAM_URL):
+        self.url = url
+        self.raw = Channel("raw")
+        self.annotated = Channel("annotated")
+        self.running = False
+        self._latest = None
+        self._latest_seq = 0
+        self._cond = threading.Condition()
+        self.detections = []
+
+    def start(self):
+        self.running = True
+        # Named so the profiler's stacks say which loop they came from
+        threading.Thread(target=self._upstream_loop, name="relay-capture", daemon=True).start()
+        threading.Thread(target=self._detector_loop, name="relay-detector", daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        with self._cond:
+            self._cond.notify_all()
+
+    def _upstream_loop(self):
+        while self.running:
+            try:
+                print(f"Connecting to ESP32 Camera at: {self.url}")
+                stream = urllib.request.urlopen(self.url)
+                for jpg in iter_jpegs(stream):
+                    if not self.running:
+                        break
+                    # The camera's own JPEG is relayed untouched
+                    self.raw.publish(jpg)
+                    with self._cond:
+                        self._latest = jpg
+                        self._latest_seq += 1
+                        self._cond.notify()
+            except Exception as e:
+                print(f"Upstream error: {e}. Reconnecting...")
+                time.sleep(1)
+
+    def _detector_loop(self):
+        seen = 0
+        encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY]
+        while self.running:
+            with self._cond:
+                while self.running and self._latest_seq == seen:
+                    self._cond.wait(timeout=1.0)
+                jpg, seen = self._latest, self._latest_seq
+            if jpg is None:
+                continue
+
+            frame = cv2.imdecode(np.frombuffer(jpg, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if frame is None:
+                continue
+            frame = cv2.resize(frame, FRAME_SIZE)
+            vis_frame, self.detections = detect_objects_with_angle(frame)
+
+            # Encode once per frame, shared by every annotated viewer
+            ok, enc = cv2.imencode(".jpg", vis_frame, encode_params)
+            if ok:
+                self.annotated.publish(enc.tobytes())
+
+# ==========================================
+# HTTP SERVER
+# ==========================================
+def make_handler(relay):
+    routes = {"/stream": relay.raw, "/raw": relay.raw, "/annotated": relay.annotated}
+
+    class RelayHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            channel = routes.get(self.path.split("?")[0])
+            if channel is None:
+                self._index()
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY.decode()}")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+
+            q = channel.subscribe()
+            try:
+                while relay.running:
+                    try:
+                        jpg = q.get(timeout=5)
+                    except queue.Empty:
+                        continue
+                    self.wfile.write(b"--" + BOUNDARY + b"\r\nContent-Type: image/jpeg\r\n"
+                                     + f"Content-Length: {len(jpg)}\r\n\r\n".encode() + jpg + b"\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                channel.unsubscribe(q)
+
+        def _index(self):
+            lines = [f"{path}: {ch.name} ({len(ch.clients)} viewers, "
+                     f"{ch.published} frames, {ch.dropped} dropped)" for path, ch in routes.items()]
+            body = ("\n".join(lines) + "\n").encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return RelayHandler
+
+def main():
+    parser = argparse.ArgumentParser(description="Fan one ESP32-CAM feed out to many MJPEG viewers")
+    parser.add_argument("--url", default=STREAM_URL)
+    parser.add_argument("--host", default=RELAY_HOST)
+    parser.add_argument("--port", type=int, default=RELAY_PORT)
+    args = parser.parse_args()
+
+    relay = StreamRelay(args.url)
+    relay.start()
+
+    # `kill -USR1 <pid>` profiles the capture and detector threads (and any
+    # viewer handlers) without interrupting viewers
+    install_profiler()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(relay))
+    server.daemon_threads = True
+    print(f"Relaying on http://{args.host}:{args.port}/stream (raw) and /annotated")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        relay.stop()
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
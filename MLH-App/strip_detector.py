@@ -0,0 +1,141 @@
+import cv2
+import numpy as np
+
+# ==========================================
+# DEFAULT THRESHOLDS (same as test7.py)
+# ==========================================
+MIN_AREA = 300          # contour area in px
+MIN_ASPECT = 1.5        # long side / short side
+MIN_SOLIDITY = 0.7      # contour area / rotated rect area
+
+# One row per strip. angle is the direction of the long side in image
+# coordinates, 0-180 deg; box holds the 4 rotated-rect corners.
+STRIP_DTYPE = np.dtype([
+    ("cx", np.float32), ("cy", np.float32),
+    ("length", np.float32), ("width", np.float32),
+    ("angle", np.float32),
+    ("area", np.float32), ("aspect", np.float32), ("solidity", np.float32),
+    ("box", np.float32, (4, 2)),
+])
+
+def _segments(lengths):
+    starts = np.zeros(len(lengths), dtype=np.intp)
+    np.cumsum(lengths[:-1], out=starts[1:])
+    return starts
+
+def contour_areas(points, lengths):
+    """Shoelace area of every contour at once (same result as cv2.contourArea)."""
+    starts = _segments(lengths)
+    nxt = np.arange(1, len(points) + 1)
+    nxt[starts + lengths - 1] = starts          # close each polygon
+    x, y = points[:, 0], points[:, 1]
+    cross = x * y[nxt] - x[nxt] * y
+    return np.abs(np.add.reduceat(cross, starts)) * 0.5
+
+def classify_strips(contours, min_area=MIN_AREA, min_aspect=MIN_ASPECT,
+                    min_solidity=MIN_SOLIDITY):
+    """
+    Rotated-rect geometry (same rectangle as cv2.minAreaRect) and strip test
+    for a whole list of contours in a few NumPy passes. Returns a
+    STRIP_DTYPE array of the contours that pass.
+    """
+    if len(contours) == 0:
+        return np.zeros(0, dtype=STRIP_DTYPE)
+
+    lengths = np.fromiter((len(c) for c in contours), dtype=np.intp, count=len(contours))
+    points = np.concatenate(contours).reshape(-1, 2).astype(np.float64)
+
+    # 1. Area filter first: most clutter is small specks
+    areas = contour_areas(points, lengths)
+    keep = areas > min_area
+    if not keep.any():
+        return np.zeros(0, dtype=STRIP_DTYPE)
+    areas = areas[keep]
+
+    # 2. Convex hulls, centred on their mean for numerical stability.
+    # The minimum-area rectangle has a side on one of the hull's edges.
+    hulls = [cv2.convexHull(c).reshape(-1, 2) for c, k in zip(contours, keep) if k]
+    lengths = np.fromiter((len(h) for h in hulls), dtype=np.intp, count=len(hulls))
+    hull = np.concatenate(hulls).astype(np.float64)
+    starts = _segments(lengths)
+    owner = np.repeat(np.arange(len(lengths)), lengths)
+    means = np.add.reduceat(hull, starts, axis=0) / lengths[:, None]
+    local = hull - means[owner]
+
+    # 3. Unit direction of every hull edge (rotating calipers)
+    pos = np.arange(len(hull)) - starts[owner]
+    nxt = starts[owner] + (pos + 1) % lengths[owner]
+    edge = local[nxt] - local
+    norm = np.hypot(edge[:, 0], edge[:, 1])
+    flat = norm == 0                                  # single-point hull
+    edge[flat] = (1.0, 0.0)
+    norm[flat] = 1.0
+    cos_e, sin_e = edge[:, 0] / norm, edge[:, 1] / norm
+
+    # 4. Project each contour's hull onto each of its own edge directions:
+    # pair every edge with every hull point of the same contour
+    counts = lengths[owner]                           # points to project per edge
+    pair_starts = _segments(counts)
+    pair_edge = np.repeat(np.arange(len(hull)), counts)
+    pair_point = starts[owner][pair_edge] + np.arange(counts.sum()) - pair_starts[pair_edge]
+    px, py = local[pair_point, 0], local[pair_point, 1]
+    u = px * cos_e[pair_edge] + py * sin_e[pair_edge]
+    v = py * cos_e[pair_edge] - px * sin_e[pair_edge]
+    u_min, u_max = np.minimum.reduceat(u, pair_starts), np.maximum.reduceat(u, pair_starts)
+    v_min, v_max = np.minimum.reduceat(v, pair_starts), np.maximum.reduceat(v, pair_starts)
+    du, dv = u_max - u_min, v_max - v_min             # per edge
+
+    # 5. Minimum-area edge per contour: sort edges by (contour, area), take each contour's first
+    best = np.lexsort((du * dv, owner))[starts]
+    du, dv = du[best], dv[best]
+    uc = (u_min[best] + u_max[best]) * 0.5
+    vc = (v_min[best] + v_max[best]) * 0.5
+    c, s = cos_e[best], sin_e[best]
+    t = np.arctan2(s, c)
+    cx = means[:, 0] + uc * c - vc * s
+    cy = means[:, 1] + uc * s + vc * c
+
+    # 6. Long side defines the strip orientation
+    swap = dv > du
+    length = np.where(swap, dv, du)
+    width = np.where(swap, du, dv)
+    angle = np.mod(np.where(swap, t + np.pi / 2, t), np.pi)
+
+    rect_area = length * width
+    aspect = np.divide(length, width, out=np.zeros_like(length), where=width > 0)
+    solidity = np.divide(areas, rect_area, out=np.zeros_like(areas), where=rect_area > 0)
+
+    ok = (aspect > min_aspect) & (solidity > min_solidity)
+    n = int(ok.sum())
+    out = np.zeros(n, dtype=STRIP_DTYPE)
+    if n == 0:
+        return out
+
+    cx, cy, length, width, angle = cx[ok], cy[ok], length[ok], width[ok], angle[ok]
+    out["cx"], out["cy"] = cx, cy
+    out["length"], out["width"] = length, width
+    out["angle"] = np.degrees(angle)
+    out["area"], out["aspect"], out["solidity"] = areas[ok], aspect[ok], solidity[ok]
+
+    # Corners: centre +/- half length along the axis, +/- half width across it
+    ax = np.stack([np.cos(angle), np.sin(angle)], axis=1) * (length / 2)[:, None]
+    ay = np.stack([-np.sin(angle), np.cos(angle)], axis=1) * (width / 2)[:, None]
+    center = np.stack([cx, cy], axis=1)
+    out["box"] = np.stack([center - ax + ay, center - ax - ay,
+                           center + ax - ay, center + ax + ay], axis=1)
+    return out
+
+def detect_strips(mask, min_area=MIN_AREA, min_aspect=MIN_ASPECT,
+                  min_solidity=MIN_SOLIDITY):
+    """Find strips in a binary mask. Only external contours are extracted."""
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return classify_strips(contours, min_area, min_aspect, min_solidity)
+
+def draw_strips(frame, strips, color=(0, 255, 0)):
+    if len(strips) == 0:
+        return frame
+    cv2.polylines(frame, list(np.int32(strips["box"])), True, color, 2)
+    for s in strips:
+        cv2.putText(frame, f"Strip | AR:{s['aspect']:.1f}", (int(s["cx"]), int(s["cy"])),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+    return frame
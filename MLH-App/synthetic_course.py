@@ -0,0 +1,400 @@
+import cv2
+import numpy as np
+import os
+import sys
+import argparse
+import time
+import concurrent.futures
+
+from mlh_color_detector import COLORS, MIN_AREA, detect_objects_with_angle, check_pyramid
+
+# ==========================================
+# CONFIGURATION
+# ==========================================
+FRAME_W, FRAME_H = 400, 300
+
+# Label ids in the ground-truth class map
+CLASS_IDS = {"floor": 0, "lane": 1, "strip": 2, "box": 3, "cube": 4}
+
+# What can show up in a frame (min, max counts)
+N_LANES = (0, 2)
+N_STRIPS = (1, 4)
+N_BOXES = (0, 2)
+N_CUBES = (0, 1)
+
+# Object sizes in px (length, width)
+STRIP_LENGTH = (70, 170)
+STRIP_WIDTH = (14, 26)
+BOX_SIZE = (40, 70)
+CUBE_SIZE = (34, 50)
+
+# Which palette colours boxes and cubes use (test5: blue boxes, test3: yellow cube)
+BOX_COLOR = "Blue"
+CUBE_COLOR = "Yellow"
+
+# Image degradations
+GAIN = (0.75, 1.2)
+OFFSET = (-20, 20)
+BLUR_KSIZES = (1, 3, 5)
+JPEG_QUALITY = (40, 95)
+
+# Precomputed floor textures / lighting gradients to pick from
+TEXTURE_BANK = 8
+
+# Frames per task when rendering across a process pool
+CHUNK_FRAMES = 64
+
+def _palette(rng, ranges, n=32):
+    """n BGR colours sampled from the inner part of a colour's HSV ranges."""
+    hsv = np.zeros((1, n, 3), dtype=np.uint8)
+    for i in range(n):
+        lower, upper = ranges[rng.integers(len(ranges))]
+        lo = lower + (upper - lower) * 0.2
+        hi = lower + (upper - lower) * 0.8
+        hsv[0, i] = rng.uniform(lo, hi)
+    return cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)[0]
+
+def rect_corners(cx, cy, length, width, angle_deg):
+    """Corners of a rotated rect whose long side points along angle_deg."""
+    a = np.radians(angle_deg)
+    ax = np.array([np.cos(a), np.sin(a)]) * length / 2
+    ay = np.array([-np.sin(a), np.cos(a)]) * width / 2
+    c = np.array([cx, cy])
+    return np.array([c - ax + ay, c - ax - ay, c + ax - ay, c + ax + ay])
+
+class CourseRenderer:
+    """
+    Renders random course frames (floor, lane lines, taped strips, boxes and
+    cubes) with exact ground truth. Textures and lighting gradients are
+    built once, so a frame is a handful of fillPoly calls plus the
+    blur/JPEG degradation: roughly 450 frames/s on one core with JPEG,
+    twice that without. parallel_frames() and benchmark(workers=N) scale
+    that across cores; the benchmark renders and detects inside the
+    workers, so thousands of frames/s only takes a handful of cores.
+    """
+
+    def __init__(self, w=FRAME_W, h=FRAME_H, seed=None, jpeg=True, strip_width=STRIP_WIDTH,
+                 strip_length=STRIP_LENGTH):
+        self.w, self.h = w, h
+        self.jpeg = jpeg
+        self.strip_width = strip_width
+        self.strip_length = strip_length
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.palettes = {name: _palette(self.rng, ranges) for name, ranges in COLORS.items()}
+
+        # Floor: low-saturation grey/tan with sensor-like noise
+        self.floors = []
+        for _ in range(TEXTURE_BANK):
+            base = self.rng.uniform(70, 150) + self.rng.uniform(-10, 10, size=3)
+            noise = self.rng.normal(0, 6, size=(h, w, 3))
+            self.floors.append(np.clip(base + noise, 0, 255).astype(np.uint8))
+
+        # Lighting: brighter on one side (lamp / window)
+        xs = np.linspace(-1, 1, w)[None, :]
+        ys = np.linspace(-1, 1, h)[:, None]
+        self.gradients = []
+        for _ in range(TEXTURE_BANK):
+            gx, gy = self.rng.uniform(-25, 25, size=2)
+            grad = np.clip(xs * gx + ys * gy + 128, 0, 255).astype(np.uint8)
+            self.gradients.append(cv2.merge([grad, grad, grad]))
+
+    def _free(self, placed, cx, cy, r):
+        for (px, py, pr) in placed:
+            if (px - cx) ** 2 + (py - cy) ** 2 < (pr + r) ** 2:
+                return False
+        return True
+
+    def _place(self, placed, radius, tries=20):
+        for _ in range(tries):
+            cx = self.rng.uniform(radius, self.w - radius)
+            cy = self.rng.uniform(radius, self.h - radius)
+            if self._free(placed, cx, cy, radius):
+                placed.append((cx, cy, radius))
+                return cx, cy
+        return None
+
+    def _fill(self, frame, labels, instances, pts, color, class_id, inst_id):
+        # Sub-pixel corners via shift=4 so the masks match the geometry exactly
+        poly = [np.round(pts * 16).astype(np.int32)]
+        cv2.fillPoly(frame, poly, tuple(int(c) for c in color), cv2.LINE_8, shift=4)
+        cv2.fillPoly(labels, poly, class_id, cv2.LINE_8, shift=4)
+        cv2.fillPoly(instances, poly, inst_id, cv2.LINE_8, shift=4)
+
+    def render(self):
+        """Returns (frame, truth). truth has 'labels', 'instances' and 'objects'."""
+        rng = self.rng
+        frame = self.floors[rng.integers(TEXTURE_BANK)].copy()
+        labels = np.zeros((self.h, self.w), dtype=np.uint8)
+        instances = np.zeros((self.h, self.w), dtype=np.uint16)
+        objects = []
+        placed = []
+        occluded = set()
+
+        # 1. Lane lines: white quadratic curves across the floor (may be crossed by tape)
+        for _ in range(rng.integers(N_LANES[0], N_LANES[1] + 1)):
+            x0 = rng.uniform(0.2, 0.8) * self.w
+            bend = rng.uniform(-0.3, 0.3) * self.w
+            ys = np.linspace(self.h, 0, 12)
+            t = 1 - ys / self.h
+            xs = x0 + bend * t * t
+            pts = np.round(np.stack([xs, ys], axis=1) * 16).astype(np.int32)
+            thickness = int(rng.integers(6, 11))
+            inst_id = len(objects) + 1
+            white = int(rng.uniform(225, 255))
+            cv2.polylines(frame, [pts], False, (white, white, white), thickness, cv2.LINE_8, shift=4)
+            cv2.polylines(labels, [pts], False, CLASS_IDS["lane"], thickness, cv2.LINE_8, shift=4)
+            cv2.polylines(instances, [pts], False, inst_id, thickness, cv2.LINE_8, shift=4)
+            objects.append({"id": inst_id, "kind": "lane", "color": "White",
+                            "points": np.stack([xs, ys], axis=1)})
+
+        # 2. Taped strips, boxes and cubes (non-overlapping so truth stays exact)
+        specs = []
+        specs += [("strip", None)] * int(rng.integers(N_STRIPS[0], N_STRIPS[1] + 1))
+        specs += [("box", BOX_COLOR)] * int(rng.integers(N_BOXES[0], N_BOXES[1] + 1))
+        specs += [("cube", CUBE_COLOR)] * int(rng.integers(N_CUBES[0], N_CUBES[1] + 1))
+
+        for kind, color in specs:
+            if kind == "strip":
+                color = list(COLORS.keys())[rng.integers(len(COLORS))]
+                length, width = rng.uniform(*self.strip_length), rng.uniform(*self.strip_width)
+            elif kind == "box":
+                length, width = rng.uniform(*BOX_SIZE), rng.uniform(*BOX_SIZE)
+                length, width = max(length, width), min(length, width)
+            else:
+                length = width = rng.uniform(*CUBE_SIZE)
+            angle = rng.uniform(0, 180)
+
+            pos = self._place(placed, np.hypot(length, width) / 2 + 4)
+            if pos is None:
+                continue
+            cx, cy = pos
+            pts = rect_corners(cx, cy, length, width, angle)
+            inst_id = len(objects) + 1
+
+            if kind != "strip":
+                # Drop shadow: it covers whatever was there (lane, an earlier
+                # object), so those pixels become floor in the ground truth too
+                shadow = [np.round((pts + [4, 5]) * 16).astype(np.int32)]
+                x0, y0 = np.maximum(np.floor((pts + [4, 5]).min(axis=0)).astype(int), 0)
+                x1, y1 = np.ceil((pts + [4, 5]).max(axis=0)).astype(int) + 1
+                under = instances[y0:y1, x0:x1].copy()
+                cv2.fillPoly(frame, shadow, (30, 30, 30), cv2.LINE_8, shift=4)
+                cv2.fillPoly(labels, shadow, CLASS_IDS["floor"], cv2.LINE_8, shift=4)
+                cv2.fillPoly(instances, shadow, 0, cv2.LINE_8, shift=4)
+                occluded.update(np.unique(under[(instances[y0:y1, x0:x1] == 0) & (under != 0)]).tolist())
+
+            bgr = self.palettes[color][rng.integers(len(self.palettes[color]))]
+            self._fill(frame, labels, instances, pts, bgr, CLASS_IDS[kind], inst_id)
+            objects.append({
+                "id": inst_id, "kind": kind, "color": color,
+                "center": (cx, cy), "length": length, "width": width,
+                # A square has no orientation
+                "angle": None if kind == "cube" else angle,
+                "area": length * width, "box": pts,
+            })
+
+        # Objects a shadow cut into: centre and area of what is still visible
+        for obj in objects:
+            if obj["id"] in occluded:
+                ys, xs = np.nonzero(instances == obj["id"])
+                obj["occluded"] = True
+                obj["area"] = float(len(xs))
+                if "center" in obj and len(xs):
+                    obj["center"] = (float(xs.mean()), float(ys.mean()))
+
+        # 3. Lighting, blur, compression
+        gain = rng.uniform(*GAIN)
+        offset = rng.uniform(*OFFSET)
+        grad = self.gradients[rng.integers(TEXTURE_BANK)]
+        frame = cv2.addWeighted(frame, gain, grad, 1.0, offset - 128)
+
+        k = int(BLUR_KSIZES[rng.integers(len(BLUR_KSIZES))])
+        if k > 1:
+            frame = cv2.GaussianBlur(frame, (k, k), 0)
+
+        if self.jpeg:
+            quality = int(rng.integers(JPEG_QUALITY[0], JPEG_QUALITY[1] + 1))
+            ok, enc = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+            frame = cv2.imdecode(enc, cv2.IMREAD_COLOR)
+
+        return frame, {"labels": labels, "instances": instances, "objects": objects}
+
+    def frames(self, n):
+        for _ in range(n):
+            yield self.render()
+
+# ==========================================
+# PROCESS POOL
+# ==========================================
+_renderer = None
+
+def _init_render_worker(seed, kwargs):
+    # Textures/palettes come from the shared seed, so every worker renders the same course
+    global _renderer
+    cv2.setNumThreads(1)
+    _renderer = CourseRenderer(seed=seed, **kwargs)
+
+def _start_chunk(renderer, chunk):
+    # Each chunk has its own random stream: frames depend on the seed, not on the worker count
+    renderer.rng = np.random.default_rng([renderer.seed, chunk])
+
+def _render_chunk(chunk, n, renderer=None):
+    renderer = renderer or _renderer
+    _start_chunk(renderer, chunk)
+    return [renderer.render() for _ in range(n)]
+
+def _chunks(n):
+    return [(i, min(CHUNK_FRAMES, n - i * CHUNK_FRAMES)) for i in range((n + CHUNK_FRAMES - 1) // CHUNK_FRAMES)]
+
+def parallel_frames(n, seed=0, workers=None, **kwargs):
+    """
+    n (frame, truth) pairs rendered in CHUNK_FRAMES tasks across a process
+    pool, in order. workers=1 renders the same frames in this process.
+    """
+    chunks = _chunks(n)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        renderer = CourseRenderer(seed=seed, **kwargs)
+        for chunk, k in chunks:
+            yield from _render_chunk(chunk, k, renderer)
+        return
+    if not chunks:
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_render_worker,
+                                                initargs=(seed, kwargs)) as executor:
+        for frames in executor.map(_render_chunk, *zip(*chunks)):
+            yield from frames
+
+# ==========================================
+# BENCHMARK
+# ==========================================
+def angle_error(a, b):
+    d = abs(a - b) % 180
+    return min(d, 180 - d)
+
+def match_frame(objects, detections, center_tol):
+    """Greedy colour + distance matching. Returns (matches, n_expected, n_detected)."""
+    expected = [o for o in objects if o["kind"] != "lane" and o["area"] >= MIN_AREA]
+    unused = list(detections)
+    matches = []
+    for obj in expected:
+        best, best_d = None, center_tol
+        for det in unused:
+            if det["color"] != obj["color"]: continue
+            d = np.hypot(det["center"][0] - obj["center"][0], det["center"][1] - obj["center"][1])
+            if d <= best_d:
+                best, best_d = det, d
+        if best is not None:
+            unused.remove(best)
+            matches.append((obj, best, best_d))
+    return matches, len(expected), len(detections)
+
+def _benchmark_frames(renderer, n, pyramid, center_tol):
+    """Render, detect and match n frames. Returns summable stats."""
+    stats = {"render_s": 0.0, "detect_s": 0.0, "tp": 0, "expected": 0, "detected": 0,
+             "center_err": [], "angle_err": []}
+    for _ in range(n):
+        t0 = time.perf_counter()
+        frame, truth = renderer.render()
+        t1 = time.perf_counter()
+        _, dets = detect_objects_with_angle(frame, pyramid=pyramid)
+        t2 = time.perf_counter()
+        stats["render_s"] += t1 - t0
+        stats["detect_s"] += t2 - t1
+
+        matches, n_exp, n_det = match_frame(truth["objects"], dets, center_tol)
+        stats["tp"] += len(matches)
+        stats["expected"] += n_exp
+        stats["detected"] += n_det
+        for obj, det, d in matches:
+            stats["center_err"].append(d)
+            if obj["angle"] is not None:
+                stats["angle_err"].append(angle_error(obj["angle"], det["angle"]))
+    return stats
+
+def _benchmark_chunk(chunk, n, pyramid, center_tol, renderer=None):
+    renderer = renderer or _renderer
+    _start_chunk(renderer, chunk)
+    return _benchmark_frames(renderer, n, pyramid, center_tol)
+
+def benchmark(n=1000, seed=0, pyramid=False, jpeg=True, center_tol=8.0, workers=1):
+    """
+    Throughput and accuracy of detect_objects_with_angle on synthetic frames.
+    With workers > 1 each process renders and checks its own chunks, so no
+    frames cross process boundaries; render/detect fps stay per core and
+    total_fps is the whole pool's.
+    """
+    start = time.perf_counter()
+    chunks = _chunks(n)
+    if workers > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_render_worker,
+                                                    initargs=(seed, {"jpeg": jpeg})) as executor:
+            parts = list(executor.map(_benchmark_chunk, *zip(*chunks), [pyramid] * len(chunks),
+                                      [center_tol] * len(chunks)))
+    else:
+        renderer = CourseRenderer(seed=seed, jpeg=jpeg)
+        parts = [_benchmark_chunk(chunk, k, pyramid, center_tol, renderer) for chunk, k in chunks]
+    wall_s = time.perf_counter() - start
+
+    stats = {k: sum((p[k] for p in parts), [] if isinstance(v, list) else 0) for k, v in parts[0].items()}
+    report = {
+        "frames": n,
+        "workers": workers,
+        "render_fps": n / stats["render_s"],
+        "detect_fps": n / stats["detect_s"],
+        "total_fps": n / wall_s,
+        "recall": stats["tp"] / stats["expected"] if stats["expected"] else 1.0,
+        "precision": stats["tp"] / stats["detected"] if stats["detected"] else 1.0,
+        "center_err_px": float(np.mean(stats["center_err"])) if stats["center_err"] else 0.0,
+        "angle_err_deg": float(np.median(stats["angle_err"])) if stats["angle_err"] else 0.0,
+    }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic course frames for detector benchmarking")
+    parser.add_argument("-n", type=int, default=1000, help="number of frames")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pyramid", action="store_true", help="benchmark the coarse-to-fine mode")
+    parser.add_argument("--no-jpeg", action="store_true", help="skip JPEG compression")
+    parser.add_argument("--show", action="store_true", help="preview frames instead of benchmarking")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="render (and detect) across this many processes; 0 = one per core")
+    parser.add_argument("--check-pyramid", action="store_true",
+                        help="fail if the coarse-to-fine mode misses or moves any full-resolution detection")
+    parser.add_argument("--strip-width", type=float, nargs=2, default=STRIP_WIDTH, metavar=("MIN", "MAX"))
+    parser.add_argument("--strip-length", type=float, nargs=2, default=STRIP_LENGTH, metavar=("MIN", "MAX"))
+    args = parser.parse_args()
+    workers = args.workers or os.cpu_count() or 1
+
+    if args.check_pyramid:
+        render_args = {"jpeg": not args.no_jpeg, "strip_width": args.strip_width, "strip_length": args.strip_length}
+        frames = parallel_frames(args.n, args.seed, workers, **render_args)
+        checked, failures = check_pyramid(frame for frame, _ in frames)
+        for i, det in failures[:20]:
+            print(f"frame {i}: pyramid missed {det['color']} at ({det['center'][0]:.0f}, "
+                  f"{det['center'][1]:.0f}) {det['angle']:.0f}deg")
+        print(f"Pyramid check: {checked - len(failures)}/{checked} detections within tolerance")
+        return 1 if failures else 0
+
+    if args.show:
+        renderer = CourseRenderer(seed=args.seed, jpeg=not args.no_jpeg)
+        for frame, truth in renderer.frames(args.n):
+            cv2.imshow("Synthetic Frame", frame)
+            cv2.imshow("Ground Truth", truth["labels"] * (255 // max(CLASS_IDS.values())))
+            if cv2.waitKey(0) & 0xFF == ord('q'): break
+        cv2.destroyAllWindows()
+        return
+
+    report = benchmark(args.n, args.seed, args.pyramid, not args.no_jpeg, workers=workers)
+    print(f"Frames:      {report['frames']} ({report['workers']} workers)")
+    print(f"Render:      {report['render_fps']:.0f} fps per core")
+    print(f"Detect:      {report['detect_fps']:.0f} fps per core")
+    print(f"Total:       {report['total_fps']:.0f} fps (render + detect, all workers)")
+    print(f"Recall:      {report['recall']:.3f}")
+    print(f"Precision:   {report['precision']:.3f}")
+    print(f"Center err:  {report['center_err_px']:.2f} px (mean)")
+    print(f"Angle err:   {report['angle_err_deg']:.2f} deg (median)")
+
+if __name__ == "__main__":
+    sys.exit(main())
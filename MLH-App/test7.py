@@ -2,8 +2,18 @@ import cv2
 import numpy as np
 import urllib.request
 
+from strip_detector import detect_strips, draw_strips
+
 # ================= USER CONFIGURATION =================
 URL = 'http://192.168.38.209:81/stream'
+
+# Criteria for a "Strip":
+# 1. Big enough to not be noise (Adjusted for smaller resolution)
+# 2. High Aspect Ratio (e.g., > 2.0) OR just "not square" (> 1.5)
+# 3. High Solidity (> 0.7) means it fills its bounding box well
+STRIP_MIN_AREA = 300
+STRIP_MIN_ASPECT = 1.5
+STRIP_MIN_SOLIDITY = 0.7
 # ======================================================
 
 def get_frame(stream):
@@ -51,43 +61,11 @@ def detect_rectangle_strip(frame):
     # Show the mask for debugging (Values usually show up as white)
     cv2.imshow("Color Mask", mask)
 
-    # 3. Find Contours
-    contours, _ = cv2.findContours(mask, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-
-    for cnt in contours:
-        area = cv2.contourArea(cnt)
-        
-        # Filter out small noise (Adjusted for smaller resolution)
-        if area > 300: 
-            
-            # Robust Rectangle Detection using MinAreaRect (handles rotation)
-            rect = cv2.minAreaRect(cnt)
-            (center, (w, h), angle) = rect
-            
-            # Organize w and h so aspect ratio is consistent
-            # Longest side / Shortest side
-            if w < h:
-                w, h = h, w
-                
-            aspect_ratio = float(w) / h if h > 0 else 0
-            
-            # Calculate Solidity to ensure it's rectangular-ish (not a C shape or blob)
-            box = cv2.boxPoints(rect)
-            box = np.int32(box)
-            box_area = cv2.contourArea(box)
-            solidity = area / box_area if box_area > 0 else 0
-            
-            # Criteria for a "Strip":
-            # 1. High Aspect Ratio (e.g., > 2.0) OR just "not square" (> 1.5)
-            # 2. High Solidity (> 0.7) means it fills its bounding box well
-            
-            if aspect_ratio > 1.5 and solidity > 0.7:
-                # Draw the rotated rectangle
-                cv2.drawContours(frame, [box], 0, (0, 255, 0), 2)
-                
-                label = f"Strip | AR:{aspect_ratio:.1f}"
-                cv2.putText(frame, label, (int(center[0]), int(center[1])), 
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+    # 3. Find Strips
+    # External contours only; rotated-rect geometry and the aspect ratio /
+    # solidity tests run for every candidate at once (see strip_detector.py)
+    strips = detect_strips(mask, STRIP_MIN_AREA, STRIP_MIN_ASPECT, STRIP_MIN_SOLIDITY)
+    draw_strips(frame, strips)
 
     return frame
 
@@ -0,0 +1,124 @@
+import os
+import time
+import threading
+import concurrent.futures
+from collections import deque
+from pathlib import Path
+
+import cv2
+
+def _read(path):
+    return path, cv2.imread(path)
+
+def prefetch_batches(paths, batch_size, decode_threads, prefetch=2):
+    """
+    Yield lists of (path, image) of up to batch_size, decoding JPEGs in a
+    thread pool ahead of the consumer (at most `prefetch` batches in flight).
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=decode_threads) as pool:
+        pending = deque()
+        it = iter(paths)
+        limit = batch_size * (prefetch + 1)
+
+        def fill():
+            while len(pending) < limit:
+                try:
+                    pending.append(pool.submit(_read, next(it)))
+                except StopIteration:
+                    return
+
+        fill()
+        while pending:
+            batch = []
+            while pending and len(batch) < batch_size:
+                path, img = pending.popleft().result()
+                if img is not None:
+                    batch.append((path, img))
+            fill()
+            if batch:
+                yield batch
+
+def format_labels(result, conf):
+    """YOLO label lines for one ultralytics result, filtered by confidence."""
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return ""
+    keep = boxes.conf.cpu().numpy() > conf
+    if not keep.any():
+        return ""
+    cls = boxes.cls.cpu().numpy()[keep].astype(int)
+    xywhn = boxes.xywhn.cpu().numpy()[keep]
+    return "".join(f"{c} {x} {y} {w} {h}\n" for c, (x, y, w, h) in zip(cls, xywhn.tolist()))
+
+def _write(path, text):
+    with open(path, "w") as f:
+        f.write(text)
+
+def format_detections(det, shape, conf):
+    """YOLO label lines for one inference daemon reply ({"cls", "conf", "boxes"} in xyxy pixels)."""
+    h, w = shape[:2]
+    lines = []
+    for c, p, (x1, y1, x2, y2) in zip(det["cls"], det["conf"], det["boxes"]):
+        if p > conf:
+            lines.append(f"{c} {(x1 + x2) / 2 / w} {(y1 + y2) / 2 / h} {(x2 - x1) / w} {(y2 - y1) / h}\n")
+    return "".join(lines)
+
+def _label_batches(images, labels_dir, batch_size, decode_threads, infer):
+    """Run infer(list of images) -> list of label texts over prefetched batches, writing in the background."""
+    start = time.time()
+    done = 0
+    writes = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as writer:
+        for batch in prefetch_batches(images, batch_size, decode_threads):
+            paths = [p for p, _ in batch]
+            for path, text in zip(paths, infer([img for _, img in batch])):
+                label_path = os.path.join(labels_dir, f"{Path(path).stem}.txt")
+                writes.append(writer.submit(_write, label_path, text))
+            done += len(batch)
+
+            # Surface write errors early and keep the list short
+            while writes and writes[0].done():
+                writes.pop(0).result()
+
+        for w in writes:
+            w.result()
+
+    elapsed = time.time() - start
+    rate = done / elapsed if elapsed > 0 else 0.0
+    return done, rate
+
+def batch_label(model, images, labels_dir, batch_size=16, decode_threads=4, conf=0.4):
+    """
+    Label images with a YOLO model: JPEGs are decoded in background threads,
+    inference runs on whole batches, and label files are written by a
+    separate writer thread. Returns (images labeled, images/s).
+    """
+    def infer(imgs):
+        results = model.predict(imgs, verbose=False, device='cpu', conf=conf, batch=len(imgs))
+        return [format_labels(r, conf) for r in results]
+
+    return _label_batches(images, labels_dir, batch_size, decode_threads, infer)
+
+def batch_label_remote(images, labels_dir, batch_size=16, decode_threads=4, conf=0.4, **client_args):
+    """
+    batch_label() through the inference daemon (inference_server.py) instead
+    of a model in this process. Each batch goes out as concurrent requests,
+    one client per thread, which the daemon coalesces into one predict().
+    """
+    from inference_server import InferenceClient
+    local = threading.local()
+    clients = []
+
+    def predict(img):
+        if not hasattr(local, "client"):
+            local.client = InferenceClient(**client_args)
+            clients.append(local.client)
+        return format_detections(local.client.predict(img), img.shape, conf)
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=batch_size) as pool:
+            return _label_batches(images, labels_dir, batch_size, decode_threads,
+                                  lambda imgs: list(pool.map(predict, imgs)))
+    finally:
+        for client in clients:
+            client.close()
@@ -0,0 +1,151 @@
+import os
+import json
+
+# Each pipeline stage gets a core budget instead of every library sizing its
+# own thread pool to the whole machine:
+#   procs    worker processes (extraction / HSV labeling pools)
+#   threads  OpenCV + torch intra-op threads per process
+#   interop  torch inter-op threads
+#   loader   training DataLoader worker processes
+#   io       JPEG decode / hashing threads
+
+def available_cpus():
+    """Cores this process may run on (affinity/cgroup aware where the OS tells us)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def default_budgets(n, labeler="hsv"):
+    half = max(1, n // 2)
+    io = max(1, n // 4)
+    budgets = {
+        "extract": {"procs": n, "threads": 1},
+        "decode_cache": {"procs": 1, "threads": 1, "io": n},
+        # Ultralytics trains on CPU in the main process; augmentation workers steal from torch
+        "train": {"procs": 1, "threads": max(1, n - io), "interop": 1, "loader": io},
+        "export": {"procs": 1, "threads": n, "interop": 1},
+        # predict.py: whole videos per process, a couple of torch threads each
+        "predict": {"procs": half, "threads": max(1, n // half), "interop": 1},
+    }
+    if labeler == "hsv":
+        budgets["label"] = {"procs": n, "threads": 1}
+        budgets["stream_label"] = {"procs": half, "threads": 1}
+    else:
+        budgets["label"] = {"procs": 1, "threads": max(1, n - io), "interop": 1, "io": io}
+        budgets["stream_label"] = {"procs": 1, "threads": half, "interop": 1, "io": 1}
+    budgets["stream_extract"] = {"procs": max(1, n - half), "threads": 1}
+    return budgets
+
+def candidate_budgets(stage, n, base):
+    """Settings GOVERNOR=auto tries for a stage (the default first)."""
+    out = [base]
+    if stage in ("extract", "label") and base.get("procs", 1) > 1:
+        for procs in sorted({max(1, n * 3 // 4), max(1, n // 2)}, reverse=True):
+            out.append(dict(base, procs=procs))
+    elif stage in ("label", "train", "export"):
+        for threads in sorted({n, max(1, n // 2)}, reverse=True):
+            out.append(dict(base, threads=threads))
+    unique = []
+    for b in out:
+        if b not in unique:
+            unique.append(b)
+    return unique
+
+def _key(budget):
+    return ",".join(f"{k}={budget[k]}" for k in sorted(budget))
+
+# Rate in the perf report that GOVERNOR=auto maximises for each stage
+STAGE_METRIC = {
+    "extract": "frames_scanned_per_s",
+    "label": "labels_per_s",
+    "train": "images_per_s",
+    "decode_cache": "frames_per_s",
+    "export": "models_per_s",
+}
+
+class CpuGovernor:
+    """
+    Hands out per-stage budgets and applies them to OpenCV/torch in this
+    process. mode="fixed" uses default_budgets(); mode="auto" tries each
+    stage's candidate budgets on successive runs (one untried candidate per
+    run), then sticks with the one that had the best measured throughput.
+    """
+
+    def __init__(self, mode="fixed", cpus=None, labeler="hsv", state_path=None):
+        self.mode = mode
+        self.cpus = cpus or available_cpus()
+        self.state_path = state_path
+        self.base = default_budgets(self.cpus, labeler)
+        self.state = {}
+        if state_path and os.path.exists(state_path):
+            with open(state_path) as f:
+                self.state = json.load(f)
+        self.chosen = {}
+
+    def budget(self, stage):
+        if stage in self.chosen:
+            return self.chosen[stage]
+        base = self.base.get(stage, {"procs": 1, "threads": self.cpus, "interop": 1})
+        choice = base
+        if self.mode == "auto" and stage in STAGE_METRIC:
+            seen = self.state.get(stage, {})
+            candidates = candidate_budgets(stage, self.cpus, base)
+            untried = [c for c in candidates if _key(c) not in seen]
+            if untried:
+                choice = untried[0]
+            else:
+                choice = max(candidates, key=lambda c: seen[_key(c)])
+        self.chosen[stage] = choice
+        return choice
+
+    def apply(self, stage):
+        """Size OpenCV and torch thread pools in this process for a stage; returns its budget."""
+        b = self.budget(stage)
+        threads = b.get("threads", 1)
+        # Read by OpenMP/BLAS in worker processes started from here on
+        for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+            os.environ[var] = str(threads)
+        # VideoCapture's FFmpeg decoder otherwise starts one thread per core per capture
+        os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = f"threads;{threads}"
+        try:
+            import cv2
+            cv2.setNumThreads(threads)
+        except ImportError:
+            pass
+        try:
+            import torch
+            torch.set_num_threads(threads)
+            try:
+                torch.set_num_interop_threads(b.get("interop", 1))
+            except RuntimeError:
+                pass  # can only be set once, before torch starts parallel work
+        except ImportError:
+            pass
+        return b
+
+    def learn(self, stages):
+        """Record each stage's throughput under the budget it ran with (perf report 'stages')."""
+        if not self.state_path:
+            return
+        for stage, budget in self.chosen.items():
+            rec = stages.get(stage)
+            metric = STAGE_METRIC.get(stage)
+            if not rec or rec.get("skipped") or rec.get("failed") or metric not in rec.get("rates", {}):
+                continue
+            # A stage that had nothing to do (every label cached, no export
+            # this run) says nothing about the budget; don't average it in
+            rate = rec["rates"][metric]
+            if not rate or not rec.get("items", {}).get(metric[:-len("_per_s")]):
+                continue
+            runs = self.state.setdefault(stage, {})
+            old = runs.get(_key(budget))
+            # Smooth so one noisy night doesn't decide it (0 = left by an idle run before this check)
+            runs[_key(budget)] = rate if not old else 0.5 * old + 0.5 * rate
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp, self.state_path)
+
+    def summary(self):
+        return {stage: _key(b) for stage, b in self.chosen.items()}
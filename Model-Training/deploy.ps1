@@ -7,6 +7,9 @@ Write-Host "Deploying to $DROPLET_IP..."
 # Copy Files
 scp -r . "$REMOTE_USER@${DROPLET_IP}:~/Model-Training"
 
+# HSV labeler reuses the MLH-App colour/strip detectors
+scp -r ../MLH-App "$REMOTE_USER@${DROPLET_IP}:~/MLH-App"
+
 # Copy Env
 scp ../Web-App/.env.local "$REMOTE_USER@${DROPLET_IP}:~/Model-Training/.env"
 
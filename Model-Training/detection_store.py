@@ -0,0 +1,105 @@
+import os
+import sys
+import json
+
+import numpy as np
+
+# Detection store layout (one directory):
+#   index.npy    one row per video (see VIDEO_DTYPE): its slice of the columns
+#   frame.npy    uint32 frame index in the video   \
+#   time.npy     float32 seconds into the video     |
+#   cls.npy      int16 class                        |- one row per detection,
+#   conf.npy     float32 confidence                 |  sorted by video, frame
+#   boxes.npy    float32 (n, 4) xyxy pixels        /
+#   meta.json    model, class names
+COLUMNS = ("frame", "time", "cls", "conf", "boxes")
+
+VIDEO_DTYPE = np.dtype([
+    ("name", "U96"),
+    ("start", "<u8"),
+    ("count", "<u4"),
+    ("frames", "<u4"),
+    ("fps", "<f4"),
+    ("width", "<u2"),
+    ("height", "<u2"),
+])
+
+def empty_columns():
+    return {
+        "frame": np.zeros(0, np.uint32),
+        "time": np.zeros(0, np.float32),
+        "cls": np.zeros(0, np.int16),
+        "conf": np.zeros(0, np.float32),
+        "boxes": np.zeros((0, 4), np.float32),
+    }
+
+def _save_atomic(path, arr):
+    tmp = path + ".tmp.npy"
+    np.save(tmp, arr)
+    os.replace(tmp, path)
+
+def write_detections(root, videos, meta):
+    """
+    videos: [(info, columns)] with info = {"name", "frames", "fps", "width",
+    "height"} and columns as in empty_columns(). Replaces the store; the
+    index is written last, so readers never see it point past the columns.
+    """
+    os.makedirs(root, exist_ok=True)
+    index = np.zeros(len(videos), VIDEO_DTYPE)
+    start = 0
+    for row, (info, cols) in zip(index, videos):
+        n = len(cols["cls"])
+        row["name"], row["start"], row["count"] = info["name"], start, n
+        row["frames"], row["fps"] = info["frames"], info["fps"]
+        row["width"], row["height"] = info["width"], info["height"]
+        start += n
+    for col in COLUMNS:
+        parts = [cols[col] for _, cols in videos] or [empty_columns()[col]]
+        _save_atomic(os.path.join(root, f"{col}.npy"), np.concatenate(parts))
+    with open(os.path.join(root, "meta.json.tmp"), "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(os.path.join(root, "meta.json.tmp"), os.path.join(root, "meta.json"))
+    _save_atomic(os.path.join(root, "index.npy"), index)
+
+class DetectionStore:
+    """Read side: columns are memory-mapped, a video's detections are one slice."""
+
+    def __init__(self, root):
+        self.root = root
+        self.index = np.load(os.path.join(root, "index.npy"), mmap_mode="r")
+        self.cols = {c: np.load(os.path.join(root, f"{c}.npy"), mmap_mode="r") for c in COLUMNS}
+        with open(os.path.join(root, "meta.json")) as f:
+            self.meta = json.load(f)
+        self._rows = {n: i for i, n in enumerate(self.index["name"].tolist())}
+
+    def __len__(self):
+        return len(self.cols["cls"])
+
+    def videos(self):
+        return list(self._rows)
+
+    def info(self, name):
+        r = self.index[self._rows[name]]
+        return {"name": name, "frames": int(r["frames"]), "fps": float(r["fps"]),
+                "width": int(r["width"]), "height": int(r["height"])}
+
+    def video(self, name):
+        """{column: array} of one video's detections."""
+        r = self.index[self._rows[name]]
+        s, n = int(r["start"]), int(r["count"])
+        return {c: np.asarray(a[s:s + n]) for c, a in self.cols.items()}
+
+def open_store(root):
+    return DetectionStore(root) if os.path.exists(os.path.join(root, "index.npy")) else None
+
+if __name__ == "__main__":
+    # Summarize a store: python detection_store.py [inference_demo/detections]
+    store = open_store(sys.argv[1] if len(sys.argv) > 1 else os.path.join("inference_demo", "detections"))
+    if store is None:
+        sys.exit("no detection store there")
+    names = store.meta.get("names", {})
+    print(f"{len(store)} detections in {len(store.videos())} videos ({store.meta.get('model')})")
+    for name in store.videos():
+        info, d = store.info(name), store.video(name)
+        classes = ", ".join(f"{names.get(str(c), c)} {k}" for c, k in zip(*np.unique(d["cls"], return_counts=True)))
+        print(f"  {name:40s} {info['frames']:>7d} frames {len(d['cls']):>8d} detections  {classes}")
@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import shutil
+import statistics
+from pathlib import Path
+
+import cv2
+from ultralytics import YOLO
+
+# Variant names keep the suffixes Ultralytics' AutoBackend uses to pick a runtime
+# (.onnx, .torchscript, *_openvino_model/)
+FORMATS = ("onnx", "onnx_int8", "openvino", "torchscript")
+WARMUP = 5
+
+def _export(src, fmt, imgsz, out_dir):
+    """Export src weights in one format/size, moved to a name of its own. Returns the path."""
+    if fmt == "onnx_int8":
+        fp32 = os.path.join(out_dir, f"fp32_{imgsz}.onnx")
+        if not os.path.exists(fp32):
+            fp32 = _export(src, "onnx", imgsz, out_dir)
+        return quantize_onnx(fp32, os.path.join(out_dir, f"int8_{imgsz}.onnx"))
+
+    exported = YOLO(src).export(format=fmt, imgsz=imgsz, device='cpu')
+    names = {
+        "onnx": f"fp32_{imgsz}.onnx",
+        "openvino": f"model_{imgsz}_openvino_model",
+        "torchscript": f"model_{imgsz}.torchscript",
+    }
+    dest = os.path.join(out_dir, names[fmt])
+    if os.path.isdir(dest):
+        shutil.rmtree(dest)
+    os.replace(exported, dest)
+    return dest
+
+def quantize_onnx(fp32_path, int8_path):
+    """Dynamic INT8 weight quantization, keeping the metadata Ultralytics reads back."""
+    import onnx
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QUInt8)
+    src, dst = onnx.load(fp32_path), onnx.load(int8_path)
+    del dst.metadata_props[:]
+    dst.metadata_props.extend(src.metadata_props)
+    onnx.save(dst, int8_path)
+    return int8_path
+
+def export_variants(weights, sizes, formats=FORMATS, out_dir="exports"):
+    """Every format x size that exports on this box: [{"name", "format", "imgsz", "path"}]."""
+    # Start clean so no variant of yesterday's weights is benchmarked or quantized
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+    # Exports land next to the weights, so work from a copy to keep best.onnx etc. untouched
+    src = os.path.join(out_dir, "src.pt")
+    shutil.copyfile(weights, src)
+
+    variants = []
+    for imgsz in sizes:
+        for fmt in formats:
+            try:
+                path = _export(src, fmt, imgsz, out_dir)
+            except Exception as e:
+                # Missing optional runtime (openvino, onnxruntime) or unsupported op
+                print(f"⚠️ Export {fmt}@{imgsz} failed: {e}")
+                continue
+            variants.append({"name": f"{fmt}_{imgsz}", "format": fmt, "imgsz": imgsz, "path": path})
+    return variants
+
+def pick_frames(paths, limit):
+    """Evenly spaced subset of paths, the same one every time for the same list."""
+    paths = sorted(paths)
+    step = max(1, len(paths) // limit) if limit else 1
+    return paths[::step][:limit]
+
+def load_frames(paths, read=cv2.imread):
+    """Decode the benchmark frames once up front, so decoding isn't timed."""
+    frames = [read(p) for p in paths]
+    return [img for img in frames if img is not None]
+
+def benchmark_latency(model_path, frames, imgsz):
+    """Per-frame end-to-end latency (pre + inference + NMS), batch 1 as on the rover."""
+    model = YOLO(model_path, task='detect')
+    for img in frames[:WARMUP]:
+        model.predict(img, imgsz=imgsz, device='cpu', verbose=False)
+
+    times = []
+    start = time.perf_counter()
+    for img in frames:
+        t0 = time.perf_counter()
+        model.predict(img, imgsz=imgsz, device='cpu', verbose=False)
+        times.append((time.perf_counter() - t0) * 1000.0)
+    total = time.perf_counter() - start
+    times.sort()
+    return {
+        "p50_ms": round(statistics.median(times), 2),
+        "p95_ms": round(times[int(0.95 * (len(times) - 1))], 2),
+        "fps": round(len(times) / total, 2) if total > 0 else 0.0,
+    }
+
+def evaluate_map(model_path, data_yaml, imgsz, project, validator=None):
+    """mAP50-95 / mAP50 on the val split of data_yaml (batch 1: exports have a static shape)."""
+    extra = {"validator": validator} if validator else {}
+    metrics = YOLO(model_path, task='detect').val(data=data_yaml, split='val', imgsz=imgsz, batch=1,
+                                                   device='cpu', plots=False, verbose=False,
+                                                   project=project, name="val", exist_ok=True, **extra)
+    return round(float(metrics.box.map), 4), round(float(metrics.box.map50), 4)
+
+def select_best(results, ref_map, tolerance):
+    """Fastest variant (p50) whose mAP is within tolerance of the PyTorch reference."""
+    ok = [r for r in results if r.get("map") is not None and r["map"] >= ref_map - tolerance]
+    return min(ok, key=lambda r: r["p50_ms"]) if ok else None
+
+def publish(best, report, publish_dir):
+    """Copy the chosen artifact to publish_dir (replacing the previous one) with the report."""
+    os.makedirs(publish_dir, exist_ok=True)
+    name = Path(best["path"]).name
+    dest = os.path.join(publish_dir, name)
+    tmp = dest + ".tmp"
+    if os.path.isdir(best["path"]):
+        shutil.rmtree(tmp, ignore_errors=True)
+        shutil.copytree(best["path"], tmp)
+    else:
+        shutil.copyfile(best["path"], tmp)
+
+    # Drop the previous artifact, then swap the new one in
+    record_path = os.path.join(publish_dir, "published.json")
+    if os.path.exists(record_path):
+        with open(record_path) as f:
+            old = os.path.join(publish_dir, json.load(f)["artifact"])
+        if os.path.isdir(old):
+            shutil.rmtree(old)
+        elif os.path.exists(old):
+            os.remove(old)
+    if os.path.isdir(dest):
+        shutil.rmtree(dest)
+    os.replace(tmp, dest)
+
+    with open(os.path.join(publish_dir, "benchmark.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    record = {"artifact": name, "format": best["format"], "imgsz": best["imgsz"],
+              "p50_ms": best["p50_ms"], "map": best["map"], "date": report["date"]}
+    with open(record_path + ".tmp", "w") as f:
+        json.dump(record, f, indent=2)
+    os.replace(record_path + ".tmp", record_path)
+    return dest
+
+def run_export_benchmark(weights, sizes, frames, data_yaml, ref_imgsz, out_dir, publish_dir,
+                         tolerance=0.01, formats=FORMATS, validator=None):
+    """
+    Export every variant, time it on frames (decoded images), check its mAP
+    on data_yaml's val split against the PyTorch weights at ref_imgsz, and
+    publish the fastest one that keeps accuracy. Returns the report dict.
+    """
+    if not frames:
+        raise RuntimeError("no benchmark frames found")
+    print(f"⏱️ Benchmarking on {len(frames)} frames...")
+
+    ref = {"name": f"pytorch_{ref_imgsz}", "format": "pytorch", "imgsz": ref_imgsz, "path": weights}
+    ref.update(benchmark_latency(weights, frames, ref_imgsz))
+    ref["map"], ref["map50"] = evaluate_map(weights, data_yaml, ref_imgsz, out_dir, validator)
+    print(f"   {ref['name']:22s} p50 {ref['p50_ms']:7.1f} ms  {ref['fps']:6.1f} fps  mAP {ref['map']:.4f}")
+
+    results = []
+    for v in export_variants(weights, sizes, formats, out_dir):
+        try:
+            v.update(benchmark_latency(v["path"], frames, v["imgsz"]))
+            v["map"], v["map50"] = evaluate_map(v["path"], data_yaml, v["imgsz"], out_dir, validator)
+        except Exception as e:
+            print(f"⚠️ Benchmark of {v['name']} failed: {e}")
+            v["error"] = str(e)
+            results.append(v)
+            continue
+        results.append(v)
+        print(f"   {v['name']:22s} p50 {v['p50_ms']:7.1f} ms  {v['fps']:6.1f} fps  mAP {v['map']:.4f}")
+
+    best = select_best(results, ref["map"], tolerance)
+    report = {
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "weights": weights,
+        "frames": len(frames),
+        "tolerance": tolerance,
+        "reference": ref,
+        "variants": results,
+        "selected": best["name"] if best else None,
+    }
+    # Written whether or not anything is published: it records that these
+    # weights were benchmarked, so the pipeline doesn't redo it every night
+    with open(os.path.join(out_dir, "benchmark.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    if best is None:
+        print("⚠️ No exported variant stayed within the accuracy tolerance; nothing published.")
+        return report
+
+    dest = publish(best, report, publish_dir)
+    print(f"🏆 Published {best['name']} ({best['p50_ms']:.1f} ms, mAP {best['map']:.4f} vs "
+          f"{ref['map']:.4f} PyTorch) -> {dest}")
+    return report
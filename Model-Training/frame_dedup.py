@@ -0,0 +1,126 @@
+import os
+
+import cv2
+import numpy as np
+
+# Scene change: mean absolute difference of a small grayscale thumbnail
+SCENE_THUMB_SIZE = (32, 24)
+SCENE_THRESHOLD = 12.0
+
+# Perceptual hash: 64-bit DCT hash, frames within this Hamming distance are duplicates
+PHASH_MAX_DIST = 6
+
+# Bits set in every byte value, for vectorised Hamming distances
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+class SceneChangeFilter:
+    """Accepts a frame only if it differs enough from the last accepted one."""
+
+    def __init__(self, threshold=SCENE_THRESHOLD):
+        self.threshold = threshold
+        self._last = None
+
+    def accept(self, frame):
+        thumb = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), SCENE_THUMB_SIZE,
+                           interpolation=cv2.INTER_AREA).astype(np.int16)
+        if self._last is not None and np.mean(np.abs(thumb - self._last)) < self.threshold:
+            return False
+        self._last = thumb
+        return True
+
+def phash(frame):
+    """64-bit perceptual hash (low-frequency DCT coefficients vs their median)."""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    bits = low > np.median(low[1:])
+    return int(np.packbits(bits).view(">u8")[0])
+
+def hamming(hashes, h):
+    """Hamming distance from h to every hash in a uint64 array."""
+    x = np.bitwise_xor(hashes, np.uint64(h))
+    return _POPCOUNT[x.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+class HashBuffer:
+    """uint64 hashes appended in place; capacity doubles, so adds are amortised O(1)."""
+
+    def __init__(self, capacity=256):
+        self._buf = np.zeros(capacity, dtype=np.uint64)
+        self._n = 0
+
+    def __len__(self):
+        return self._n
+
+    def append(self, h):
+        if self._n == len(self._buf):
+            self._buf = np.concatenate([self._buf, np.zeros(len(self._buf), dtype=np.uint64)])
+        self._buf[self._n] = h
+        self._n += 1
+
+    def view(self):
+        return self._buf[:self._n]
+
+class PHashIndex:
+    """
+    Persistent perceptual-hash index of every frame extracted so far (all
+    nights). Stored as a .npz of uint64 hashes plus the frame names.
+    """
+
+    def __init__(self, path, max_dist=PHASH_MAX_DIST):
+        self.path = path
+        self.max_dist = max_dist
+        self.hashes = np.zeros(0, dtype=np.uint64)
+        self.names = []
+        self._pending_h = HashBuffer()
+        self._pending_n = []
+        if os.path.exists(path):
+            data = np.load(path, allow_pickle=False)
+            self.hashes = data["hashes"].astype(np.uint64)
+            self.names = data["names"].tolist()
+
+    def __len__(self):
+        return len(self.hashes) + len(self._pending_h)
+
+    def _flush(self):
+        if len(self._pending_h):
+            self.hashes = np.concatenate([self.hashes, self._pending_h.view()])
+            self.names.extend(self._pending_n)
+            self._pending_h, self._pending_n = HashBuffer(), []
+
+    def is_duplicate(self, h):
+        if len(self.hashes) and (hamming(self.hashes, h) <= self.max_dist).any():
+            return True
+        if len(self._pending_h):
+            return bool((hamming(self._pending_h.view(), h) <= self.max_dist).any())
+        return False
+
+    def add(self, h, name):
+        self._pending_h.append(h)
+        self._pending_n.append(name)
+
+    def save(self):
+        self._flush()
+        tmp = self.path + ".tmp.npz"
+        np.savez(tmp, hashes=self.hashes, names=np.array(self.names, dtype=str))
+        os.replace(tmp, self.path)
+
+class FrameDeduper:
+    """
+    Per-worker dedup: rejects frames close to the persistent index snapshot
+    (previous nights) or to frames this worker already kept.
+    """
+
+    def __init__(self, known=None, max_dist=PHASH_MAX_DIST):
+        self.known = known
+        self.max_dist = max_dist
+        self.kept = HashBuffer()
+
+    def check(self, frame):
+        """Returns the frame's hash if it is new, else None."""
+        h = phash(frame)
+        if self.known is not None and self.known.is_duplicate(h):
+            return None
+        if len(self.kept) and (hamming(self.kept.view(), h) <= self.max_dist).any():
+            return None
+        self.kept.append(h)
+        return h
@@ -0,0 +1,82 @@
+import math
+
+import cv2
+
+# Seeking only pays off when samples are far apart: a seek decodes from the
+# previous keyframe, grab() only demuxes + decodes without colour conversion.
+SEEK_MIN_GAP_SEC = 5.0
+# A seek that lands further than this from the target is treated as unsupported
+SEEK_TOLERANCE_SEC = 1.0
+
+def _position_sec(cap, index, fps):
+    msec = cap.get(cv2.CAP_PROP_POS_MSEC)
+    if msec and msec > 0:
+        return msec / 1000.0
+    return index / fps
+
+def iter_sampled_frames(cap, frame_interval=30, time_interval=None, seek=False,
+                        start_frame=0, end_frame=None):
+    """
+    Yield (frame_index, timestamp_sec, frame) for the sampled frames only.
+
+    Skipped frames are grab()bed but never retrieve()d, so they cost no BGR
+    conversion or copy. With time_interval (seconds) samples are spaced by
+    the container timestamps instead of a frame count, which also copes with
+    the variable frame rate of browser-recorded .webm. seek=True jumps
+    straight to each sample time when samples are far apart and the
+    container supports it, falling back to grab() otherwise.
+    """
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    if not fps or fps <= 0 or fps > 1000:
+        fps = 30.0
+
+    index = 0
+    if start_frame:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        index = int(cap.get(cv2.CAP_PROP_POS_FRAMES)) or start_frame
+
+    use_seek = seek and time_interval is not None and time_interval >= SEEK_MIN_GAP_SEC
+    # Sample times are origin + k * time_interval (no float drift from
+    # repeated additions); origin is set by the first frame
+    origin, k = None, 0
+
+    while end_frame is None or index < end_frame:
+        seeked = False
+        if use_seek and origin is not None:
+            target = origin + k * time_interval
+            cap.set(cv2.CAP_PROP_POS_MSEC, target * 1000.0)
+            if abs(cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0 - target) > SEEK_TOLERANCE_SEC:
+                # Container can't seek accurately (e.g. webm without cues): go
+                # back to where grab() left off, and trust the capture's frame
+                # position over ours if it can't get there exactly either
+                use_seek = False
+                cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+                index = int(cap.get(cv2.CAP_PROP_POS_FRAMES)) or index
+            else:
+                index = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+                seeked = True
+
+        if not cap.grab():
+            break
+        t = _position_sec(cap, index, fps)
+
+        if time_interval is None:
+            take = (index - start_frame) % frame_interval == 0
+        else:
+            if origin is None:
+                # A mid-video chunk keeps the phase a single pass from t=0 would have
+                origin = 0.0 if start_frame else t
+                k = math.ceil((t - origin) / time_interval - 1e-9)
+            take = seeked or t >= origin + k * time_interval
+
+        if take:
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            if time_interval is not None:
+                k += 1
+                # Don't fall behind after a long gap in the recording
+                while origin + k * time_interval <= t:
+                    k += 1
+            yield index, t, frame
+        index += 1
@@ -0,0 +1,172 @@
+import os
+import sys
+import glob
+import time
+import concurrent.futures
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+# The colour/strip detectors live in the MLH-App folder next to this one
+# (deploy.ps1 copies both to the droplet).
+MLH_APP_DIR = os.getenv("MLH_APP_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "MLH-App"))
+if MLH_APP_DIR not in sys.path:
+    sys.path.insert(0, MLH_APP_DIR)
+
+from mlh_color_detector import COLORS, MIN_AREA, color_mask
+from strip_detector import classify_strips, MIN_ASPECT, MIN_SOLIDITY
+
+# Detectors are tuned for the 400x300 stream size
+DETECT_SIZE = (400, 300)
+
+# Our own course classes. "obstacle" only comes from the optional YOLO second opinion.
+COLOR_NAMES = list(COLORS.keys())
+HSV_CLASSES = ([f"{c.lower()}_strip" for c in COLOR_NAMES] +
+               [f"{c.lower()}_object" for c in COLOR_NAMES] +
+               ["obstacle"])
+OBSTACLE_CLASS = HSV_CLASSES.index("obstacle")
+
+def label_image(img):
+    """
+    YOLO boxes (cls, x, y, w, h normalised) for one BGR image using the HSV
+    colour masks from mlh_color_detector and the strip test from strip_detector.
+    """
+    frame = cv2.resize(img, DETECT_SIZE, interpolation=cv2.INTER_AREA)
+    blur = cv2.GaussianBlur(frame, (5, 5), 0)
+    hsv = cv2.cvtColor(blur, cv2.COLOR_BGR2HSV)
+    kernel = np.ones((5, 5), np.uint8)
+    fw, fh = DETECT_SIZE
+
+    boxes = []
+    for ci, color in enumerate(COLOR_NAMES):
+        mask = color_mask(hsv, COLORS[color], kernel)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        # Thresholds of 0 keep every blob above MIN_AREA; strip-ness is decided below
+        blobs = classify_strips(contours, MIN_AREA, 0.0, 0.0)
+        if len(blobs) == 0:
+            continue
+
+        is_strip = (blobs["aspect"] > MIN_ASPECT) & (blobs["solidity"] > MIN_SOLIDITY)
+        corners = blobs["box"]
+        x0 = np.clip(corners[:, :, 0].min(axis=1), 0, fw)
+        x1 = np.clip(corners[:, :, 0].max(axis=1), 0, fw)
+        y0 = np.clip(corners[:, :, 1].min(axis=1), 0, fh)
+        y1 = np.clip(corners[:, :, 1].max(axis=1), 0, fh)
+        cls = np.where(is_strip, ci, ci + len(COLOR_NAMES))
+        for k in range(len(blobs)):
+            boxes.append((int(cls[k]), (x0[k] + x1[k]) / 2 / fw, (y0[k] + y1[k]) / 2 / fh,
+                          (x1[k] - x0[k]) / fw, (y1[k] - y0[k]) / fh))
+    return boxes
+
+def write_labels(label_path, boxes):
+    with open(label_path, 'w') as f:
+        for cls, x, y, w, h in boxes:
+            f.write(f"{cls} {x:.6f} {y:.6f} {w:.6f} {h:.6f}\n")
+
+def _init_worker():
+    # One process per core already; keep OpenCV from spawning its own threads
+    cv2.setNumThreads(1)
+
+def _label_chunk(img_paths, labels_dir):
+    """Worker: label a chunk of images. Returns (images, boxes, empty image paths)."""
+    n_boxes = 0
+    empty = []
+    for img_path in img_paths:
+        img = cv2.imread(img_path)
+        if img is None:
+            continue
+        boxes = label_image(img)
+        write_labels(os.path.join(labels_dir, f"{Path(img_path).stem}.txt"), boxes)
+        n_boxes += len(boxes)
+        if not boxes:
+            empty.append(img_path)
+    return len(img_paths), n_boxes, empty
+
+def yolo_second_opinion(img_paths, labels_dir, model_path='yolov8n.pt', conf=0.4):
+    """Ask YOLO about frames the colour detectors found nothing in; any hit becomes an obstacle."""
+    from ultralytics import YOLO
+    model = YOLO(model_path)
+    added = 0
+    for img_path in img_paths:
+        results = model(img_path, verbose=False, device='cpu')
+        label_path = os.path.join(labels_dir, f"{Path(img_path).stem}.txt")
+        with open(label_path, 'a') as f:
+            for r in results:
+                for box in r.boxes:
+                    if box.conf[0] > conf:
+                        x, y, w, h = box.xywhn[0].tolist()
+                        f.write(f"{OBSTACLE_CLASS} {x} {y} {w} {h}\n")
+                        added += 1
+    return added
+
+# Files whose content defines this labeler's output (used as the label cache key)
+HSV_SOURCE_FILES = [
+    os.path.abspath(__file__),
+    os.path.join(MLH_APP_DIR, "mlh_color_detector.py"),
+    os.path.join(MLH_APP_DIR, "strip_detector.py"),
+]
+
+def hsv_label_frames(images_dir, labels_dir, workers=None, chunk_size=64, yolo=False, images=None):
+    """Label every *.jpg in images_dir (or just `images`) across a process pool."""
+    if images is None:
+        images = sorted(glob.glob(os.path.join(images_dir, "*.jpg")))
+    workers = workers or os.cpu_count() or 1
+    chunks = [images[i:i + chunk_size] for i in range(0, len(images), chunk_size)]
+    print(f"🏷️ HSV-labeling {len(images)} frames with {workers} processes...")
+
+    start = time.time()
+    total_imgs = total_boxes = 0
+    empty = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        futures = [executor.submit(_label_chunk, chunk, labels_dir) for chunk in chunks]
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                n_imgs, n_boxes, chunk_empty = future.result()
+            except Exception as e:
+                print(f"❌ Labeling chunk failed: {e}")
+                continue
+            total_imgs += n_imgs
+            total_boxes += n_boxes
+            empty.extend(chunk_empty)
+
+    elapsed = time.time() - start
+    rate = total_imgs / elapsed if elapsed > 0 else 0.0
+    print(f"✅ HSV labels: {total_boxes} boxes in {total_imgs} frames ({rate:.0f} img/s)")
+
+    if yolo and empty:
+        print(f"🔎 YOLO second opinion on {len(empty)} frames with no colour detections...")
+        added = yolo_second_opinion(empty, labels_dir)
+        print(f"✅ YOLO added {added} obstacle boxes.")
+
+def _label_pack_rows(root, rows):
+    """Worker: HSV boxes for a range of rows of a packed dataset."""
+    from packed_dataset import PackedDataset
+    pack = PackedDataset(root)
+    out = {}
+    for name, img in pack.iter_images(rows):
+        boxes = label_image(img)
+        cls = np.array([b[0] for b in boxes], np.int16)
+        out[name] = (cls, np.array([b[1:] for b in boxes], np.float32).reshape(-1, 4))
+    pack.close()
+    return out
+
+def hsv_label_pack(root, workers=None, chunk_size=256):
+    """Relabel every frame of a packed dataset in place (no loose files needed)."""
+    from packed_dataset import PackedDataset, write_labels
+    n = len(PackedDataset(root))
+    workers = workers or os.cpu_count() or 1
+    print(f"🏷️ HSV-relabeling {n} packed frames with {workers} processes...")
+
+    start = time.time()
+    labels = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        futures = [executor.submit(_label_pack_rows, root, range(i, min(i + chunk_size, n)))
+                   for i in range(0, n, chunk_size)]
+        for future in concurrent.futures.as_completed(futures):
+            labels.update(future.result())
+    write_labels(root, labels)
+
+    elapsed = time.time() - start
+    rate = len(labels) / elapsed if elapsed > 0 else 0.0
+    print(f"✅ Packed labels rewritten for {len(labels)} frames ({rate:.0f} img/s)")
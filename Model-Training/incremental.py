@@ -0,0 +1,135 @@
+import os
+import json
+import random
+import hashlib
+import shutil
+from collections import Counter, defaultdict
+
+# Frames of one video are near-duplicates of each other, so the held-out
+# split is decided per video, never per frame.
+VAL_FRACTION = 0.1
+BACKGROUND = -1
+
+def video_of(name):
+    """Source video of an extracted frame (<video>_frame_<index>.jpg)."""
+    return name.rsplit("_frame_", 1)[0]
+
+def _unit_hash(text):
+    h = hashlib.blake2b(text.encode(), digest_size=8).digest()
+    return int.from_bytes(h, "big") / 2.0 ** 64
+
+def read_list(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+def write_list(path, items):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.writelines(f"{x}\n" for x in items)
+    os.replace(tmp, path)
+
+def stratum(classes):
+    """Most frequent class in a frame, or BACKGROUND for frames without boxes."""
+    if len(classes) == 0:
+        return BACKGROUND
+    return Counter(int(c) for c in classes).most_common(1)[0][0]
+
+def stratified_sample(names, stratum_of, size, rng):
+    """
+    Up to `size` names with the budget split evenly across strata; strata
+    smaller than their share give the rest to the others, so rare classes
+    are always fully represented.
+    """
+    buckets = defaultdict(list)
+    for n in names:
+        buckets[stratum_of(n)].append(n)
+    if sum(len(b) for b in buckets.values()) <= size:
+        return list(names)
+
+    picked = []
+    remaining = size
+    # Smallest strata first so their leftover budget flows to the larger ones
+    for i, key in enumerate(sorted(buckets, key=lambda k: len(buckets[k]))):
+        share = remaining // (len(buckets) - i)
+        take = min(share, len(buckets[key]))
+        picked.extend(rng.sample(buckets[key], take))
+        remaining -= take
+    return picked
+
+def plan_splits(frames, seen, val, stratum_of, replay_size, val_size, val_fraction=VAL_FRACTION, seed=None):
+    """
+    Split the archive for one incremental run.
+
+    frames: every frame name we have; seen: names earlier runs trained on;
+    val: the current held-out list. Whole held-out videos are taken until
+    there are val_size frames, last run's first so the list stays stable;
+    every other video, held-out hash or not, is trained on. A video an
+    earlier run trained on is never held out, or evaluation would leak.
+    Returns (new, replay, val): unseen training frames, a stratified sample
+    of seen ones, and the held-out frames.
+    """
+    rng = random.Random(seed)
+    seen = set(seen)
+
+    by_video = defaultdict(list)
+    for n in frames:
+        by_video[video_of(n)].append(n)
+    trained = {video_of(n) for n in seen}
+    kept = {video_of(n) for n in val if video_of(n) in by_video}
+    candidates = [v for v in by_video if (v in kept or _unit_hash(v) < val_fraction) and v not in trained]
+    candidates.sort(key=lambda v: (v not in kept, _unit_hash(v)))
+
+    val = []
+    val_videos = set()
+    for v in candidates:
+        if len(val) >= val_size:
+            break
+        val.extend(by_video[v])
+        val_videos.add(v)
+
+    train = [n for n in frames if video_of(n) not in val_videos]
+    new = [n for n in train if n not in seen]
+    old = [n for n in train if n in seen]
+    replay = stratified_sample(old, stratum_of, replay_size, rng)
+    return new, replay, val
+
+def read_promoted(path):
+    """Record of the currently promoted model ({"weights", "map", ...}) or None."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def deployed_model(model_dir="biathlon_model"):
+    """
+    Weights to serve: whichever of the promoted model and the last full
+    run's best.pt was recorded most recently, else the legacy full-run path,
+    else None. The training pipeline, its export stage, predict.py and the
+    inference daemon all resolve the model through here.
+    """
+    records = [os.path.join(model_dir, "promoted", "promoted.json"), os.path.join(model_dir, "last_run.json")]
+    candidates = []
+    for path in records:
+        if os.path.exists(path):
+            with open(path) as f:
+                weights = json.load(f).get("weights")
+            if weights and os.path.exists(weights):
+                candidates.append((os.path.getmtime(path), weights))
+    if candidates:
+        return max(candidates)[1]
+    legacy = os.path.join(model_dir, "cpu_run", "weights", "best.pt")
+    return legacy if os.path.exists(legacy) else None
+
+def promote(weights, record_path, dest_dir, **info):
+    """Copy weights into dest_dir as the model the next run starts from."""
+    os.makedirs(dest_dir, exist_ok=True)
+    dest = os.path.join(dest_dir, "best.pt")
+    shutil.copyfile(weights, dest + ".tmp")
+    os.replace(dest + ".tmp", dest)
+    record = dict(info, weights=dest, source=weights)
+    with open(record_path + ".tmp", "w") as f:
+        json.dump(record, f, indent=2)
+    os.replace(record_path + ".tmp", record_path)
+    return dest
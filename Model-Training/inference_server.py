@@ -0,0 +1,392 @@
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import argparse
+import threading
+import http.client
+import statistics
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+# One warm model per machine. Clients POST frames to /predict over a Unix
+# socket (default) or TCP, as JPEG bytes or as a shared-memory handle
+# (JSON {"shm", "shape", "dtype"}), and get the detections back as JSON.
+# Concurrent requests are coalesced into one predict() call of up to
+# MAX_BATCH frames; a batch waits at most MAX_WAIT_MS for company after its
+# first frame arrives. GET /metrics reports queue depth, batch sizes and latency.
+SOCKET_PATH = os.getenv("INFERENCE_SOCKET", "/tmp/biathlon_inference.sock")
+MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", "8"))
+MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "10"))
+QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE", "64"))
+CONF = float(os.getenv("INFERENCE_CONF", "0.25"))
+
+# Latency percentiles are over this many recent requests
+LATENCY_WINDOW = 1000
+
+class Request:
+    def __init__(self, image):
+        self.image = image
+        self.arrived = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # Set when the caller's timeout ran out; nobody is waiting for the result
+        self.abandoned = False
+
+class MicroBatcher:
+    """
+    Single inference thread in front of the model. Requests queue up while a
+    batch runs; the next batch takes everything waiting (up to max_batch),
+    topping up until max_wait after its oldest request. A full queue rejects
+    new requests (queue.Full) rather than letting latency grow without bound.
+    """
+
+    def __init__(self, model, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS, queue_size=QUEUE_SIZE,
+                 conf=CONF, imgsz=None):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.predict_args = {"conf": conf, "device": "cpu", "verbose": False}
+        if imgsz:
+            self.predict_args["imgsz"] = imgsz
+        self.lock = threading.Lock()
+        self.batch_sizes = Counter()
+        self.latency_ms = deque(maxlen=LATENCY_WINDOW)
+        self.infer_ms = deque(maxlen=LATENCY_WINDOW)
+        self.depth_max = 0
+        self.rejected = 0
+        self.abandoned = 0
+        self.errors = 0
+        self.started = time.time()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, image, timeout=30.0):
+        """Detections for one BGR image; blocks until its batch has run."""
+        req = Request(image)
+        try:
+            self.queue.put_nowait(req)
+        except queue.Full:
+            with self.lock:
+                self.rejected += 1
+            raise
+        with self.lock:
+            self.depth_max = max(self.depth_max, self.queue.qsize())
+        if not req.done.wait(timeout):
+            req.abandoned = True
+            raise TimeoutError("inference timed out")
+        if req.error is not None:
+            raise req.error
+        return req.result
+
+    def _live(self, req):
+        if req.abandoned:
+            with self.lock:
+                self.abandoned += 1
+            return False
+        return True
+
+    def _collect(self):
+        try:
+            first = self.queue.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        if not self._live(first):
+            return []
+        batch = [first]
+        deadline = first.arrived + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                # Past the deadline: still take whatever is already waiting
+                req = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if self._live(req):
+                batch.append(req)
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if not batch:
+                continue
+            t0 = time.perf_counter()
+            try:
+                results = self.model.predict([r.image for r in batch], batch=len(batch), **self.predict_args)
+                for req, result in zip(batch, results):
+                    req.result = detections(result)
+            except Exception as e:
+                with self.lock:
+                    self.errors += 1
+                for req in batch:
+                    req.error = e
+            t1 = time.perf_counter()
+            with self.lock:
+                self.batch_sizes[len(batch)] += 1
+                self.infer_ms.append((t1 - t0) * 1000.0)
+                for req in batch:
+                    self.latency_ms.append((t1 - req.arrived) * 1000.0)
+            for req in batch:
+                req.done.set()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+    def metrics(self):
+        with self.lock:
+            batches = sum(self.batch_sizes.values())
+            requests = sum(k * v for k, v in self.batch_sizes.items())
+            lat = sorted(self.latency_ms)
+            return {
+                "uptime_s": round(time.time() - self.started, 1),
+                "requests": requests,
+                "batches": batches,
+                "mean_batch": round(requests / batches, 2) if batches else 0.0,
+                "batch_sizes": {str(k): v for k, v in sorted(self.batch_sizes.items())},
+                "queue_depth": self.queue.qsize(),
+                "queue_depth_max": self.depth_max,
+                "rejected": self.rejected,
+                "abandoned": self.abandoned,
+                "errors": self.errors,
+                "latency_p50_ms": round(statistics.median(lat), 2) if lat else None,
+                "latency_p95_ms": round(lat[int(0.95 * (len(lat) - 1))], 2) if lat else None,
+                "infer_mean_ms": round(statistics.fmean(self.infer_ms), 2) if self.infer_ms else None,
+            }
+
+def detections(result):
+    """JSON-able detections of one ultralytics result (xyxy pixels)."""
+    boxes = result.boxes.cpu().numpy()
+    return {
+        "cls": boxes.cls.astype(int).tolist(),
+        "conf": [round(c, 4) for c in boxes.conf.tolist()],
+        "boxes": [[round(v, 1) for v in b] for b in boxes.xyxy.tolist()],
+    }
+
+def read_shm(spec):
+    """Copy a frame out of the client's shared-memory block ({"shm", "shape", "dtype"})."""
+    try:
+        shm = shared_memory.SharedMemory(name=spec["shm"], track=False)
+    except TypeError:
+        # Before 3.13 attaching registers the block with our resource tracker,
+        # which would unlink the client's memory when the daemon exits
+        shm = shared_memory.SharedMemory(name=spec["shm"])
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    try:
+        arr = np.ndarray(tuple(spec["shape"]), dtype=spec.get("dtype", "uint8"), buffer=shm.buf)
+        # The client reuses its block for the next frame once we answer
+        return arr.copy()
+    finally:
+        shm.close()
+
+class InferenceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self, code, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._reply(200, self.server.batcher.metrics())
+        elif self.path == "/health":
+            self._reply(200, {"ok": True, "model": self.server.model_path, "names": self.server.names})
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self._reply(404, {"error": "not found"})
+            return
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        try:
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                image = read_shm(json.loads(body))
+            else:
+                image = cv2.imdecode(np.frombuffer(body, np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                raise ValueError("could not decode image")
+        except (ValueError, KeyError, TypeError, FileNotFoundError) as e:
+            self._reply(400, {"error": str(e)})
+            return
+        try:
+            self._reply(200, self.server.batcher.submit(image))
+        except queue.Full:
+            self._reply(503, {"error": "queue full"})
+        except Exception as e:
+            self._reply(500, {"error": str(e)})
+
+    def log_message(self, format, *args):
+        pass  # one line per frame would drown everything else
+
+class InferenceHTTPServer(ThreadingHTTPServer):
+    # socketserver's default backlog of 5 refuses bursts of concurrent clients
+    # before the batcher ever sees them; admit at least a full queue's worth
+    request_queue_size = max(128, QUEUE_SIZE)
+    daemon_threads = True
+
+class UnixHTTPServer(InferenceHTTPServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        # A stale socket file from a killed daemon would make bind() fail
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        self.socket.bind(self.server_address)
+        self.server_name, self.server_port = "localhost", 0
+
+    def get_request(self):
+        conn, _ = self.socket.accept()
+        # BaseHTTPRequestHandler wants a (host, port) client address
+        return conn, ("local", 0)
+
+def serve(model_path, socket_path=SOCKET_PATH, port=None, imgsz=None, **batch_args):
+    """Load the model once and serve it until interrupted."""
+    from ultralytics import YOLO
+    from cpu_governor import CpuGovernor
+
+    CpuGovernor().apply("serve")
+    model = YOLO(model_path)
+    # First call pays for lazy setup; keep it out of the clients' latency
+    model.predict(np.zeros((480, 640, 3), np.uint8), device="cpu", verbose=False, imgsz=imgsz or 640)
+
+    if port:
+        server = InferenceHTTPServer(("127.0.0.1", port), InferenceHandler)
+        where = f"http://127.0.0.1:{port}"
+    else:
+        server = UnixHTTPServer(socket_path, InferenceHandler)
+        where = socket_path
+    server.batcher = MicroBatcher(model, imgsz=imgsz, **batch_args)
+    server.model_path = model_path
+    server.names = {str(k): v for k, v in model.names.items()}
+    print(f"🧠 Serving {model_path} on {where} (batch <= {server.batcher.max_batch}, "
+          f"wait <= {server.batcher.max_wait * 1000:.0f} ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.batcher.close()
+        if not port and os.path.exists(socket_path):
+            os.remove(socket_path)
+        print(f"📊 {json.dumps(server.batcher.metrics())}")
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=30.0):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        # A Unix socket with a full backlog fails connect() with EAGAIN instead of
+        # blocking; back off and retry until the timeout
+        deadline = time.monotonic() + (self.timeout or 30.0)
+        delay = 0.001
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.path)
+            except BlockingIOError:
+                sock.close()
+                if time.monotonic() + delay > deadline:
+                    raise
+                time.sleep(delay)
+                delay = min(delay * 2, 0.05)
+                continue
+            self.sock = sock
+            return
+
+class InferenceClient:
+    """
+    Client for the daemon. predict(image) sends a BGR frame through shared
+    memory (use_shm=True, no encode/decode; same machine only) or as JPEG.
+    One connection is kept open; use one client per thread.
+    """
+
+    def __init__(self, socket_path=SOCKET_PATH, port=None, use_shm=True, jpeg_quality=90, timeout=30.0):
+        self.conn = (http.client.HTTPConnection("127.0.0.1", port, timeout=timeout) if port
+                     else _UnixConnection(socket_path, timeout))
+        self.use_shm = use_shm
+        self.jpeg_quality = jpeg_quality
+        self._shm = None
+
+    def _request(self, method, path, body=None, content_type=None):
+        headers = {"Content-Type": content_type} if content_type else {}
+        self.conn.request(method, path, body=body, headers=headers)
+        resp = self.conn.getresponse()
+        payload = json.loads(resp.read())
+        if resp.status != 200:
+            raise RuntimeError(f"inference server: {resp.status} {payload.get('error')}")
+        return payload
+
+    def predict_jpeg(self, data):
+        return self._request("POST", "/predict", bytes(data), "image/jpeg")
+
+    def predict(self, image):
+        """{"cls", "conf", "boxes"} for one BGR image."""
+        if not self.use_shm:
+            ok, buf = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            return self.predict_jpeg(buf.tobytes())
+        if self._shm is None or self._shm.size < image.nbytes:
+            self._close_shm()
+            self._shm = shared_memory.SharedMemory(create=True, size=image.nbytes)
+        np.ndarray(image.shape, image.dtype, buffer=self._shm.buf)[:] = image
+        spec = {"shm": self._shm.name, "shape": list(image.shape), "dtype": str(image.dtype)}
+        return self._request("POST", "/predict", json.dumps(spec).encode(), "application/json")
+
+    def metrics(self):
+        return self._request("GET", "/metrics")
+
+    def health(self):
+        """{"ok", "model", "names"} of the running daemon."""
+        return self._request("GET", "/health")
+
+    def _close_shm(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def close(self):
+        self._close_shm()
+        self.conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep one model warm and serve micro-batched inference")
+    parser.add_argument("--model", help="weights (default: the deployed model)")
+    parser.add_argument("--socket", default=SOCKET_PATH, help="Unix socket path")
+    parser.add_argument("--port", type=int, help="serve HTTP on 127.0.0.1:PORT instead of the socket")
+    parser.add_argument("--imgsz", type=int)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS)
+    parser.add_argument("--metrics", action="store_true", help="print a running server's metrics and exit")
+    args = parser.parse_args()
+
+    if args.metrics:
+        client = InferenceClient(args.socket, args.port)
+        print(json.dumps(client.metrics(), indent=2))
+        client.close()
+        return
+
+    from incremental import deployed_model
+    model_path = args.model or deployed_model() or "yolov8n.pt"
+    serve(model_path, args.socket, args.port, args.imgsz, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+
+if __name__ == "__main__":
+    sys.exit(main())
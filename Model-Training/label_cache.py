@@ -0,0 +1,152 @@
+import os
+import time
+import hashlib
+import sqlite3
+import concurrent.futures
+from pathlib import Path
+
+def file_digest(path, chunk=1 << 20):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def labeler_key(name, files=(), **params):
+    """
+    Identity of a labeler: its name, the content of the files that define it
+    (model weights, detector source) and its parameters. Changing any of
+    them gives a new key, so stale labels are never reused.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(name.encode())
+    for path in files:
+        h.update(file_digest(path).encode() if os.path.exists(path) else path.encode())
+    for k in sorted(params):
+        h.update(f"{k}={params[k]}".encode())
+    return f"{name}-{h.hexdigest()}"
+
+# Rows looked up per query; stays under SQLite's bound-parameter limit
+LOOKUP_CHUNK = 500
+
+class LabelCache:
+    """
+    Content-addressed label store: (image content hash, labeler key) -> label
+    file text, in one SQLite file. Image hashes are memoised by
+    (path, size, mtime) so unchanged frames aren't re-read every night.
+    """
+
+    def __init__(self, db_path, hash_threads=8):
+        self.db_path = db_path
+        self.hash_threads = hash_threads
+        self.db = sqlite3.connect(db_path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS labels (img_hash TEXT, labeler TEXT, text TEXT, "
+                        "PRIMARY KEY (img_hash, labeler))")
+        self.db.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, "
+                        "mtime REAL, img_hash TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS labelers (labeler TEXT PRIMARY KEY, last_used REAL)")
+        self.db.commit()
+        self._hash_of = {}
+
+    def _lookup(self, sql, values, *params):
+        """Run sql ('... IN ({})') for values in chunks, so cost follows the batch, not the table."""
+        values = list(values)
+        for i in range(0, len(values), LOOKUP_CHUNK):
+            chunk = values[i:i + LOOKUP_CHUNK]
+            yield from self.db.execute(sql.format(",".join("?" * len(chunk))), (*params, *chunk))
+
+    def _hashes(self, images):
+        """Content hash for every image, reusing the stored hash when size/mtime match."""
+        known = {}
+        for path, size, mtime, img_hash in self._lookup(
+                "SELECT path, size, mtime, img_hash FROM files WHERE path IN ({})", images):
+            known[path] = (size, mtime, img_hash)
+
+        out, todo = {}, []
+        for path in images:
+            st = os.stat(path)
+            k = known.get(path)
+            if k and k[0] == st.st_size and k[1] == st.st_mtime:
+                out[path] = k[2]
+            else:
+                todo.append((path, st.st_size, st.st_mtime))
+
+        if todo:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.hash_threads) as pool:
+                digests = list(pool.map(file_digest, [p for p, _, _ in todo]))
+            self.db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                                [(p, s, m, d) for (p, s, m), d in zip(todo, digests)])
+            self.db.commit()
+            out.update({p: d for (p, _, _), d in zip(todo, digests)})
+        return out
+
+    def _touch(self, key):
+        self.db.execute("INSERT OR REPLACE INTO labelers VALUES (?, ?)", (key, time.time()))
+
+    def restore(self, images, key, labels_dir):
+        """
+        Write cached labels for every image this labeler has already seen.
+        Returns the images that still need labeling; their existing label
+        files (another labeler's) are deleted, so after labeling any label
+        file present was written by this run.
+        """
+        hashes = self._hashes(images)
+        cached = dict(self._lookup("SELECT img_hash, text FROM labels WHERE labeler = ? AND img_hash IN ({})",
+                                   set(hashes.values()), key))
+
+        misses = []
+        for path in images:
+            text = cached.get(hashes[path])
+            label_path = os.path.join(labels_dir, f"{Path(path).stem}.txt")
+            if text is None:
+                misses.append(path)
+                if os.path.exists(label_path):
+                    os.remove(label_path)
+                continue
+            with open(label_path, "w") as f:
+                f.write(text)
+        self._hash_of.update(hashes)
+        self._touch(key)
+        self.db.commit()
+        return misses
+
+    def store(self, images, key, labels_dir):
+        """
+        Record the label files of `images` under this labeler. Only call it for
+        images restore() returned as misses: their old files were removed, so
+        an image this run failed to label or decode has none and is skipped.
+        """
+        missing = [p for p in images if p not in self._hash_of]
+        if missing:
+            self._hash_of.update(self._hashes(missing))
+        rows = []
+        for path in images:
+            label_path = os.path.join(labels_dir, f"{Path(path).stem}.txt")
+            if not os.path.exists(label_path):
+                continue
+            with open(label_path) as f:
+                rows.append((self._hash_of[path], key, f.read()))
+        self.db.executemany("INSERT OR REPLACE INTO labels VALUES (?, ?, ?)", rows)
+        self._touch(key)
+        self.db.commit()
+        return len(rows)
+
+    def prune(self, keep=3):
+        """
+        Drop labels of all but the `keep` most recently used labelers, so
+        switching LABELER back and forth keeps both caches but old weights'
+        labels don't pile up forever.
+        """
+        used = dict(self.db.execute("SELECT labeler, last_used FROM labelers"))
+        # Labelers from before last_used was tracked count as the oldest
+        keys = [k for (k,) in self.db.execute("SELECT DISTINCT labeler FROM labels")]
+        stale = sorted(keys, key=lambda k: used.get(k, 0.0), reverse=True)[keep:]
+        n = 0
+        for k in stale:
+            n += self.db.execute("DELETE FROM labels WHERE labeler = ?", (k,)).rowcount
+            self.db.execute("DELETE FROM labelers WHERE labeler = ?", (k,))
+        self.db.commit()
+        return n
+
+    def close(self):
+        self.db.close()
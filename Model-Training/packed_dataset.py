@@ -0,0 +1,386 @@
+import os
+import sys
+import glob
+import json
+import mmap
+import argparse
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+# Packed layout (one directory per split). Every file is append-only, so a
+# nightly append writes only the new frames:
+#   shard_00000.bin ...   encoded JPEGs back to back, up to SHARD_BYTES each
+#   index.bin             raw INDEX_DTYPE records, one per image
+#   names.bin             UTF-8 image names back to back (index name_start/name_length)
+#   labels/cls.bin        int16 class per box      \  sorted by image,
+#   labels/boxes.bin      float32 (n, 4) xywhn     /  sliced via label_start/count
+#   pack.json             committed row/box/name-byte counts, written last
+# Readers only look at the committed prefix of each file; anything past it
+# (an interrupted append) is truncated by the next PackWriter.
+SHARD_BYTES = 256 * 1024 * 1024
+MAX_NAME_BYTES = 0xFFFF
+
+INDEX_DTYPE = np.dtype([
+    ("name_start", "<u8"),
+    ("name_length", "<u2"),
+    ("shard", "<u2"),
+    ("offset", "<u8"),
+    ("length", "<u4"),
+    ("height", "<u2"),
+    ("width", "<u2"),
+    ("label_start", "<u8"),
+    ("label_count", "<u4"),
+])
+
+def _shard_path(root, shard):
+    return os.path.join(root, f"shard_{shard:05d}.bin")
+
+def _paths(root):
+    return {
+        "index": os.path.join(root, "index.bin"),
+        "names": os.path.join(root, "names.bin"),
+        "cls": os.path.join(root, "labels", "cls.bin"),
+        "boxes": os.path.join(root, "labels", "boxes.bin"),
+    }
+
+def read_meta(root):
+    """Committed counts of a pack ({"rows", "labels", "name_bytes"}); zeros if there is none."""
+    path = os.path.join(root, "pack.json")
+    if not os.path.exists(path):
+        return {"rows": 0, "labels": 0, "name_bytes": 0}
+    with open(path) as f:
+        return json.load(f)
+
+def _write_meta(root, meta):
+    path = os.path.join(root, "pack.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(meta, f)
+    os.replace(path + ".tmp", path)
+
+def _map(path, dtype, count, shape=()):
+    # np.memmap can't map an empty file
+    if count == 0:
+        return np.zeros((0,) + shape, dtype)
+    return np.memmap(path, dtype, mode="r", shape=(count,) + shape)
+
+def _truncate(path, size):
+    if os.path.exists(path) and os.path.getsize(path) > size:
+        os.truncate(path, size)
+
+def _encode_name(name):
+    raw = name.encode("utf-8")
+    if len(raw) > MAX_NAME_BYTES:
+        raise ValueError(f"image name longer than {MAX_NAME_BYTES} bytes: {name[:64]}...")
+    return raw
+
+def parse_label_text(text):
+    """(cls int16 array, boxes float32 (n, 4)) from YOLO label file text."""
+    rows = [line.split() for line in text.splitlines() if line.strip()]
+    if not rows:
+        return np.zeros(0, np.int16), np.zeros((0, 4), np.float32)
+    cls = np.array([int(float(r[0])) for r in rows], np.int16)
+    boxes = np.array([[float(v) for v in r[1:5]] for r in rows], np.float32)
+    return cls, boxes
+
+def format_label_text(cls, boxes):
+    return "".join(f"{c} {x:.6f} {y:.6f} {w:.6f} {h:.6f}\n" for c, (x, y, w, h) in zip(cls.tolist(), boxes.tolist()))
+
+class PackedDataset:
+    """
+    Read side of a packed split. Everything is memory-mapped, so opening a
+    pack with millions of frames costs a few page faults and no directory
+    listing. Safe to use from forked DataLoader workers (shards are mapped
+    lazily per process).
+    """
+
+    def __init__(self, root):
+        self.root = root
+        meta = read_meta(root)
+        paths = _paths(root)
+        self.index = _map(paths["index"], INDEX_DTYPE, meta["rows"])
+        self.cls = _map(paths["cls"], np.int16, meta["labels"])
+        self.boxes = _map(paths["boxes"], np.float32, meta["labels"], (4,))
+        self._name_blob = _map(paths["names"], np.uint8, meta["name_bytes"])
+        self._names = None
+        self._maps = {}
+        self._pid = None
+        self._rows = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def name(self, i):
+        r = self.index[i]
+        s = int(r["name_start"])
+        return bytes(self._name_blob[s:s + int(r["name_length"])]).decode("utf-8")
+
+    def names(self):
+        if self._names is None:
+            blob = bytes(self._name_blob)
+            self._names = [blob[s:s + n].decode("utf-8") for s, n in
+                           zip(self.index["name_start"].tolist(), self.index["name_length"].tolist())]
+        return self._names
+
+    def row_of(self, name):
+        if self._rows is None:
+            self._rows = {n: i for i, n in enumerate(self.names())}
+        return self._rows.get(name)
+
+    def _shard(self, shard):
+        if self._pid != os.getpid():
+            # Fresh maps after fork; the parent's file objects aren't ours to share
+            self._maps, self._pid = {}, os.getpid()
+        m = self._maps.get(shard)
+        if m is None:
+            with open(_shard_path(self.root, shard), "rb") as f:
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[shard] = m
+        return m
+
+    def read_bytes(self, i):
+        """Encoded JPEG of row i (a view into the shard, no copy)."""
+        r = self.index[i]
+        off = int(r["offset"])
+        return memoryview(self._shard(int(r["shard"])))[off:off + int(r["length"])]
+
+    def image(self, i, flags=cv2.IMREAD_COLOR):
+        return cv2.imdecode(np.frombuffer(self.read_bytes(i), np.uint8), flags)
+
+    def labels(self, i):
+        """(cls, boxes) of row i."""
+        r = self.index[i]
+        s, n = int(r["label_start"]), int(r["label_count"])
+        return np.asarray(self.cls[s:s + n]), np.asarray(self.boxes[s:s + n])
+
+    def iter_images(self, rows=None):
+        """Yield (name, BGR image) for the given rows (default: all) in order."""
+        for i in range(len(self)) if rows is None else rows:
+            img = self.image(i)
+            if img is not None:
+                yield self.name(i), img
+
+    def close(self):
+        for m in self._maps.values():
+            m.close()
+        self._maps = {}
+
+class PackWriter:
+    """
+    Appends images to a packed split. Existing shards, rows and labels are
+    left where they are: close() appends only the new records and then
+    commits the new counts, so nothing is visible to readers before that.
+    """
+
+    def __init__(self, root, shard_bytes=SHARD_BYTES):
+        os.makedirs(os.path.join(root, "labels"), exist_ok=True)
+        self.root = root
+        self.shard_bytes = shard_bytes
+        self.meta = read_meta(root)
+        paths = _paths(root)
+        # Drop whatever an interrupted writer appended after the last commit
+        _truncate(paths["index"], self.meta["rows"] * INDEX_DTYPE.itemsize)
+        _truncate(paths["names"], self.meta["name_bytes"])
+        _truncate(paths["cls"], self.meta["labels"] * 2)
+        _truncate(paths["boxes"], self.meta["labels"] * 16)
+
+        old = PackedDataset(root)
+        self.known = set(old.names())
+        self.shard = int(old.index["shard"].max()) if len(old) else 0
+        old.close()
+
+        self.rows = []
+        self.names = []
+        self.cls = []
+        self.boxes = []
+        self.n_labels = self.meta["labels"]
+        self.n_name_bytes = self.meta["name_bytes"]
+        path = _shard_path(root, self.shard)
+        self.offset = os.path.getsize(path) if os.path.exists(path) else 0
+        self._f = open(path, "ab")
+
+    def __contains__(self, name):
+        return name in self.known
+
+    def add(self, name, data, cls, boxes, shape=None):
+        """Append one encoded image with its labels. shape=(h, w) saves a decode."""
+        if name in self.known:
+            return False
+        raw = _encode_name(name)
+        if shape is None:
+            # The size is in the JPEG header; only decode if it can't be parsed
+            shape = _jpeg_size(data)
+            if shape is None:
+                img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+                shape = img.shape[:2] if img is not None else (0, 0)
+        if self.offset and self.offset + len(data) > self.shard_bytes:
+            self._f.close()
+            self.shard += 1
+            self.offset = 0
+            self._f = open(_shard_path(self.root, self.shard), "ab")
+
+        self._f.write(data)
+        self.rows.append((self.n_name_bytes, len(raw), self.shard, self.offset, len(data),
+                          shape[0], shape[1], self.n_labels, len(cls)))
+        self.names.append(raw)
+        self.cls.append(np.asarray(cls, np.int16))
+        self.boxes.append(np.asarray(boxes, np.float32).reshape(-1, 4))
+        self.n_labels += len(cls)
+        self.n_name_bytes += len(raw)
+        self.offset += len(data)
+        self.known.add(name)
+        return True
+
+    def close(self):
+        self._f.close()
+        if not self.rows:
+            return
+        paths = _paths(self.root)
+        with open(paths["index"], "ab") as f:
+            f.write(np.array(self.rows, dtype=INDEX_DTYPE).tobytes())
+        with open(paths["names"], "ab") as f:
+            f.write(b"".join(self.names))
+        with open(paths["cls"], "ab") as f:
+            f.write(np.concatenate(self.cls).tobytes())
+        with open(paths["boxes"], "ab") as f:
+            f.write(np.concatenate(self.boxes).tobytes())
+        # Counts last: readers see either the old pack or the complete new one
+        _write_meta(self.root, {"rows": self.meta["rows"] + len(self.rows), "labels": self.n_labels,
+                                "name_bytes": self.n_name_bytes})
+
+def _jpeg_size(data):
+    """(h, w) from the JPEG SOF marker, or None if it can't be found."""
+    data = bytes(data[:65536]) if len(data) > 65536 else bytes(data)
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker in (0xC0, 0xC1, 0xC2):
+            return int.from_bytes(data[i + 5:i + 7], "big"), int.from_bytes(data[i + 7:i + 9], "big")
+        i += 2 + int.from_bytes(data[i + 2:i + 4], "big")
+    return None
+
+def write_labels(root, labels):
+    """
+    Replace the label table of a pack. `labels` maps image name ->
+    (cls, boxes); images missing from it keep their current labels.
+    A relabel touches every row, so this one rewrites the index and labels.
+    """
+    pack = PackedDataset(root)
+    index = np.array(pack.index)
+    cls_out, boxes_out = [], []
+    start = 0
+    for i, name in enumerate(pack.names()):
+        c, b = labels[name] if name in labels else pack.labels(i)
+        c = np.asarray(c, np.int16)
+        cls_out.append(c)
+        boxes_out.append(np.asarray(b, np.float32).reshape(-1, 4))
+        index[i]["label_start"] = start
+        index[i]["label_count"] = len(c)
+        start += len(c)
+    meta = read_meta(root)
+    pack.close()
+
+    paths = _paths(root)
+    for key, arr in (("cls", np.concatenate(cls_out) if cls_out else np.zeros(0, np.int16)),
+                     ("boxes", np.concatenate(boxes_out) if boxes_out else np.zeros((0, 4), np.float32)),
+                     ("index", index)):
+        with open(paths[key] + ".tmp", "wb") as f:
+            f.write(arr.tobytes())
+        os.replace(paths[key] + ".tmp", paths[key])
+    _write_meta(root, dict(meta, labels=start))
+
+def pack_yolo_dir(images_dir, labels_dir, root, remove=False, shard_bytes=SHARD_BYTES):
+    """
+    Append every *.jpg in images_dir (with its label file, if any) to the
+    pack at root. Frames already packed are skipped. remove=True deletes
+    the loose files once the new index is written. Returns frames added.
+    """
+    images = sorted(glob.glob(os.path.join(images_dir, "*.jpg")))
+    writer = PackWriter(root, shard_bytes)
+    added = []
+    for path in images:
+        name = Path(path).name
+        if name in writer:
+            added.append(path)
+            continue
+        label_path = os.path.join(labels_dir, f"{Path(path).stem}.txt")
+        text = ""
+        if os.path.exists(label_path):
+            with open(label_path) as f:
+                text = f.read()
+        with open(path, "rb") as f:
+            data = f.read()
+        cls, boxes = parse_label_text(text)
+        writer.add(name, data, cls, boxes)
+        added.append(path)
+    writer.close()
+
+    if remove:
+        for path in added:
+            os.remove(path)
+            label_path = os.path.join(labels_dir, f"{Path(path).stem}.txt")
+            if os.path.exists(label_path):
+                os.remove(label_path)
+    return len(added)
+
+def unpack_to_yolo(root, images_dir, labels_dir):
+    """Write a pack back out as the plain YOLO images/ + labels/ layout."""
+    os.makedirs(images_dir, exist_ok=True)
+    os.makedirs(labels_dir, exist_ok=True)
+    pack = PackedDataset(root)
+    for i, name in enumerate(pack.names()):
+        with open(os.path.join(images_dir, name), "wb") as f:
+            f.write(pack.read_bytes(i))
+        cls, boxes = pack.labels(i)
+        with open(os.path.join(labels_dir, f"{Path(name).stem}.txt"), "w") as f:
+            f.write(format_label_text(cls, boxes))
+    pack.close()
+    return len(pack)
+
+# Training straight from a pack: model.train(..., trainer=PackedTrainer) with
+# data.yaml train/val pointing at pack directories (see train_cache.make_trainer).
+
+def __getattr__(name):
+    # Ultralytics is only imported when the trainer is asked for
+    if name == "PackedTrainer":
+        from train_cache import make_trainer
+        globals()["PackedTrainer"] = make_trainer(packed=True)
+        return globals()[name]
+    raise AttributeError(name)
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert between YOLO image/label folders and packed shards")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("pack", help="append a YOLO images/labels folder to a pack")
+    p.add_argument("images_dir")
+    p.add_argument("labels_dir")
+    p.add_argument("root")
+    p.add_argument("--remove", action="store_true", help="delete the loose files afterwards")
+    p.add_argument("--shard-mb", type=int, default=SHARD_BYTES // (1024 * 1024))
+    u = sub.add_parser("unpack", help="write a pack out as a YOLO images/labels folder")
+    u.add_argument("root")
+    u.add_argument("images_dir")
+    u.add_argument("labels_dir")
+    s = sub.add_parser("stats", help="print frame/box/shard counts")
+    s.add_argument("root")
+    args = parser.parse_args()
+
+    if args.cmd == "pack":
+        n = pack_yolo_dir(args.images_dir, args.labels_dir, args.root, remove=args.remove,
+                          shard_bytes=args.shard_mb * 1024 * 1024)
+        print(f"📦 Packed {n} frames into {args.root}")
+    elif args.cmd == "unpack":
+        n = unpack_to_yolo(args.root, args.images_dir, args.labels_dir)
+        print(f"📂 Unpacked {n} frames to {args.images_dir}")
+    else:
+        pack = PackedDataset(args.root)
+        shards = len(set(pack.index["shard"].tolist())) if len(pack) else 0
+        size = sum(os.path.getsize(p) for p in glob.glob(os.path.join(args.root, "shard_*.bin")))
+        print(f"{args.root}: {len(pack)} frames, {len(pack.cls)} boxes, {shards} shards, {size / 1e6:.1f} MB")
+        pack.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+import os
+import sys
+import json
+import glob
+import time
+import threading
+import statistics
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Regression check: a stage is flagged when it is this much worse than the
+# median of the previous runs in which it actually ran...
+REGRESSION_TOLERANCE = 0.25
+# ...and the difference is big enough to matter
+MIN_SECONDS_DELTA = 5.0
+MIN_RSS_DELTA_MB = 100.0
+
+def _cpu_seconds():
+    """User + system CPU of this process and its reaped children (worker pools)."""
+    if resource is None:
+        t = os.times()
+        return t.user + t.system + t.children_user + t.children_system
+    s = resource.getrusage(resource.RUSAGE_SELF)
+    c = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return s.ru_utime + s.ru_stime + c.ru_utime + c.ru_stime
+
+def _blocks_written():
+    """Block output operations (512-byte units) of this process and reaped children."""
+    if resource is None:
+        return 0
+    s = resource.getrusage(resource.RUSAGE_SELF)
+    c = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return s.ru_oublock + c.ru_oublock
+
+def _tree_rss_mb(root_pid):
+    """Resident memory of a process and all its descendants, from /proc."""
+    parents = {}
+    rss = {}
+    page = os.sysconf("SC_PAGE_SIZE")
+    for stat in glob.glob("/proc/[0-9]*/stat"):
+        try:
+            with open(stat) as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        pid = int(stat.split("/")[2])
+        parents[pid] = int(fields[1])
+        rss[pid] = int(fields[21]) * page
+    total = 0
+    for pid in rss:
+        p = pid
+        while p and p != root_pid:
+            p = parents.get(p)
+        if p == root_pid:
+            total += rss[pid]
+    return total / 1e6
+
+class StageMeter:
+    """
+    Measures one stage: wall time, CPU time (including worker processes),
+    peak RSS of the whole process tree (sampled) and bytes written.
+    """
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.peak_rss_mb = 0.0
+        self._stop = threading.Event()
+        self._proc = os.path.exists("/proc/self/stat")
+
+    def _sample(self):
+        pid = os.getpid()
+        while not self._stop.is_set():
+            self.peak_rss_mb = max(self.peak_rss_mb, _tree_rss_mb(pid))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.t0 = time.time()
+        self.cpu0 = _cpu_seconds()
+        self.blocks0 = _blocks_written()
+        if self._proc:
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall_s = time.time() - self.t0
+        self.cpu_s = _cpu_seconds() - self.cpu0
+        self.bytes_written = (_blocks_written() - self.blocks0) * 512
+        if self._proc:
+            self._stop.set()
+            self._thread.join()
+            self.peak_rss_mb = max(self.peak_rss_mb, _tree_rss_mb(os.getpid()))
+        elif resource is not None:
+            # Lifetime peak only; the best we can do without /proc
+            self.peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+    def record(self, items=None):
+        items = {k: v for k, v in (items or {}).items() if isinstance(v, (int, float))}
+        rec = {
+            "wall_s": round(self.wall_s, 2),
+            "cpu_s": round(self.cpu_s, 2),
+            "cpu_util": round(self.cpu_s / self.wall_s, 2) if self.wall_s > 0 else 0.0,
+            "peak_rss_mb": round(self.peak_rss_mb, 1),
+            "bytes_written": self.bytes_written,
+            "items": items,
+            "rates": {f"{k}_per_s": round(v / self.wall_s, 2) for k, v in items.items()
+                      if not k.startswith("bytes") and self.wall_s > 0},
+        }
+        return rec
+
+class RunReport:
+    """Per-run JSON report of every stage, compared against the previous runs."""
+
+    def __init__(self, report_dir, config=None, history=5):
+        self.report_dir = report_dir
+        self.history = history
+        self.started = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.t0 = time.time()
+        self.config = config or {}
+        self.stages = {}
+
+    def add(self, name, record):
+        self.stages[name] = record
+
+    def skipped(self, name, seconds):
+        self.stages[name] = {"skipped": True, "wall_s": round(seconds, 2)}
+
+    def previous(self):
+        paths = sorted(glob.glob(os.path.join(self.report_dir, "run_*.json")))[-self.history:]
+        runs = []
+        for path in paths:
+            try:
+                with open(path) as f:
+                    runs.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return runs
+
+    def regressions(self, runs):
+        """Stages noticeably slower, hungrier or lower-throughput than their recent median."""
+        flagged = []
+        for name, cur in self.stages.items():
+            if cur.get("skipped"):
+                continue
+            past = [r["stages"][name] for r in runs
+                    if name in r.get("stages", {}) and not r["stages"][name].get("skipped")]
+            if not past:
+                continue
+            checks = [("wall_s", MIN_SECONDS_DELTA), ("cpu_s", MIN_SECONDS_DELTA),
+                      ("peak_rss_mb", MIN_RSS_DELTA_MB)]
+            for key, min_delta in checks:
+                base = statistics.median(p[key] for p in past)
+                if cur[key] > base * (1 + REGRESSION_TOLERANCE) and cur[key] - base > min_delta:
+                    flagged.append({"stage": name, "metric": key, "value": cur[key], "median": base})
+            for key, value in cur["rates"].items():
+                vals = [p["rates"][key] for p in past if key in p.get("rates", {})]
+                if not vals:
+                    continue
+                base = statistics.median(vals)
+                if value < base * (1 - REGRESSION_TOLERANCE):
+                    flagged.append({"stage": name, "metric": key, "value": value, "median": base})
+        return flagged
+
+    def save(self, status="ok"):
+        os.makedirs(self.report_dir, exist_ok=True)
+        runs = self.previous()
+        report = {
+            "started": self.started,
+            "status": status,
+            "wall_s": round(time.time() - self.t0, 2),
+            "config": self.config,
+            "stages": self.stages,
+            "compared_to": [r["started"] for r in runs],
+            "regressions": self.regressions(runs),
+        }
+        path = os.path.join(self.report_dir, f"run_{time.strftime('%Y%m%d_%H%M%S')}.json")
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print_report(report)
+        print(f"📊 Performance report: {path}")
+        return report
+
+def print_report(report):
+    print(f"{'stage':14s} {'wall':>9s} {'cpu':>9s} {'util':>5s} {'peak MB':>8s} {'written MB':>10s}  items/s")
+    for name, st in report["stages"].items():
+        if st.get("skipped"):
+            print(f"{name:14s} {'skipped':>9s}")
+            continue
+        rates = ", ".join(f"{k[:-6]} {v:g}" for k, v in st["rates"].items())
+        print(f"{name:14s} {st['wall_s']:>8.1f}s {st['cpu_s']:>8.1f}s {st['cpu_util']:>5.1f} "
+              f"{st['peak_rss_mb']:>8.0f} {st['bytes_written'] / 1e6:>10.1f}  {rates}")
+    for r in report["regressions"]:
+        print(f"⚠️ Regression: {r['stage']} {r['metric']} = {r['value']:g} (median of last runs {r['median']:g})")
+
+if __name__ == "__main__":
+    # Show a stored report: python perf_report.py [perf_reports/run_....json]
+    paths = sys.argv[1:] or sorted(glob.glob(os.path.join("perf_reports", "run_*.json")))[-1:]
+    for path in paths:
+        with open(path) as f:
+            print_report(json.load(f))
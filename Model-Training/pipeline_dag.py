@@ -0,0 +1,176 @@
+import os
+import sys
+import json
+import time
+import hashlib
+
+from perf_report import StageMeter
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes; the droplet has fcntl
+    fcntl = None
+
+# Files up to this size are fingerprinted by content; larger ones (videos,
+# shards, weights) by size + mtime, which is what changes when they're rewritten.
+CONTENT_HASH_MAX = 1 << 20
+
+def _file_fingerprint(h, path, st):
+    h.update(f"{path}:{st.st_size}".encode())
+    if st.st_size <= CONTENT_HASH_MAX:
+        with open(path, "rb") as f:
+            h.update(hashlib.blake2b(f.read(), digest_size=16).digest())
+    else:
+        h.update(str(st.st_mtime_ns).encode())
+
+def _walk(h, path):
+    with os.scandir(path) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    for e in entries:
+        if e.is_dir(follow_symlinks=False):
+            _walk(h, e.path)
+        elif e.is_file():
+            st = e.stat()
+            # Directory contents: stat only, content hashing 100k frames would take minutes
+            h.update(f"{e.path}:{st.st_size}:{st.st_mtime_ns}".encode())
+
+def fingerprint(inputs, params=None):
+    """Hash of the input files/directories (missing ones count too) and the params."""
+    h = hashlib.blake2b(digest_size=16)
+    for path in inputs:
+        if os.path.isdir(path):
+            h.update(f"dir:{path}".encode())
+            _walk(h, path)
+        elif os.path.isfile(path):
+            _file_fingerprint(h, path, os.stat(path))
+        else:
+            h.update(f"missing:{path}".encode())
+    h.update(json.dumps(params or {}, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+class Stage:
+    """
+    One pipeline step. inputs/outputs are paths (or a callable returning
+    paths, evaluated when the stage is reached, after upstream stages ran).
+    always=True stages run every time (e.g. syncing from a remote stage,
+    whose contents can't be fingerprinted locally).
+    """
+
+    def __init__(self, name, run, inputs=(), outputs=(), params=None, always=False):
+        self.name = name
+        self.run = run
+        self.inputs = inputs
+        self.outputs = outputs
+        self.params = params
+        self.always = always
+
+    def _resolve(self, value):
+        return list(value() if callable(value) else value)
+
+    def fingerprint(self):
+        params = self.params() if callable(self.params) else self.params
+        return fingerprint(self._resolve(self.inputs), params)
+
+    def outputs_exist(self):
+        return all(os.path.exists(p) for p in self._resolve(self.outputs))
+
+class LockHeld(RuntimeError):
+    pass
+
+class PipelineLock:
+    """Non-blocking exclusive lock so overlapping cron runs bail out instead of racing."""
+
+    def __init__(self, path):
+        self.path = path
+        self._f = None
+
+    def __enter__(self):
+        self._f = open(self.path, "a+")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._f.seek(0)
+                holder = self._f.read().strip()
+                self._f.close()
+                raise LockHeld(f"another pipeline run holds {self.path} ({holder or 'unknown pid'})")
+        self._f.seek(0)
+        self._f.truncate()
+        self._f.write(f"pid {os.getpid()} since {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
+        self._f.flush()
+        return self
+
+    def __exit__(self, *exc):
+        # The lock dies with the process anyway; the file is left for the next run
+        self._f.close()
+
+class Pipeline:
+    """
+    Runs stages in order, skipping those whose input fingerprint matches the
+    last successful run and whose outputs still exist. State is saved after
+    every stage, so a crashed run resumes at the stage that failed.
+    """
+
+    def __init__(self, stages, state_path):
+        self.stages = stages
+        self.state_path = state_path
+        self.state = {}
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                self.state = json.load(f)
+
+    def _save(self):
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp, self.state_path)
+
+    def run(self, force=(), report=None):
+        """Run the stages; a RunReport gets per-stage timings and the counts each stage returns."""
+        start = time.time()
+        for stage in self.stages:
+            t0 = time.time()
+            fp = stage.fingerprint()
+            prev = self.state.get(stage.name, {})
+            if (not stage.always and stage.name not in force and prev.get("fingerprint") == fp
+                    and stage.outputs_exist()):
+                print(f"⏭️ {stage.name}: inputs unchanged, skipped ({time.time() - t0:.1f}s to check)")
+                if report is not None:
+                    report.skipped(stage.name, time.time() - t0)
+                continue
+
+            print(f"▶️ {stage.name}")
+            result = None
+            try:
+                with StageMeter() as meter:
+                    result = stage.run()
+            finally:
+                if report is not None:
+                    rec = meter.record(result if isinstance(result, dict) else None)
+                    if result is None and sys.exc_info()[0] is not None:
+                        rec["failed"] = True
+                    report.add(stage.name, rec)
+            self.state[stage.name] = {
+                "fingerprint": fp,
+                "finished_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "seconds": round(time.time() - t0, 1),
+            }
+            self._save()
+        print(f"⏱️ Pipeline took {time.time() - start:.1f}s")
+
+def run_locked(stages, state_path, lock_path, force=(), report=None):
+    """Run the pipeline under the lock; returns False if another run holds it."""
+    try:
+        with PipelineLock(lock_path):
+            Pipeline(stages, state_path).run(force, report)
+    except LockHeld as e:
+        print(f"🔒 {e}, exiting.")
+        return False
+    return True
+
+if __name__ == "__main__":
+    # Print the stored state: python pipeline_dag.py datasets/pipeline_state.json
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join("datasets", "pipeline_state.json")
+    with open(path) as f:
+        for name, st in json.load(f).items():
+            print(f"{name:12s} {st['finished_at']}  {st['seconds']:>8.1f}s  {st['fingerprint']}")
@@ -1,8 +1,17 @@
 import os
+import time
+import concurrent.futures
+from pathlib import Path
+import cv2
+import numpy as np
 import snowflake.connector
 from dotenv import load_dotenv
 from ultralytics import YOLO
 import glob
+from stage_sync import open_backend, sync
+from detection_store import empty_columns, write_detections, open_store
+from cpu_governor import CpuGovernor
+from incremental import deployed_model
 
 # Load environment variables
 load_dotenv()
@@ -17,6 +26,22 @@ STAGE_NAME = "@VIDEO_STAGE"
 
 TEST_DIR = "datasets/test"
 os.makedirs(TEST_DIR, exist_ok=True)
+TEST_VIDEOS = int(os.getenv("TEST_VIDEOS", "1"))
+
+# Every video in TEST_DIR is run through the model across a process pool
+# (PREDICT_WORKERS, default from the core budget) and its detections go to a
+# columnar store (detection_store.py). Videos already in the store for the
+# same weights are skipped. RENDER_VIDEO=1 also writes annotated videos to
+# inference_demo/, which is by far the slowest part.
+DETECTIONS_DIR = os.path.join("inference_demo", "detections")
+PREDICT_WORKERS = int(os.getenv("PREDICT_WORKERS", "0"))
+PREDICT_STRIDE = int(os.getenv("PREDICT_STRIDE", "1"))
+RENDER_VIDEO = os.getenv("RENDER_VIDEO", "0") == "1"
+# INFERENCE_SERVER=1 sends frames to the inference daemon (inference_server.py)
+# instead of loading the model in every worker: workers only decode, and the
+# daemon batches their frames on its one warm model. RENDER_VIDEO is ignored then.
+INFERENCE_SERVER = os.getenv("INFERENCE_SERVER", "0") == "1"
+GOV = CpuGovernor()
 
 def connect_to_snowflake():
     try:
@@ -34,51 +59,203 @@ def connect_to_snowflake():
         return None
 
 def download_latest_video():
-    """Download ONE video for testing"""
-    conn = connect_to_snowflake()
-    if not conn: return None
-    
-    cursor = conn.cursor()
+    """Download the newest TEST_VIDEOS videos for testing"""
+    backend = open_backend(connect_to_snowflake, STAGE_NAME)
     try:
-        print("⬇️ Downloading ONE test video...")
-        # Just grab the latest one
-        cursor.execute(f"GET {STAGE_NAME} file://{os.path.abspath(TEST_DIR)}")
+        print(f"⬇️ Downloading {TEST_VIDEOS} test video(s)...")
+        # Just grab the latest ones (skipped if we already have them)
+        fetched = sync(backend, TEST_DIR, pattern=r".*\.webm", newest=TEST_VIDEOS, workers=1)
         print("✅ Download complete.")
+        return fetched[0] if fetched else None
     finally:
-        cursor.close()
-        conn.close()
+        backend.close()
 
-def run_inference():
-    """Run model on the downloaded video"""
-    # Find the trained model
-    # Usually in runs/detect/cpu_run/weights/best.pt
-    model_path = "biathlon_model/cpu_run/weights/best.pt"
-    
-    if not os.path.exists(model_path):
-        print(f"⚠️ Model not found at {model_path}. Using 'yolov8n.pt' for demo.")
+def find_model():
+    """The promoted model from incremental training, else the last full run"""
+    model_path = deployed_model()
+    if model_path is None:
+        print("⚠️ No trained model found. Using 'yolov8n.pt' for demo.")
         model_path = "yolov8n.pt"
+    return model_path
+
+_model = None
+_client = None
+_names = None
+
+def _init_predict_worker(model_path, threads):
+    # Loaded once per process, not per video
+    import torch
+    torch.set_num_threads(threads)
+    cv2.setNumThreads(1)
+    os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = "threads;1"
+    global _model, _names
+    _model = YOLO(model_path)
+    _names = {str(k): v for k, v in _model.names.items()}
+
+def _init_remote_worker():
+    # One daemon connection per process; the process itself only decodes
+    from inference_server import InferenceClient
+    cv2.setNumThreads(1)
+    os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = "threads;1"
+    global _client, _names
+    _client = InferenceClient()
+    _names = _client.health()["names"]
+
+def _position(cap, frame, fps):
+    # Container timestamp: browser-recorded webm is variable-frame-rate and
+    # often reports a bogus CAP_PROP_FPS, so frame / fps is only the fallback
+    msec = cap.get(cv2.CAP_PROP_POS_MSEC)
+    return msec / 1000.0 if msec and msec > 0 else frame / fps
 
-    print(f"🧠 Loading Model: {model_path}")
-    model = YOLO(model_path)
+def _strided_frames(video_path, fps, decode=True):
+    """(frame index, seconds, BGR frame or None) for the frames vid_stride picks: skip stride-1, take the next"""
+    cap = cv2.VideoCapture(video_path)
+    frame = -1
+    try:
+        while True:
+            if not all(cap.grab() for _ in range(PREDICT_STRIDE - 1)):
+                break
+            ret, img = cap.read() if decode else (cap.grab(), None)
+            if not ret:
+                break
+            frame += PREDICT_STRIDE
+            yield frame, _position(cap, frame, fps), img
+    finally:
+        cap.release()
+
+def _predict_frame(img):
+    """(cls, conf, xyxy) for one frame, from the inference daemon or the model in this process"""
+    if _client is not None:
+        det = _client.predict(img)
+        return np.array(det["cls"]), np.array(det["conf"]), np.array(det["boxes"], np.float32).reshape(-1, 4)
+    # device='cpu' for Droplet compatibility
+    boxes = _model.predict(img, device='cpu', verbose=False)[0].boxes.cpu().numpy()
+    return boxes.cls, boxes.conf, boxes.xyxy
+
+def _results(video_path, fps):
+    """(frame index, seconds, cls, conf, xyxy) per strided frame"""
+    if not RENDER_VIDEO or _client is not None:
+        for frame, t, img in _strided_frames(video_path, fps):
+            yield (frame, t) + _predict_frame(img)
+        return
 
-    # Find video
-    videos = glob.glob(os.path.join(TEST_DIR, "*.webm"))
+    # Rendering needs Ultralytics to read the video itself; a grab-only
+    # capture walks the same frames alongside for their timestamps
+    results = _model.predict(source=video_path, stream=True, device='cpu', verbose=False,
+                             vid_stride=PREDICT_STRIDE, save=True, project="inference_demo",
+                             name=Path(video_path).stem, exist_ok=True)
+    stamps = _strided_frames(video_path, fps, decode=False)
+    for i, result in enumerate(results):
+        boxes = result.boxes.cpu().numpy()
+        # Ultralytics grabs vid_stride frames before each retrieve, so result i is frame (i+1)*stride-1
+        frame = (i + 1) * PREDICT_STRIDE - 1
+        stamp = next(stamps, None)
+        yield frame, stamp[1] if stamp else frame / fps, boxes.cls, boxes.conf, boxes.xyxy
+
+def predict_video(video_path):
+    """Worker function: (video info, detection columns, class names) for one video"""
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    if not fps or fps <= 0 or fps > 1000:
+        fps = 30.0
+    width, height = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    parts = {c: [] for c in ("frame", "time", "cls", "conf", "boxes")}
+    frames = 0
+    first = last = None
+    for frame, t, cls, conf, xyxy in _results(video_path, fps):
+        frames += 1
+        first = first or (frame, t)
+        last = (frame, t)
+        if not len(cls):
+            continue
+        parts["frame"].append(np.full(len(cls), frame, np.uint32))
+        parts["time"].append(np.full(len(cls), t, np.float32))
+        parts["cls"].append(cls.astype(np.int16))
+        parts["conf"].append(conf.astype(np.float32))
+        parts["boxes"].append(xyxy.astype(np.float32))
+
+    # The header's frame rate can be bogus for variable-frame-rate webm; the
+    # timestamps we walked give the real average
+    if first and last[1] > first[1]:
+        fps = (last[0] - first[0]) / (last[1] - first[1])
+
+    cols = empty_columns()
+    for c, arrs in parts.items():
+        if arrs:
+            cols[c] = np.concatenate(arrs)
+    # WebM headers often carry no frame count; fall back to what the stride implies
+    info = {"name": Path(video_path).name, "frames": total if total > 0 else frames * PREDICT_STRIDE, "fps": fps,
+            "width": width, "height": height}
+    return info, cols, _names
+
+def run_inference():
+    """Run the model over every test video and store the detections"""
+    if INFERENCE_SERVER:
+        from inference_server import InferenceClient
+        client = InferenceClient()
+        model_path = client.health()["model"]
+        client.close()
+    else:
+        model_path = find_model()
+    videos = sorted(glob.glob(os.path.join(TEST_DIR, "*.webm")))
     if not videos:
         print("❌ No videos found in datasets/test")
         return
 
-    target_video = videos[0] # Pick first
-    print(f"🎥 Running Inference on: {target_video} (Stream Mode)")
+    # Same weights as the stored run: only predict videos it doesn't have
+    # (version 3: frame indices as vid_stride picks them, times from container timestamps)
+    model_id = {"model": model_path, "mtime": os.path.getmtime(model_path) if os.path.exists(model_path) else 0,
+                "stride": PREDICT_STRIDE, "version": 3}
+    store = open_store(DETECTIONS_DIR)
+    kept = []
+    names = {}
+    if store is not None and {k: store.meta.get(k) for k in model_id} == model_id:
+        names = store.meta.get("names", {})
+        have = set(store.videos())
+        kept = [(store.info(n), store.video(n)) for n in store.videos() if os.path.join(TEST_DIR, n) in videos]
+        videos = [v for v in videos if Path(v).name not in have]
+    if not videos:
+        print(f"✅ All test videos already predicted with {model_path}.")
+        return
 
-    # Predict and Save with Stream to save RAM
-    # device='cpu' for Droplet compatibility
-    results_generator = model.predict(source=target_video, save=True, project="inference_demo", name="demo_run", device='cpu', exist_ok=True, stream=True)
-    
-    # Iterate through generator to process frames
-    for result in results_generator:
-        pass # The loop triggers the processing and saving
-    
-    print(f"✨ Inference Complete! Video processed.")
+    b = GOV.budget("predict")
+    workers = min(len(videos), PREDICT_WORKERS or b["procs"])
+    threads = max(1, GOV.cpus // workers)
+    if INFERENCE_SERVER:
+        init, initargs = _init_remote_worker, ()
+        print(f"🧠 Predicting {len(videos)} videos with {model_path} through the inference daemon "
+              f"({workers} decoding processes)...")
+    else:
+        init, initargs = _init_predict_worker, (model_path, threads)
+        print(f"🧠 Predicting {len(videos)} videos with {model_path} on {workers} processes x {threads} threads "
+              f"(render {'on' if RENDER_VIDEO else 'off'})...")
+
+    start = time.time()
+    done = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init,
+                                                initargs=initargs) as executor:
+        futures = {executor.submit(predict_video, v): v for v in videos}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                info, cols, names = future.result()
+            except Exception as e:
+                print(f"❌ Error predicting {futures[future]}: {e}")
+                continue
+            done.append((info, cols))
+            print(f"🎥 [{len(done)}/{len(videos)}] {info['name']}: {len(cols['cls'])} detections "
+                  f"in {info['frames']} frames")
+
+    # Copy the kept rows out of the memory-mapped store before replacing it
+    kept = [(info, {c: np.array(a) for c, a in cols.items()}) for info, cols in kept]
+    results = sorted(kept + done, key=lambda r: r[0]["name"])
+    write_detections(DETECTIONS_DIR, results, dict(model_id, names=names))
+    frames = sum(info["frames"] for info, _ in done)
+    elapsed = time.time() - start
+    print(f"✨ Inference Complete! {frames} frames in {elapsed:.1f}s "
+          f"({frames / elapsed if elapsed > 0 else 0:.1f} frames/s) -> {DETECTIONS_DIR}")
 
 def main():
     print("🚀 Starting Proof of Intelligence Demo")
@@ -0,0 +1,191 @@
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import threading
+import concurrent.futures
+from email.utils import parsedate_to_datetime
+
+MANIFEST_NAME = ".stage_manifest.json"
+
+class StageFile:
+    """One remote file as reported by the backend's listing."""
+
+    def __init__(self, name, size, md5, last_modified):
+        self.name = name                    # path relative to the stage root
+        self.size = int(size)
+        self.md5 = md5
+        self.last_modified = float(last_modified)   # epoch seconds
+
+    def to_dict(self):
+        return {"size": self.size, "md5": self.md5, "last_modified": self.last_modified}
+
+# ==========================================
+# BACKENDS
+# ==========================================
+class SnowflakeStageBackend:
+    """Snowflake internal stage (LIST / GET)."""
+
+    def __init__(self, connect, stage_name):
+        self.connect = connect
+        self.stage_name = stage_name
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        with self._lock:
+            if self._conn is None:
+                self._conn = self.connect()
+            return self._conn
+
+    def list(self):
+        conn = self._connection()
+        if not conn:
+            return []
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"LIST {self.stage_name}")
+            files = []
+            for name, size, md5, last_modified in cursor.fetchall():
+                # LIST returns "<stage>/<path>"; GET wants just <path>
+                rel = name.split("/", 1)[1] if "/" in name else name
+                modified = parsedate_to_datetime(last_modified).timestamp()
+                files.append(StageFile(rel, size, md5, modified))
+            return files
+        finally:
+            cursor.close()
+
+    def fetch(self, name, dest_dir):
+        # Connections are shared across threads; each download gets its own cursor
+        cursor = self._connection().cursor()
+        try:
+            cursor.execute(f"GET '{self.stage_name}/{name}' 'file://{os.path.abspath(dest_dir)}'")
+        finally:
+            cursor.close()
+        return os.path.join(dest_dir, os.path.basename(name))
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+class LocalDirBackend:
+    """A plain directory standing in for the stage (testing / offline runs)."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def list(self):
+        files = []
+        for dirpath, _, names in os.walk(self.root):
+            for n in names:
+                path = os.path.join(dirpath, n)
+                st = os.stat(path)
+                files.append(StageFile(os.path.relpath(path, self.root), st.st_size,
+                                       file_md5(path), st.st_mtime))
+        return files
+
+    def fetch(self, name, dest_dir):
+        dest = os.path.join(dest_dir, os.path.basename(name))
+        shutil.copy2(os.path.join(self.root, name), dest)
+        return dest
+
+    def close(self):
+        pass
+
+def file_md5(path, chunk=1 << 20):
+    h = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+# ==========================================
+# MANIFEST
+# ==========================================
+def load_manifest(dest_dir):
+    path = os.path.join(dest_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {"files": {}, "watermark": 0.0}
+    with open(path) as f:
+        return json.load(f)
+
+def save_manifest(dest_dir, manifest):
+    path = os.path.join(dest_dir, MANIFEST_NAME)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+def is_current(entry, remote, dest_dir):
+    """True if the manifest entry describes the same remote version and it's on disk."""
+    if entry is None:
+        return False
+    if entry["size"] != remote.size or entry["md5"] != remote.md5:
+        return False
+    return os.path.exists(os.path.join(dest_dir, entry["local"]))
+
+def sync(backend, dest_dir, pattern=r".*\.webm", newest=None, since=None, workers=4):
+    """
+    Bring dest_dir up to date with the stage.
+
+    Only files that are new or changed since the last sync are fetched.
+    `newest` keeps just the N most recently modified matches; `since`
+    (epoch seconds, or "watermark" for the newest file of the previous
+    sync) drops anything older. Returns the local paths that were fetched.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    manifest = load_manifest(dest_dir)
+    if since == "watermark":
+        since = manifest.get("watermark", 0.0)
+
+    regex = re.compile(pattern)
+    remote = [f for f in backend.list() if regex.fullmatch(os.path.basename(f.name))]
+    remote.sort(key=lambda f: f.last_modified, reverse=True)
+    if since is not None:
+        remote = [f for f in remote if f.last_modified > since]
+    if newest is not None:
+        if len(remote) > newest:
+            print(f"⚠️ Only the newest {newest} of {len(remote)} matching files are considered; "
+                  f"{len(remote) - newest} older ones are skipped.")
+        remote = remote[:newest]
+
+    todo = [f for f in remote if not is_current(manifest["files"].get(f.name), f, dest_dir)]
+    print(f"🔍 {len(remote)} selected files on stage, {len(todo)} new or changed.")
+
+    fetched = []
+    total_bytes = 0
+    start = time.time()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(backend.fetch, f.name, dest_dir): f for f in todo}
+        for future in concurrent.futures.as_completed(futures):
+            f = futures[future]
+            try:
+                local = future.result()
+            except Exception as e:
+                print(f"❌ Failed to fetch {f.name}: {e}")
+                continue
+            entry = f.to_dict()
+            entry["local"] = os.path.relpath(local, dest_dir)
+            entry["synced_at"] = time.time()
+            manifest["files"][f.name] = entry
+            fetched.append(local)
+            total_bytes += f.size
+
+    # Only advance the watermark past files we actually hold
+    synced = [f.last_modified for f in remote if is_current(manifest["files"].get(f.name), f, dest_dir)]
+    if synced:
+        manifest["watermark"] = max(manifest.get("watermark", 0.0), max(synced))
+    save_manifest(dest_dir, manifest)
+
+    elapsed = time.time() - start
+    print(f"✅ Synced {len(fetched)} files ({total_bytes / 1e6:.1f} MB) in {elapsed:.1f}s.")
+    return fetched
+
+def open_backend(connect, stage_name):
+    """STAGE_BACKEND=local with LOCAL_STAGE_DIR=<dir> swaps Snowflake for a directory."""
+    if os.getenv("STAGE_BACKEND", "snowflake") == "local":
+        return LocalDirBackend(os.getenv("LOCAL_STAGE_DIR", "local_stage"))
+    return SnowflakeStageBackend(connect, stage_name)
@@ -0,0 +1,131 @@
+import queue
+import threading
+import concurrent.futures
+
+# Sent by an extraction worker after its last frame of a chunk (success or not).
+# Frames travel through the same queue, so once every chunk's marker has
+# arrived, every frame has too.
+CHUNK_DONE = "__chunk_done__"
+
+class LabelDispatcher:
+    """
+    Groups streamed frame paths into batches and hands them to a labeling
+    executor. At most max_inflight batches run at once; add() blocks beyond
+    that, which stops the queue being drained and in turn blocks extraction
+    workers on put() - the back-pressure that bounds memory and disk lag.
+    Frames with a cached label (LabelCache) are restored instead of labeled.
+    """
+
+    def __init__(self, executor, fn, args=(), batch_size=64, max_inflight=4,
+                 cache=None, key=None, labels_dir=None):
+        self.executor = executor
+        self.fn = fn
+        self.args = args
+        self.batch_size = batch_size
+        self.max_inflight = max_inflight
+        self.cache = cache
+        self.key = key
+        self.labels_dir = labels_dir
+        self.batch = []
+        self.inflight = {}
+        self.results = []
+        self.labeled = []
+        self.hits = 0
+        self.errors = 0
+
+    def add(self, path):
+        self.batch.append(path)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+        batch, self.batch = self.batch, []
+        if self.cache is not None:
+            misses = self.cache.restore(batch, self.key, self.labels_dir)
+            self.hits += len(batch) - len(misses)
+            batch = misses
+        if not batch:
+            return
+        while len(self.inflight) >= self.max_inflight:
+            self._reap(concurrent.futures.FIRST_COMPLETED)
+        self.inflight[self.executor.submit(self.fn, batch, *self.args)] = batch
+
+    def poll(self):
+        """Collect finished batches without blocking."""
+        self._reap(None, timeout=0)
+
+    def _reap(self, return_when, timeout=None):
+        if not self.inflight:
+            return
+        done, _ = concurrent.futures.wait(list(self.inflight), timeout=timeout,
+                                          return_when=return_when or concurrent.futures.ALL_COMPLETED)
+        for future in done:
+            batch = self.inflight.pop(future)
+            try:
+                self.results.append(future.result())
+                self.labeled.extend(batch)
+            except Exception as e:
+                self.errors += 1
+                print(f"❌ Labeling batch failed: {e}")
+
+    def finish(self):
+        """Label the last partial batch and wait for everything in flight."""
+        self.flush()
+        self._reap(concurrent.futures.ALL_COMPLETED)
+        if self.cache is not None and self.labeled:
+            self.cache.store(self.labeled, self.key, self.labels_dir)
+
+def _drain(frame_queue, futures):
+    # Unblock workers stuck on put() until they have all exited
+    while not all(f.done() for f in futures):
+        try:
+            frame_queue.get(timeout=0.2)
+        except queue.Empty:
+            pass
+
+def pump_frames(frame_queue, futures, dispatcher, on_chunk, idle_rounds=3, poll=1.0):
+    """
+    Feed frames from the extraction queue to the dispatcher until every
+    chunk is done. on_chunk(future) is called once per finished chunk.
+    On any error (or Ctrl-C) pending chunks are cancelled and the queue is
+    drained in the background so blocked workers can exit, then it re-raises.
+    """
+    remaining = len(futures)
+    reported = set()
+    idle = 0
+
+    def report():
+        for f in futures:
+            if f.done() and f not in reported:
+                reported.add(f)
+                on_chunk(f)
+
+    try:
+        while remaining:
+            try:
+                item = frame_queue.get(timeout=poll)
+            except queue.Empty:
+                # Nothing arriving: don't let a partial batch sit idle
+                dispatcher.flush()
+                dispatcher.poll()
+                report()
+                # A worker that died hard never sends its marker
+                idle = idle + 1 if len(reported) == len(futures) else 0
+                if idle >= idle_rounds:
+                    break
+                continue
+            idle = 0
+            if item == CHUNK_DONE:
+                remaining -= 1
+                report()
+            else:
+                dispatcher.add(item)
+        report()
+        dispatcher.finish()
+    except BaseException:
+        for f in futures:
+            f.cancel()
+        threading.Thread(target=_drain, args=(frame_queue, futures), daemon=True).start()
+        raise
@@ -0,0 +1,324 @@
+import os
+import math
+import glob
+import shutil
+import concurrent.futures
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+# Decoded cache layout: <path>.u8 holds the BGR pixels of every frame back
+# to back, <path>.idx.npy one row per frame (see DECODED_DTYPE).
+DECODED_DTYPE = np.dtype([
+    ("name", "U96"),
+    ("offset", "<u8"),
+    ("height", "<u2"),
+    ("width", "<u2"),
+])
+
+def train_shape(h, w, imgsz):
+    """(h, w) after Ultralytics' rect resize: long side to imgsz, aspect kept."""
+    r = imgsz / max(h, w)
+    if r == 1:
+        return h, w
+    return min(math.ceil(h * r), imgsz), min(math.ceil(w * r), imgsz)
+
+def resize_for_training(img, imgsz):
+    """
+    Shrink a frame to the size the trainer would resize it to anyway. The
+    aspect ratio is kept, so normalised YOLO labels stay valid and the
+    trainer's own resize becomes a no-op. Frames are never upscaled.
+    """
+    h0, w0 = img.shape[:2]
+    if max(h0, w0) <= imgsz:
+        return img
+    h, w = train_shape(h0, w0, imgsz)
+    return cv2.resize(img, (w, h), interpolation=cv2.INTER_AREA)
+
+def _resize_file(src, dst, imgsz):
+    img = cv2.imread(src)
+    if img is None:
+        return False
+    cv2.imwrite(dst, resize_for_training(img, imgsz))
+    return True
+
+def resize_store(src_images, src_labels, dst_images, dst_labels, imgsz, workers=8):
+    """
+    Seed a frame store for a new imgsz from an existing one: frames are
+    resized, label files copied unchanged. Frames already present are skipped.
+    """
+    os.makedirs(dst_images, exist_ok=True)
+    os.makedirs(dst_labels, exist_ok=True)
+    todo = []
+    for src in glob.glob(os.path.join(src_images, "*.jpg")):
+        dst = os.path.join(dst_images, Path(src).name)
+        if not os.path.exists(dst):
+            todo.append((src, dst))
+
+    # cv2 releases the GIL, threads are enough
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        ok = list(pool.map(lambda job: _resize_file(job[0], job[1], imgsz), todo))
+
+    for (src, _), done in zip(todo, ok):
+        label = os.path.join(src_labels, f"{Path(src).stem}.txt")
+        if done and os.path.exists(label):
+            shutil.copyfile(label, os.path.join(dst_labels, Path(label).name))
+    return sum(ok)
+
+def resize_pack(pack_root, dst_images, dst_labels, imgsz):
+    """resize_store() for a packed source: frames come out as loose resized JPEGs + labels."""
+    from packed_dataset import PackedDataset, format_label_text
+    os.makedirs(dst_images, exist_ok=True)
+    os.makedirs(dst_labels, exist_ok=True)
+    pack = PackedDataset(pack_root)
+    rows = [i for i, n in enumerate(pack.names()) if not os.path.exists(os.path.join(dst_images, n))]
+    for i in rows:
+        name = pack.name(i)
+        img = pack.image(i)
+        if img is None:
+            continue
+        cv2.imwrite(os.path.join(dst_images, name), resize_for_training(img, imgsz))
+        cls, boxes = pack.labels(i)
+        with open(os.path.join(dst_labels, f"{Path(name).stem}.txt"), "w") as f:
+            f.write(format_label_text(cls, boxes))
+    pack.close()
+    return len(rows)
+
+class DecodedCache:
+    """
+    Decoded uint8 frames in one memory-mapped file, so training epochs skip
+    JPEG decoding entirely. Append-only; the index is swapped in atomically.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        idx = path + ".idx.npy"
+        self.index = np.load(idx) if os.path.exists(idx) else np.zeros(0, DECODED_DTYPE)
+        self.rows = {n: i for i, n in enumerate(self.index["name"].tolist())}
+        self._mm = None
+        self._pid = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, name):
+        return name in self.rows
+
+    def _map(self):
+        if self._pid != os.getpid():
+            self._mm = np.memmap(self.path + ".u8", dtype=np.uint8, mode="r")
+            self._pid = os.getpid()
+        return self._mm
+
+    def get(self, name):
+        """Copy of the frame (augmentations work in place), or None if not cached."""
+        i = self.rows.get(name)
+        if i is None:
+            return None
+        r = self.index[i]
+        h, w, off = int(r["height"]), int(r["width"]), int(r["offset"])
+        return np.array(self._map()[off:off + h * w * 3]).reshape(h, w, 3)
+
+    def append(self, frames):
+        """Add (name, BGR image) pairs not cached yet. Returns frames added."""
+        data_path = self.path + ".u8"
+        offset = os.path.getsize(data_path) if os.path.exists(data_path) else 0
+        rows = []
+        with open(data_path, "ab") as f:
+            for name, img in frames:
+                if name in self.rows:
+                    continue
+                img = np.ascontiguousarray(img, dtype=np.uint8)
+                f.write(img.tobytes())
+                rows.append((name, offset, img.shape[0], img.shape[1]))
+                self.rows[name] = len(self.index) + len(rows) - 1
+                offset += img.nbytes
+        if rows:
+            self.index = np.concatenate([self.index, np.array(rows, dtype=DECODED_DTYPE)])
+            tmp = self.path + ".idx.tmp.npy"
+            np.save(tmp, self.index)
+            os.replace(tmp, self.path + ".idx.npy")
+            self._pid = None  # file grew, remap on next get()
+        return len(rows)
+
+def _decode(path, imgsz):
+    img = cv2.imread(path)
+    return Path(path).name, (resize_for_training(img, imgsz) if img is not None else None)
+
+def build_decoded_cache(path, imgsz, images=None, pack_root=None, threads=4):
+    """
+    Add frames (loose JPEG paths and/or every row of a pack) to the decoded
+    cache at path, resized to imgsz. Returns (frames added, cache size).
+    """
+    cache = DecodedCache(path)
+
+    def frames():
+        if images:
+            todo = [p for p in images if Path(p).name not in cache]
+            with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as pool:
+                for name, img in pool.map(lambda p: _decode(p, imgsz), todo):
+                    if img is not None:
+                        yield name, img
+        if pack_root:
+            from packed_dataset import PackedDataset
+            pack = PackedDataset(pack_root)
+            rows = [i for i, n in enumerate(pack.names()) if n not in cache]
+            for name, img in pack.iter_images(rows):
+                yield name, resize_for_training(img, imgsz)
+            pack.close()
+
+    added = cache.append(frames())
+    return added, len(cache)
+
+# ---- Ultralytics integration ----
+# make_trainer() returns a DetectionTrainer subclass for model.train(trainer=...)
+# that reads frames from a pack and/or the decoded cache instead of loose JPEGs.
+
+def _yolo_classes():
+    from ultralytics.data import YOLODataset
+    from ultralytics.models.yolo.detect import DetectionTrainer, DetectionValidator
+    from ultralytics.utils import torch_utils
+    # Renamed in ultralytics 8.3.200
+    unwrap_model = getattr(torch_utils, "unwrap_model", None) or torch_utils.de_parallel
+
+    class CachedYOLODataset(YOLODataset):
+        """YOLODataset that asks read_image() for frames; decoded-cache hits skip decoding."""
+
+        decoded = None
+
+        def read_image(self, i):
+            if self.decoded is not None:
+                im = self.decoded.get(Path(self.im_files[i]).name)
+                if im is not None:
+                    return im
+            return cv2.imread(self.im_files[i])
+
+        def load_image(self, i, rect_mode=True):
+            if self.ims[i] is not None:
+                return self.ims[i], self.im_hw0[i], self.im_hw[i]
+            im = self.read_image(i)
+            if im is None:
+                raise FileNotFoundError(f"Image Not Found {self.im_files[i]}")
+            h0, w0 = im.shape[:2]
+            if rect_mode:
+                h, w = train_shape(h0, w0, self.imgsz)
+                if (h, w) != (h0, w0):
+                    im = cv2.resize(im, (w, h), interpolation=cv2.INTER_LINEAR)
+            elif not (h0 == w0 == self.imgsz):
+                im = cv2.resize(im, (self.imgsz, self.imgsz), interpolation=cv2.INTER_LINEAR)
+
+            # Same mosaic buffer bookkeeping as BaseDataset.load_image
+            if self.augment:
+                self.ims[i], self.im_hw0[i], self.im_hw[i] = im, (h0, w0), im.shape[:2]
+                self.buffer.append(i)
+                if 1 < len(self.buffer) >= self.max_buffer_length:
+                    j = self.buffer.pop(0)
+                    if self.cache != "ram":
+                        self.ims[j], self.im_hw0[j], self.im_hw[j] = None, None, None
+            return im, (h0, w0), im.shape[:2]
+
+    class PackedYOLODataset(CachedYOLODataset):
+        """
+        Images and labels come from a PackedDataset directory, or from a
+        subset of one listed (as <pack dir>/<frame name> lines) in a .txt file.
+        """
+
+        def get_img_files(self, img_path):
+            from packed_dataset import PackedDataset
+            img_path = str(img_path)
+            if img_path.endswith(".txt"):
+                with open(img_path) as f:
+                    entries = [line.strip() for line in f if line.strip()]
+                root = os.path.dirname(entries[0]) if entries else img_path
+                self.pack = PackedDataset(root)
+                self.rows = [self.pack.row_of(os.path.basename(e)) for e in entries]
+                missing = sum(r is None for r in self.rows)
+                if missing:
+                    raise FileNotFoundError(f"{missing} frames listed in {img_path} are not in {root}")
+            else:
+                root = img_path
+                self.pack = PackedDataset(root)
+                self.rows = list(range(len(self.pack)))
+            # Virtual paths: only used as keys/for display, never opened
+            names = self.pack.names()
+            return [os.path.join(root, names[r]) for r in self.rows]
+
+        def get_labels(self):
+            labels = []
+            for im_file, row in zip(self.im_files, self.rows):
+                cls, boxes = self.pack.labels(row)
+                r = self.pack.index[row]
+                labels.append({
+                    "im_file": im_file,
+                    "shape": (int(r["height"]), int(r["width"])),
+                    "cls": cls.astype(np.float32).reshape(-1, 1),
+                    "bboxes": boxes.astype(np.float32),
+                    "segments": [],
+                    "keypoints": None,
+                    "normalized": True,
+                    "bbox_format": "xywh",
+                })
+            return labels
+
+        def read_image(self, i):
+            if self.decoded is not None:
+                im = self.decoded.get(Path(self.im_files[i]).name)
+                if im is not None:
+                    return im
+            return self.pack.image(self.rows[i])
+
+    def build_dataset(dataset_cls, cfg, img_path, batch, data, mode="train", rect=False, stride=32):
+        return dataset_cls(
+            img_path=img_path,
+            imgsz=cfg.imgsz,
+            batch_size=batch,
+            augment=mode == "train",
+            hyp=cfg,
+            rect=cfg.rect or rect,
+            cache=None,
+            single_cls=cfg.single_cls or False,
+            stride=int(stride),
+            pad=0.0 if mode == "train" else 0.5,
+            prefix=f"{mode}: ",
+            task=cfg.task,
+            classes=cfg.classes,
+            data=data,
+            fraction=cfg.fraction if mode == "train" else 1.0,
+        )
+
+    def make_trainer(packed=False, decoded_cache=None):
+        base = PackedYOLODataset if packed else CachedYOLODataset
+        dataset_cls = type(base.__name__, (base,), {
+            "decoded": DecodedCache(decoded_cache) if decoded_cache else None,
+        })
+
+        class Validator(DetectionValidator):
+            def build_dataset(self, img_path, mode="val", batch=None):
+                return build_dataset(dataset_cls, self.args, img_path, batch, self.data, mode=mode,
+                                     stride=self.stride)
+
+        class Trainer(DetectionTrainer):
+            def build_dataset(self, img_path, mode="train", batch=None):
+                gs = max(int(unwrap_model(self.model).stride.max() if self.model else 0), 32)
+                return build_dataset(dataset_cls, self.args, img_path, batch, self.data, mode=mode,
+                                     rect=mode == "val", stride=gs)
+
+            def get_validator(self):
+                validator = super().get_validator()  # also sets self.loss_names
+                return Validator(self.test_loader, save_dir=self.save_dir, args=validator.args,
+                                 _callbacks=self.callbacks)
+
+        # For model.val(validator=...) on the same data
+        Trainer.validator_class = Validator
+        return Trainer
+
+    return make_trainer
+
+def make_trainer(packed=False, decoded_cache=None):
+    """
+    Trainer class for model.train(trainer=...). packed=True reads data.yaml
+    train/val as pack directories; decoded_cache is a DecodedCache path
+    whose frames are used instead of decoding JPEGs.
+    """
+    return _yolo_classes()(packed, decoded_cache)
@@ -1,12 +1,28 @@
 import os
+import json
 import snowflake.connector
 import cv2
 import time
+import concurrent.futures
+import multiprocessing
 from dotenv import load_dotenv
 from ultralytics import YOLO
 import shutil
 import glob
 from pathlib import Path
+from stage_sync import open_backend, sync
+from frame_sampler import iter_sampled_frames
+from frame_dedup import SceneChangeFilter, FrameDeduper, PHashIndex
+from batch_labeler import batch_label, batch_label_remote
+from label_cache import LabelCache, labeler_key
+from packed_dataset import pack_yolo_dir
+from train_cache import resize_for_training, resize_store, resize_pack, build_decoded_cache, make_trainer
+from incremental import plan_splits, stratum, read_list, write_list, read_promoted, promote, deployed_model
+from pipeline_dag import Stage, run_locked
+from stream_label import CHUNK_DONE, LabelDispatcher, pump_frames
+from perf_report import RunReport
+from cpu_governor import CpuGovernor
+from export_bench import FORMATS, pick_frames, load_frames, run_export_benchmark
 
 # Load environment variables
 load_dotenv()
@@ -19,19 +35,174 @@ SNOWFLAKE_DATABASE = os.getenv("SNOWFLAKE_DATABASE")
 SNOWFLAKE_SCHEMA = os.getenv("SNOWFLAKE_SCHEMA")
 SNOWFLAKE_WAREHOUSE = os.getenv("SNOWFLAKE_WAREHOUSE", "COMPUTE_WH")
 STAGE_NAME = "@VIDEO_STAGE"
+SYNC_WORKERS = int(os.getenv("SYNC_WORKERS", "4"))
+
+# Frame sampling: every FRAME_INTERVAL frames, or every FRAME_TIME_INTERVAL
+# seconds if set. SEEK_FRAMES=1 seeks between far-apart samples when the
+# container allows it.
+FRAME_INTERVAL = int(os.getenv("FRAME_INTERVAL", "30"))
+FRAME_TIME_INTERVAL = float(os.getenv("FRAME_TIME_INTERVAL", "0")) or None
+SEEK_FRAMES = os.getenv("SEEK_FRAMES", "0") == "1"
+
+# Extraction runs in a process pool (default: one process per core); videos
+# longer than CHUNK_SECONDS are split into time ranges extracted in parallel.
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "0"))
+CHUNK_SECONDS = float(os.getenv("CHUNK_SECONDS", "60"))
+
+# SAMPLING_MODE=scene probes every SCENE_PROBE_INTERVAL frames and keeps a
+# frame only when the view has changed (rover moving), instead of a fixed
+# FRAME_INTERVAL. DEDUP_FRAMES=1 (default in scene mode) also drops frames
+# whose perceptual hash is close to any frame extracted before (PHASH_INDEX).
+SAMPLING_MODE = os.getenv("SAMPLING_MODE", "interval")
+SCENE_PROBE_INTERVAL = int(os.getenv("SCENE_PROBE_INTERVAL", "5"))
+DEDUP_FRAMES = os.getenv("DEDUP_FRAMES", "1" if SAMPLING_MODE == "scene" else "0") == "1"
+
+# Training resolution. FRAME_STORE=train saves frames already shrunk to
+# TRAIN_IMGSZ (long side, aspect kept, so labels are unchanged and the
+# trainer's own resize is a no-op) under datasets/imgsz_<TRAIN_IMGSZ>/
+# instead of full-resolution frames under datasets/. A new TRAIN_IMGSZ gets
+# a new store, seeded from the frames we already have. DECODED_CACHE=1 also
+# keeps the decoded uint8 frames in one memory-mapped file so epochs skip
+# JPEG decoding (~0.9 MB per 640x480 frame on disk).
+TRAIN_IMGSZ = int(os.getenv("TRAIN_IMGSZ", "640"))
+FRAME_STORE = os.getenv("FRAME_STORE", "raw")
+DECODED_CACHE = os.getenv("DECODED_CACHE", "0") == "1"
 
 DATASET_ROOT = "datasets"
+FRAMES_ROOT = DATASET_ROOT if FRAME_STORE == "raw" else os.path.join(DATASET_ROOT, f"imgsz_{TRAIN_IMGSZ}")
 VIDEO_DIR = os.path.join(DATASET_ROOT, "raw_videos")
-IMAGES_DIR = os.path.join(DATASET_ROOT, "images", "train")
-LABELS_DIR = os.path.join(DATASET_ROOT, "labels", "train")
-VAL_IMAGES_DIR = os.path.join(DATASET_ROOT, "images", "val")
-VAL_LABELS_DIR = os.path.join(DATASET_ROOT, "labels", "val")
+IMAGES_DIR = os.path.join(FRAMES_ROOT, "images", "train")
+LABELS_DIR = os.path.join(FRAMES_ROOT, "labels", "train")
+VAL_IMAGES_DIR = os.path.join(FRAMES_ROOT, "images", "val")
+VAL_LABELS_DIR = os.path.join(FRAMES_ROOT, "labels", "val")
+DECODED_CACHE_PATH = os.path.join(FRAMES_ROOT, f"decoded_{TRAIN_IMGSZ}")
+PHASH_INDEX = os.path.join(DATASET_ROOT, "phash_index.npz")
+LABEL_CACHE_DB = os.path.join(DATASET_ROOT, "label_cache.sqlite")
+# Cached labels are kept for this many most recently used labelers
+LABEL_CACHE_KEEP = int(os.getenv("LABEL_CACHE_KEEP", "3"))
+
+# STREAMING=1 labels frames while extraction is still running: extraction
+# workers push saved frames into a bounded queue (STREAM_QUEUE) and
+# STREAM_LABEL_WORKERS processes (default half the cores) label them in
+# batches. A full queue blocks the extractors until labeling catches up.
+STREAMING = os.getenv("STREAMING", "0") == "1"
+STREAM_QUEUE = int(os.getenv("STREAM_QUEUE", "256"))
+STREAM_LABEL_WORKERS = int(os.getenv("STREAM_LABEL_WORKERS", "0"))
+
+# Pseudo-labeler: "yolo" runs yolov8n.pt on every frame (COCO classes, the model
+# contract everything downstream expects). LABELER=hsv opts into the MLH-App
+# colour/strip detectors instead - much faster, but the trained model then
+# predicts HSV_CLASSES (our own course classes), not COCO.
+# HSV_YOLO_SECOND_OPINION=1 lets YOLO look at frames the colour detectors found nothing in.
+LABELER = os.getenv("LABELER", "yolo")
+HSV_YOLO_SECOND_OPINION = os.getenv("HSV_YOLO_SECOND_OPINION", "0") == "1"
+
+# PACK_DATASET=1 appends labeled frames to sharded packs (packed_dataset.py)
+# and trains straight from them; PACK_REMOVE_LOOSE=1 then deletes the loose
+# JPEG/txt files so datasets/images doesn't grow night after night.
+PACK_DATASET = os.getenv("PACK_DATASET", "0") == "1"
+PACK_REMOVE_LOOSE = os.getenv("PACK_REMOVE_LOOSE", "0") == "1"
+PACKED_TRAIN_DIR = os.path.join(FRAMES_ROOT, "packed", "train")
+
+# TRAIN_MODE=incremental fine-tunes the last promoted model instead of
+# yolov8n.pt, on frames no earlier run trained on plus a stratified sample of
+# REPLAY_SIZE older ones, early-stopping on a held-out split of whole videos
+# (VAL_SIZE frames, stable across nights). New weights are promoted only if
+# they score at least as well as the current ones on that split. Export,
+# predict.py and the inference daemon all deploy whichever of the promoted
+# model and the last full run was recorded last (incremental.deployed_model).
+TRAIN_MODE = os.getenv("TRAIN_MODE", "full")
+REPLAY_SIZE = int(os.getenv("REPLAY_SIZE", "2000"))
+VAL_SIZE = int(os.getenv("VAL_SIZE", "500"))
+INCREMENTAL_EPOCHS = int(os.getenv("INCREMENTAL_EPOCHS", "10"))
+EARLY_STOP_PATIENCE = int(os.getenv("EARLY_STOP_PATIENCE", "3"))
+MODEL_DIR = "biathlon_model"
+PROMOTED_DIR = os.path.join(MODEL_DIR, "promoted")
+PROMOTED_RECORD = os.path.join(PROMOTED_DIR, "promoted.json")
+SPLITS_DIR = os.path.join(FRAMES_ROOT, "splits")
+LAST_RUN_RECORD = os.path.join(MODEL_DIR, "last_run.json")
+
+# main() runs the steps as fingerprinted stages (pipeline_dag.py): a stage
+# whose inputs haven't changed since it last succeeded is skipped, so a
+# crashed run resumes where it failed. FORCE_STAGES=label,train reruns stages
+# regardless. The lock file makes an overlapping cron run exit immediately.
+PIPELINE_STATE = os.path.join(DATASET_ROOT, "pipeline_state.json")
+PIPELINE_LOCK = os.path.join(DATASET_ROOT, "pipeline.lock")
+FORCE_STAGES = [s for s in os.getenv("FORCE_STAGES", "").split(",") if s]
+
+# Every run writes perf_reports/run_<time>.json: wall/CPU time, peak RSS,
+# bytes written and items/s per stage, with regressions flagged against the
+# median of the previous PERF_HISTORY runs.
+PERF_REPORT_DIR = "perf_reports"
+PERF_HISTORY = int(os.getenv("PERF_HISTORY", "5"))
+
+# Core budgets per stage (cpu_governor.py): pool sizes, OpenCV/torch threads
+# and DataLoader workers are sized together so stages don't oversubscribe the
+# droplet. GOVERNOR=auto tries alternative budgets on successive nights and
+# keeps the one with the best measured throughput (CPU_BUDGET_STATE).
+# EXTRACT_WORKERS / STREAM_LABEL_WORKERS / DECODE_THREADS still override.
+GOVERNOR = os.getenv("GOVERNOR", "fixed")
+CPU_BUDGET_STATE = os.path.join(DATASET_ROOT, "cpu_budget.json")
+GOV = CpuGovernor(GOVERNOR, labeler=LABELER, state_path=CPU_BUDGET_STATE)
+
+# The export stage exports the deployed weights as FP32 ONNX, dynamic INT8
+# ONNX, OpenVINO and TorchScript at each EXPORT_SIZES input size, times them
+# on BENCH_FRAMES fixed frames (held-out frames when there are any) and
+# publishes the fastest one whose mAP50-95 is within EXPORT_MAP_TOLERANCE of
+# the PyTorch model to biathlon_model/published/ with benchmark.json.
+EXPORT_SIZES = [int(s) for s in os.getenv("EXPORT_SIZES", f"{TRAIN_IMGSZ},480,320").split(",") if s]
+EXPORT_FORMATS = [f for f in os.getenv("EXPORT_FORMATS", ",".join(FORMATS)).split(",") if f]
+EXPORT_MAP_TOLERANCE = float(os.getenv("EXPORT_MAP_TOLERANCE", "0.01"))
+BENCH_FRAMES = int(os.getenv("BENCH_FRAMES", "100"))
+EXPORT_DIR = os.path.join(MODEL_DIR, "exports")
+PUBLISHED_DIR = os.path.join(MODEL_DIR, "published")
+BENCH_LIST = os.path.join(SPLITS_DIR, "bench.txt")
+
+# YOLO labeler: images per inference call and JPEG decode threads
+LABEL_BATCH = int(os.getenv("LABEL_BATCH", "16"))
+DECODE_THREADS = int(os.getenv("DECODE_THREADS", "0"))
+# LABEL_SERVER=1 sends the YOLO labeler's frames to the inference daemon
+# (inference_server.py) instead of loading a model in this process, so the
+# machine keeps one warm copy. The daemon must serve yolov8n.pt
+# (`inference_server.py --model yolov8n.pt`): labels use its class set.
+LABEL_SERVER = os.getenv("LABEL_SERVER", "0") == "1"
 
 def setup_directories():
     """Create necessary directories for YOLO training"""
     for d in [VIDEO_DIR, IMAGES_DIR, LABELS_DIR, VAL_IMAGES_DIR, VAL_LABELS_DIR]:
         os.makedirs(d, exist_ok=True)
     print("✅ Directories initialized.")
+    if FRAME_STORE == "train":
+        seed_frame_store()
+
+def _store_size(root):
+    """imgsz of a frame store root (None for the full-resolution one)"""
+    name = os.path.basename(os.path.normpath(root))
+    return int(name[len("imgsz_"):]) if name.startswith("imgsz_") else None
+
+def seed_frame_store():
+    """Fill an empty TRAIN_IMGSZ store by resizing the closest larger store we have"""
+    if next(Path(IMAGES_DIR).glob("*.jpg"), None) or os.path.exists(PACKED_TRAIN_DIR):
+        return
+
+    stores = [DATASET_ROOT] + [d for d in glob.glob(os.path.join(DATASET_ROOT, "imgsz_*"))
+                               if os.path.normpath(d) != os.path.normpath(FRAMES_ROOT)]
+    stores = [d for d in stores if next(Path(d, "images", "train").glob("*.jpg"), None)
+              or os.path.exists(os.path.join(d, "packed", "train", "pack.json"))]
+    if not stores:
+        return
+    # Smallest store that is still at least TRAIN_IMGSZ, else the largest one
+    big = float("inf")
+    sizes = {d: _store_size(d) or big for d in stores}
+    larger = [d for d in stores if sizes[d] >= TRAIN_IMGSZ]
+    src = min(larger, key=sizes.get) if larger else max(stores, key=sizes.get)
+
+    print(f"🖼️ Seeding {FRAMES_ROOT} from {src} at imgsz={TRAIN_IMGSZ}...")
+    n = resize_store(os.path.join(src, "images", "train"), os.path.join(src, "labels", "train"),
+                     IMAGES_DIR, LABELS_DIR, TRAIN_IMGSZ)
+    if os.path.exists(os.path.join(src, "packed", "train", "pack.json")):
+        n += resize_pack(os.path.join(src, "packed", "train"), IMAGES_DIR, LABELS_DIR, TRAIN_IMGSZ)
+    print(f"✅ Seeded {n} frames.")
 
 def connect_to_snowflake():
     """Establish connection to Snowflake"""
@@ -50,133 +221,381 @@ def connect_to_snowflake():
         print(f"❌ Connection failed: {e}")
         return None
 
-def download_videos(limit=5):
-    """Download the latest N videos from Snowflake Stage"""
-    conn = connect_to_snowflake()
-    if not conn:
-        return
-
-    cursor = conn.cursor()
+def download_videos():
+    """Fetch every new or changed video from the Snowflake Stage"""
+    backend = open_backend(connect_to_snowflake, STAGE_NAME)
     try:
-        # 1. List files in stage
-        print(f"🔍 Listing files in {STAGE_NAME}...")
-        cursor.execute(f"LIST {STAGE_NAME}")
-        
-        # files = cursor.fetchall()
-        # Simple approach: assume we pull everything or sort by name (timestamped)
-        # Getting the actual file content requires GET command
-        
-        # 2. Download files to local VIDEO_DIR
-        print(f"⬇️ Downloading latest {limit} videos to {VIDEO_DIR}...")
-        
-        # NOTE: Snowflake GET downloads ALL files matching pattern
-        # We can use a regex pattern or just download all if volume is low.
-        # For simplicity in this hackathon context, we download all.
-        cursor.execute(f"GET {STAGE_NAME} file://{os.path.abspath(VIDEO_DIR)} PATTERN='.*.webm'")
-        
-        print("✅ Download complete.")
-        
+        print(f"⬇️ Syncing videos from {STAGE_NAME} to {VIDEO_DIR}...")
+        # No newest-N cap: the local manifest means only files we don't already
+        # have are pulled, and a cap would drop older arrivals for good
+        return sync(backend, VIDEO_DIR, pattern=r".*\.webm", workers=SYNC_WORKERS)
     except Exception as e:
         print(f"❌ Download error: {e}")
+        return []
     finally:
-        cursor.close()
-        conn.close()
+        backend.close()
 
-def extract_frames(video_path, output_dir, frame_interval=30):
-    """Extract every Nth frame from video"""
+def extract_frames(video_path, output_dir, frame_interval=30, time_interval=None,
+                   start_frame=0, end_frame=None, scene=None, deduper=None, imgsz=None,
+                   on_saved=None):
+    """
+    Extract every Nth frame (or one frame every time_interval seconds) from video,
+    optionally only from the [start_frame, end_frame) range. A SceneChangeFilter
+    and/or FrameDeduper can veto sampled frames before they are written.
+    With imgsz, frames are saved already shrunk to the training size.
+    on_saved(path) is called after each frame is written.
+    Returns (frames saved, frames scanned, [(file name, phash)] of saved frames).
+    """
     vid_name = Path(video_path).stem
     cap = cv2.VideoCapture(video_path)
     
     if not cap.isOpened():
-        print(f"⚠️ Could not open {video_path}")
-        return
+        raise IOError(f"Could not open {video_path}")
 
-    count = 0
     saved = 0
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-            
-        if count % frame_interval == 0:
-            # Resize for YOLO (optimally 640x640, but keeping aspect ratio is fine too)
-            # We'll save raw for now
-            out_name = f"{vid_name}_frame_{count}.jpg"
-            out_path = os.path.join(output_dir, out_name)
-            cv2.imwrite(out_path, frame)
-            saved += 1
-            
-        count += 1
-    
+    kept = []
+    # Skipped frames are only grab()bed, never decoded to BGR
+    for index, _, frame in iter_sampled_frames(cap, frame_interval, time_interval, seek=SEEK_FRAMES,
+                                               start_frame=start_frame, end_frame=end_frame):
+        if scene is not None and not scene.accept(frame):
+            continue
+        h = None
+        if deduper is not None:
+            h = deduper.check(frame)
+            if h is None:
+                continue
+
+        # Resize for YOLO: long side to imgsz, keeping aspect ratio (the
+        # trainer letterboxes per batch), or raw when imgsz is None
+        if imgsz:
+            frame = resize_for_training(frame, imgsz)
+        out_name = f"{vid_name}_frame_{index}.jpg"
+        out_path = os.path.join(output_dir, out_name)
+        cv2.imwrite(out_path, frame)
+        saved += 1
+        if on_saved is not None:
+            on_saved(out_path)
+        if h is not None:
+            kept.append((out_name, h))
+
+    scanned = int(cap.get(cv2.CAP_PROP_POS_FRAMES)) - start_frame
     cap.release()
-    print(f"📸 Extracted {saved} frames from {vid_name}")
+    return saved, scanned, kept
 
-import concurrent.futures
+def plan_chunks(video_path, frame_interval=30):
+    """
+    Split a video into frame ranges of about CHUNK_SECONDS each.
+    Boundaries are multiples of frame_interval, so in frame-interval mode
+    chunked extraction samples exactly the same frames as a single pass; in
+    FRAME_TIME_INTERVAL mode each chunk starts on the next multiple of the
+    interval, which matches a single pass up to timestamp jitter. Scene mode
+    starts a fresh SceneChangeFilter per chunk, so the first probe of each
+    chunk is kept whatever the previous chunk ended on. Videos whose length
+    can't be read (common for browser-recorded .webm) stay a single chunk.
+    """
+    cap = cv2.VideoCapture(video_path)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    cap.release()
+
+    chunk = max(frame_interval, int(CHUNK_SECONDS * fps) // frame_interval * frame_interval)
+    if total <= 0 or total <= chunk:
+        return [(0, None)]
+    return [(start, start + chunk if start + chunk < total else None)
+            for start in range(0, total, chunk)]
+
+def sampling_interval():
+    return SCENE_PROBE_INTERVAL if SAMPLING_MODE == "scene" else FRAME_INTERVAL
 
-# ... (imports remain the same, just adding concurrent.futures to top if needed, 
-# but replace_file_content is partial. I will add it in the replacement chunk or assume standard lib)
+_known_hashes = None
+_frame_queue = None
 
-def process_single_video(video_path):
+def _init_extract_worker(frame_queue=None, threads=1):
+    # Parallelism comes from the pool; OpenCV/FFmpeg threads per process come from the budget
+    cv2.setNumThreads(threads)
+    os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = f"threads;{threads}"
+    # Read-only snapshot of the hashes from previous nights
+    global _known_hashes, _frame_queue
+    if DEDUP_FRAMES:
+        _known_hashes = PHashIndex(PHASH_INDEX)
+    # Streaming mode: saved frame paths go to the labelers as they are written
+    _frame_queue = frame_queue
+
+def process_chunk(video_path, start_frame, end_frame):
     """Worker function for parallel processing"""
+    t0 = time.time()
+    scene = SceneChangeFilter() if SAMPLING_MODE == "scene" else None
+    deduper = FrameDeduper(_known_hashes) if DEDUP_FRAMES else None
     try:
-        extract_frames(video_path, IMAGES_DIR, frame_interval=30)
-    except Exception as e:
-        print(f"❌ Error processing {video_path}: {e}")
+        saved, scanned, kept = extract_frames(video_path, IMAGES_DIR, frame_interval=sampling_interval(),
+                                              time_interval=None if scene else FRAME_TIME_INTERVAL,
+                                              start_frame=start_frame, end_frame=end_frame,
+                                              scene=scene, deduper=deduper,
+                                              imgsz=TRAIN_IMGSZ if FRAME_STORE == "train" else None,
+                                              on_saved=_frame_queue.put if _frame_queue is not None else None)
+    finally:
+        if _frame_queue is not None:
+            _frame_queue.put(CHUNK_DONE)
+    return video_path, saved, scanned, time.time() - t0, kept
 
-def process_videos():
-    """Process downloaded videos in parallel to leverage NVMe I/O"""
+def dedup_across_chunks(kept):
+    """
+    Workers only see the index snapshot and their own frames; this pass
+    catches duplicates between chunks/videos of the same night and records
+    the survivors in the persistent index. Returns frames removed per video.
+    """
+    index = PHashIndex(PHASH_INDEX)
+    removed = {}
+    for video_path, name, h in sorted(kept):
+        if index.is_duplicate(h):
+            os.remove(os.path.join(IMAGES_DIR, name))
+            # Streaming mode may already have labeled it
+            label_path = os.path.join(LABELS_DIR, f"{Path(name).stem}.txt")
+            if os.path.exists(label_path):
+                os.remove(label_path)
+            removed[video_path] = removed.get(video_path, 0) + 1
+        else:
+            index.add(h, name)
+    index.save()
+    print(f"🧹 Dedup: removed {sum(removed.values())} cross-chunk duplicates, index holds {len(index)} frames.")
+    return removed
+
+def process_videos(dispatcher=None, max_workers=None, budget="extract"):
+    """
+    Extract frames from downloaded videos across a process pool, splitting long videos into chunks.
+    With a LabelDispatcher, saved frames are streamed to it for labeling while extraction runs.
+    """
     videos = glob.glob(os.path.join(VIDEO_DIR, "*.webm"))
     print(f"found {len(videos)} videos to process.")
-    
-    # Use ThreadPoolExecutor for I/O bound task (reading video, writing images)
-    # NVMe supports high parallelism. 
-    # Spec: 8 vCPUs. Let's use 4 threads.
-    max_workers = 4 
-    print(f"🚀 Starting extraction with {max_workers} threads...")
-    
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        executor.map(process_single_video, videos)
-        
-    print("✅ Frame extraction complete.")
+
+    jobs = [(v, start, end) for v in videos for (start, end) in plan_chunks(v, sampling_interval())]
+    # Streaming: the main process belongs to the labeler's budget, only size the pool
+    b = GOV.budget(budget) if dispatcher is not None else GOV.apply(budget)
+    max_workers = max_workers or EXTRACT_WORKERS or b["procs"]
+    print(f"🚀 Starting extraction: {len(jobs)} chunks on {max_workers} processes...")
+
+    stats = {v: {"saved": 0, "scanned": 0, "cpu_s": 0.0, "chunks": 0, "failed": 0} for v in videos}
+    start = time.time()
+    done = 0
+    kept = []
+
+    def collect(future):
+        nonlocal done
+        video_path = futures[future][0]
+        done += 1
+        try:
+            _, saved, scanned, seconds, chunk_kept = future.result()
+        except Exception as e:
+            stats[video_path]["failed"] += 1
+            print(f"❌ [{done}/{len(jobs)}] Error processing {video_path} {futures[future][1:]}: {e}")
+            return
+        st = stats[video_path]
+        st["saved"] += saved
+        st["scanned"] += scanned
+        st["cpu_s"] += seconds
+        st["chunks"] += 1
+        kept.extend((video_path, name, h) for name, h in chunk_kept)
+        print(f"📸 [{done}/{len(jobs)}] {Path(video_path).stem}: {saved} frames "
+              f"({scanned / seconds if seconds > 0 else 0:.0f} frames/s)")
+
+    frame_queue = multiprocessing.Queue(maxsize=STREAM_QUEUE) if dispatcher is not None else None
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, initializer=_init_extract_worker,
+                                                initargs=(frame_queue, b["threads"])) as executor:
+        futures = {executor.submit(process_chunk, *job): job for job in jobs}
+        if dispatcher is None:
+            for future in concurrent.futures.as_completed(futures):
+                collect(future)
+        else:
+            pump_frames(frame_queue, futures, dispatcher, collect)
+
+    if DEDUP_FRAMES:
+        for video_path, n in dedup_across_chunks(kept).items():
+            stats[video_path]["saved"] -= n
+
+    for video_path, st in stats.items():
+        rate = st["scanned"] / st["cpu_s"] if st["cpu_s"] > 0 else 0.0
+        status = f"{st['failed']} chunks FAILED" if st["failed"] else "ok"
+        print(f"   {Path(video_path).stem}: {st['saved']} frames from {st['scanned']} scanned "
+              f"in {st['chunks']} chunks, {rate:.0f} frames/s per worker ({status})")
+
+    elapsed = time.time() - start
+    total_saved = sum(st["saved"] for st in stats.values())
+    failed = sum(1 for st in stats.values() if st["failed"])
+    print(f"✅ Frame extraction complete: {total_saved} frames in {elapsed:.1f}s"
+          + (f", {failed} videos with failures." if failed else "."))
+    return stats
+
+def stream_extract_label():
+    """process_videos() with labeling overlapped: extraction and labeling share the cores"""
+    lb = GOV.apply("stream_label")
+    label_workers = STREAM_LABEL_WORKERS or (lb["procs"] if LABELER == "hsv" else lb["threads"])
+    extract_workers = EXTRACT_WORKERS or GOV.budget("stream_extract")["procs"]
+    key = current_labeler_key()
+    cache = LabelCache(LABEL_CACHE_DB)
+
+    if LABELER == "hsv":
+        from hsv_labeler import _init_worker, _label_chunk
+        labeler = concurrent.futures.ProcessPoolExecutor(max_workers=label_workers, initializer=_init_worker)
+        fn, args = _label_chunk, (LABELS_DIR,)
+    else:
+        # One inference thread; torch spreads each batch over the stage's threads
+        labeler = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        fn = yolo_batch_labeler(DECODE_THREADS or lb["io"])
+        args = ()
+
+    print(f"🌊 Streaming: {extract_workers} extraction + {label_workers} labeling workers, "
+          f"queue of {STREAM_QUEUE} frames.")
+    start = time.time()
+    try:
+        with labeler:
+            dispatcher = LabelDispatcher(labeler, fn, args, batch_size=LABEL_BATCH if LABELER != "hsv" else 64,
+                                         max_inflight=label_workers * 2, cache=cache, key=key,
+                                         labels_dir=LABELS_DIR)
+            stats = process_videos(dispatcher, max_workers=extract_workers, budget="stream_extract")
+    finally:
+        cache.close()
+
+    print(f"🏷️ Streamed labels: {len(dispatcher.labeled)} labeled, {dispatcher.hits} from cache"
+          + (f", {dispatcher.errors} batches FAILED" if dispatcher.errors else "")
+          + f" ({time.time() - start:.1f}s for extraction + labeling).")
+
+    if LABELER == "hsv" and HSV_YOLO_SECOND_OPINION:
+        from hsv_labeler import yolo_second_opinion
+        empty = [p for _, _, chunk_empty in dispatcher.results for p in chunk_empty if os.path.exists(p)]
+        if empty:
+            print(f"🔎 YOLO second opinion on {len(empty)} frames with no colour detections...")
+            print(f"✅ YOLO added {yolo_second_opinion(empty, LABELS_DIR)} obstacle boxes.")
+            # Re-store so the cache holds the final labels
+            cache = LabelCache(LABEL_CACHE_DB)
+            cache.store(empty, key, LABELS_DIR)
+            cache.close()
+    return stats
+
+def current_labeler_key():
+    """Cache key for the configured labeler: weights/source hashes plus thresholds"""
+    if LABELER == "hsv":
+        from hsv_labeler import HSV_SOURCE_FILES
+        files = list(HSV_SOURCE_FILES) + (['yolov8n.pt'] if HSV_YOLO_SECOND_OPINION else [])
+        return labeler_key("hsv", files, yolo=HSV_YOLO_SECOND_OPINION)
+    return labeler_key("yolo", ['yolov8n.pt'], conf=0.4)
 
 def auto_label_frames():
+    """Pseudo-label extracted frames with the configured LABELER, reusing cached labels"""
+    images = sorted(glob.glob(os.path.join(IMAGES_DIR, "*.jpg")))
+    key = current_labeler_key()
+    b = GOV.apply("label")
+
+    cache = LabelCache(LABEL_CACHE_DB)
+    try:
+        # Frames labeled on earlier nights by the same labeler are restored instantly
+        todo = cache.restore(images, key, LABELS_DIR)
+        print(f"🗃️ Label cache: {len(images) - len(todo)} hits, {len(todo)} frames to label.")
+
+        if todo:
+            if LABELER == "hsv":
+                from hsv_labeler import hsv_label_frames
+                hsv_label_frames(IMAGES_DIR, LABELS_DIR, workers=b["procs"], yolo=HSV_YOLO_SECOND_OPINION,
+                                 images=todo)
+            else:
+                yolo_label_frames(todo, decode_threads=DECODE_THREADS or b["io"])
+            cache.store(todo, key, LABELS_DIR)
+
+        pruned = cache.prune(LABEL_CACHE_KEEP)
+        if pruned:
+            print(f"🗃️ Dropped {pruned} cached labels from older labelers.")
+    finally:
+        cache.close()
+    return {"frames": len(images), "labels": len(todo)}
+
+def yolo_batch_labeler(decode_threads):
+    """fn(paths) -> (labeled, img/s) for the YOLO labeler, in this process or through the daemon"""
+    if LABEL_SERVER:
+        from inference_server import InferenceClient
+        client = InferenceClient()
+        served = client.health()["model"]
+        client.close()
+        if Path(served).name != "yolov8n.pt":
+            raise RuntimeError(f"LABEL_SERVER=1 but the inference daemon serves {served}, not yolov8n.pt")
+        print("🔌 Labeling through the inference daemon.")
+        return lambda paths: batch_label_remote(paths, LABELS_DIR, batch_size=LABEL_BATCH,
+                                                decode_threads=decode_threads, conf=0.4)
+    # Load a pre-trained model (YOLOv8n)
+    model = YOLO('yolov8n.pt')
+    return lambda paths: batch_label(model, paths, LABELS_DIR, batch_size=LABEL_BATCH,
+                                     decode_threads=decode_threads, conf=0.4)
+
+def yolo_label_frames(images=None, decode_threads=4):
     """
     Pseudo-labelling: Use a pre-trained YOLO model to detect objects 'in the wild'.
     """
     print("🏷️ Starting Auto-Labeling (Pseudo-labeling) on CPU...")
-    
-    # Load a pre-trained model (YOLOv8n)
-    model = YOLO('yolov8n.pt') 
+    label = yolo_batch_labeler(decode_threads)
     
     # List all images
-    images = glob.glob(os.path.join(IMAGES_DIR, "*.jpg"))
+    if images is None:
+        images = glob.glob(os.path.join(IMAGES_DIR, "*.jpg"))
     
-    for img_path in images:
-        # Run inference on CPU
-        results = model(img_path, verbose=False, device='cpu')
-        
-        # Save labels in YOLO format
-        img_name = Path(img_path).stem
-        label_path = os.path.join(LABELS_DIR, f"{img_name}.txt")
-        
-        with open(label_path, 'w') as f:
-            for r in results:
-                for box in r.boxes:
-                    # Filter: Only Label High Confidence detections
-                    if box.conf[0] > 0.4: 
-                        cls = int(box.cls[0])
-                        # Write to file
-                        x, y, w, h = box.xywhn[0].tolist()
-                        f.write(f"{cls} {x} {y} {w} {h}\n")
+    # Decode ahead in threads, infer in batches, write labels in the background
+    # Filter: Only Label High Confidence detections
+    done, rate = label(images)
     
-    print("✅ Auto-labeling complete.")
+    print(f"✅ Auto-labeling complete: {done} images ({rate:.1f} img/s).")
+
+def pack_dataset():
+    """Append this night's labeled frames to the packed train split"""
+    key = current_labeler_key()
+    key_path = os.path.join(PACKED_TRAIN_DIR, "labeler.txt")
+    old_key = open(key_path).read().strip() if os.path.exists(key_path) else None
+
+    n = pack_yolo_dir(IMAGES_DIR, LABELS_DIR, PACKED_TRAIN_DIR, remove=PACK_REMOVE_LOOSE)
+    print(f"📦 Packed {n} frames into {PACKED_TRAIN_DIR}.")
+
+    # Frames packed (and removed) on earlier nights were labeled by whatever
+    # labeler ran then; relabel them from the shards when it has changed.
+    if old_key and old_key != key:
+        if LABELER == "hsv":
+            from hsv_labeler import hsv_label_pack
+            hsv_label_pack(PACKED_TRAIN_DIR)
+        else:
+            print("⚠️ Labeler changed but packed frames can only be relabeled with LABELER=hsv.")
+    with open(key_path, "w") as f:
+        f.write(key)
+    return {"frames": n}
+
+def cache_decoded_frames():
+    """Add new training frames to the memory-mapped decoded cache"""
+    images = None if PACK_DATASET else glob.glob(os.path.join(IMAGES_DIR, "*.jpg"))
+    added, total = build_decoded_cache(DECODED_CACHE_PATH, TRAIN_IMGSZ, images=images,
+                                       pack_root=PACKED_TRAIN_DIR if PACK_DATASET else None,
+                                       threads=DECODE_THREADS or GOV.apply("decode_cache")["io"])
+    print(f"🧊 Decoded cache: {added} new frames, {total} total at imgsz={TRAIN_IMGSZ}.")
+    return {"frames": added}
+
+def create_yaml(train=None, val=None, path="data.yaml"):
+    """Create data.yaml for YOLO training (train/val default to the whole train split)"""
+    split = "packed/train" if PACK_DATASET else "images/train"
+    train = train or split
+    val = val or split
+    if LABELER == "hsv":
+        from hsv_labeler import HSV_CLASSES
+        names = "\n".join(f"  {i}: {name}" for i, name in enumerate(HSV_CLASSES))
+        yaml_content = f"""
+path: {os.path.abspath(FRAMES_ROOT)}  # dataset root dir
+train: {train}  # train images (relative to 'path') 
+val: {val}  # val images (relative to 'path') - the train split unless a held-out list is given
+
+# Classes (HSV pseudo-labels, see hsv_labeler.py) - LABELER=hsv, NOT the COCO class set
+names:
+{names}
+"""
+        with open(path, "w") as f:
+            f.write(yaml_content)
+        return
 
-def create_yaml():
-    """Create data.yaml for YOLO training"""
     yaml_content = f"""
-path: {os.path.abspath(DATASET_ROOT)}  # dataset root dir
-train: images/train  # train images (relative to 'path') 
-val: images/train  # val images (relative to 'path') - using train for val in this demo
+path: {os.path.abspath(FRAMES_ROOT)}  # dataset root dir
+train: {train}  # train images (relative to 'path') 
+val: {val}  # val images (relative to 'path') - the train split unless a held-out list is given
 
 # Classes
 names:
@@ -194,43 +613,265 @@ names:
   11: stop sign
   # ... (YOLOv8n coco classes)
 """
-    with open("data.yaml", "w") as f:
+    with open(path, "w") as f:
         f.write(yaml_content)
 
 def train_model():
     """Fine-tune the model on the new data"""
     print("🧠 Starting Training Loop (CPU Mode)...")
+    b = GOV.apply("train")
     
     # Load model
     model = YOLO('yolov8n.pt')
+
+    # Packs and the decoded cache need a trainer whose DataLoader reads from them
+    extra = {}
+    if PACK_DATASET or DECODED_CACHE:
+        extra["trainer"] = make_trainer(packed=PACK_DATASET,
+                                        decoded_cache=DECODED_CACHE_PATH if DECODED_CACHE else None)
     
     # Train
     results = model.train(
         data='data.yaml',
         epochs=10,
-        imgsz=640,
+        imgsz=TRAIN_IMGSZ,
         batch=8, # Reduced batch size for CPU/RAM safety
-        project='biathlon_model',
+        project=MODEL_DIR,
         name='cpu_run',
         device='cpu', # Force CPU
-        workers=8 # DataLoader workers
+        workers=b["loader"], # DataLoader workers, from the core budget
+        **extra
     )
     
     print(f"🚀 Training Complete. Model saved to {results.save_dir}")
-    
-    # Export to ONNX for Robot Hardware (ESP32 / Pi)
-    print("📦 Exporting to ONNX...")
-    model.export(format='onnx')
-    print("✅ ONNX Export Complete.")
+
+    # The export stage picks the weights up from here
+    best = os.path.join(str(model.trainer.save_dir), "weights", "best.pt")
+    with open(LAST_RUN_RECORD, "w") as f:
+        json.dump({"weights": best, "date": time.strftime("%Y-%m-%d %H:%M:%S")}, f, indent=2)
+    epochs = model.trainer.epoch + 1
+    return {"epochs": epochs, "images": epochs * len(model.trainer.train_loader.dataset)}
+
+def frame_strata():
+    """{frame name: (path for list files, replay stratum)} for every labeled training frame"""
+    frames = {}
+    if PACK_DATASET:
+        from packed_dataset import PackedDataset
+        pack = PackedDataset(PACKED_TRAIN_DIR)
+        root = os.path.abspath(PACKED_TRAIN_DIR)
+        for i, name in enumerate(pack.names()):
+            frames[name] = (os.path.join(root, name), stratum(pack.labels(i)[0]))
+        pack.close()
+        return frames
+
+    for img_path in glob.glob(os.path.join(IMAGES_DIR, "*.jpg")):
+        label_path = os.path.join(LABELS_DIR, f"{Path(img_path).stem}.txt")
+        if not os.path.exists(label_path):
+            continue
+        with open(label_path) as f:
+            classes = [line.split()[0] for line in f if line.strip()]
+        frames[Path(img_path).name] = (os.path.abspath(img_path), stratum(classes))
+    return frames
+
+def evaluate(weights, trainer_cls):
+    """mAP50-95 of weights on the held-out split in data.yaml"""
+    extra = {"validator": trainer_cls.validator_class} if trainer_cls else {}
+    metrics = YOLO(weights).val(data='data.yaml', split='val', imgsz=TRAIN_IMGSZ, batch=8, device='cpu',
+                                workers=GOV.budget("train")["loader"], plots=False, verbose=False, project=MODEL_DIR, name='val',
+                                exist_ok=True, **extra)
+    return float(metrics.box.map)
+
+def train_incremental():
+    """Fine-tune the promoted model on new frames + a replay sample, promote if it holds up"""
+    os.makedirs(SPLITS_DIR, exist_ok=True)
+    seen_path = os.path.join(SPLITS_DIR, "seen.txt")
+    val_path = os.path.join(SPLITS_DIR, "val.txt")
+    train_path = os.path.join(SPLITS_DIR, "train.txt")
+
+    frames = frame_strata()
+    seen = read_list(seen_path)
+    new, replay, val = plan_splits(sorted(frames), seen, [Path(p).name for p in read_list(val_path)],
+                                   lambda n: frames[n][1], REPLAY_SIZE, VAL_SIZE)
+    print(f"🧠 Incremental training: {len(new)} new + {len(replay)} replay frames, "
+          f"{len(val)} held out ({len(frames)} in archive).")
+    if not new:
+        print("✅ No new frames since the last run, nothing to train.")
+        return {"epochs": 0}
+    if not val:
+        print("⚠️ No held-out videos yet, validating on the training frames.")
+
+    write_list(train_path, [frames[n][0] for n in new + replay])
+    write_list(val_path, [frames[n][0] for n in val])
+    create_yaml(train=os.path.abspath(train_path),
+                val=os.path.abspath(val_path if val else train_path))
+
+    promoted = read_promoted(PROMOTED_RECORD)
+    start = promoted["weights"] if promoted and os.path.exists(promoted["weights"]) else 'yolov8n.pt'
+    print(f"🔁 Warm-starting from {start}")
+    b = GOV.apply("train")
+    model = YOLO(start)
+
+    trainer_cls = None
+    extra = {}
+    if PACK_DATASET or DECODED_CACHE:
+        trainer_cls = make_trainer(packed=PACK_DATASET,
+                                   decoded_cache=DECODED_CACHE_PATH if DECODED_CACHE else None)
+        extra["trainer"] = trainer_cls
+
+    model.train(
+        data='data.yaml',
+        epochs=INCREMENTAL_EPOCHS,
+        patience=EARLY_STOP_PATIENCE, # Early stopping on the held-out split
+        imgsz=TRAIN_IMGSZ,
+        batch=8,
+        project=MODEL_DIR,
+        name='incremental',
+        device='cpu',
+        workers=b["loader"],
+        **extra
+    )
+    best = os.path.join(str(model.trainer.save_dir), "weights", "best.pt")
+    epochs = model.trainer.epoch + 1
+    counts = {"epochs": epochs, "frames": len(new) + len(replay), "images": epochs * (len(new) + len(replay))}
+
+    # Trained-on frames go to the replay pool whether or not we promote
+    write_list(seen_path, sorted(set(seen) | set(new)))
+
+    # Score both models on today's held-out list (it may have grown since the last promotion)
+    new_map = evaluate(best, trainer_cls)
+    old_map = evaluate(start, trainer_cls) if start != 'yolov8n.pt' else -1.0
+    print(f"📊 Held-out mAP50-95: new {new_map:.4f} vs promoted {max(old_map, 0.0):.4f}")
+    if new_map < old_map:
+        print("↩️ Keeping the promoted model.")
+        return counts
+
+    dest = promote(best, PROMOTED_RECORD, PROMOTED_DIR, map=new_map, frames=len(frames),
+                   date=time.strftime("%Y-%m-%d %H:%M:%S"))
+    print(f"🏅 Promoted {best} -> {dest}")
+    return counts
+
+def bench_frame_set():
+    """The benchmark frames: picked once (held-out frames preferred) and kept, so nights compare"""
+    frames = frame_strata()
+    paths = [p for p in read_list(BENCH_LIST) if Path(p).name in frames]
+    if len(paths) < min(BENCH_FRAMES, len(frames)) // 2:
+        # First run, or most of the old set has been pruned since
+        held_out = [p for p in read_list(os.path.join(SPLITS_DIR, "val.txt")) if Path(p).name in frames]
+        paths = pick_frames(held_out or [p for p, _ in frames.values()], BENCH_FRAMES)
+        os.makedirs(SPLITS_DIR, exist_ok=True)
+        write_list(BENCH_LIST, paths)
+    return paths
+
+def export_model():
+    """Export for Robot Hardware (ESP32 / Pi) and publish the fastest accurate variant"""
+    weights = deployed_model(MODEL_DIR)
+    if weights is None:
+        print("⚠️ No trained weights to export.")
+        return
+    GOV.apply("export")
+
+    paths = bench_frame_set()
+    validator = None
+    if PACK_DATASET:
+        # Bench list entries are <pack>/<name>; decode them out of the pack
+        from packed_dataset import PackedDataset
+        pack = PackedDataset(PACKED_TRAIN_DIR)
+        frames = load_frames(paths, lambda p: pack.image(pack.row_of(Path(p).name)))
+        pack.close()
+        validator = make_trainer(packed=True).validator_class
+    else:
+        frames = load_frames(paths)
+    bench_yaml = os.path.join(MODEL_DIR, "bench.yaml")
+    create_yaml(val=os.path.abspath(BENCH_LIST), path=bench_yaml)
+
+    print(f"📦 Exporting {weights} as {', '.join(EXPORT_FORMATS)} at imgsz {EXPORT_SIZES}...")
+    report = run_export_benchmark(weights, EXPORT_SIZES, frames, bench_yaml, TRAIN_IMGSZ, EXPORT_DIR,
+                                  PUBLISHED_DIR, tolerance=EXPORT_MAP_TOLERANCE,
+                                  formats=EXPORT_FORMATS, validator=validator)
+    return {"models": len(report["variants"]), "frames": len(frames)}
+
+def download_stage():
+    fetched = download_videos()
+    return {"videos": len(fetched), "bytes_downloaded": sum(os.path.getsize(p) for p in fetched if os.path.exists(p))}
+
+def extract_stage():
+    stats = stream_extract_label() if STREAMING else process_videos()
+    failed = [Path(v).stem for v, st in stats.items() if st["failed"]]
+    if failed:
+        # Don't record the stage as done; the next run retries it
+        raise RuntimeError(f"frame extraction failed for {', '.join(failed)}")
+    return {"videos": len(stats), "frames": sum(st["saved"] for st in stats.values()),
+            "frames_scanned": sum(st["scanned"] for st in stats.values())}
+
+def train_stage():
+    if TRAIN_MODE == "incremental":
+        return train_incremental()
+    create_yaml()
+    return train_model()
+
+def training_data():
+    """What the trainer reads: the pack, or the loose images + labels"""
+    return [PACKED_TRAIN_DIR] if PACK_DATASET else [IMAGES_DIR, LABELS_DIR]
+
+def pipeline_stages():
+    extract_params = {
+        "mode": SAMPLING_MODE, "interval": sampling_interval(), "time_interval": FRAME_TIME_INTERVAL,
+        "seek": SEEK_FRAMES, "dedup": DEDUP_FRAMES, "store": FRAME_STORE, "imgsz": TRAIN_IMGSZ,
+        "stream": STREAMING,
+    }
+    train_params = {
+        "mode": TRAIN_MODE, "imgsz": TRAIN_IMGSZ, "labeler": LABELER, "packed": PACK_DATASET,
+        "replay": REPLAY_SIZE, "val": VAL_SIZE, "epochs": INCREMENTAL_EPOCHS,
+    }
+    train_output = (os.path.join(SPLITS_DIR, "seen.txt") if TRAIN_MODE == "incremental"
+                    else LAST_RUN_RECORD)
+
+    stages = [
+        # The remote stage can't be fingerprinted locally; sync is incremental anyway
+        Stage("download", download_stage, always=True),
+        Stage("extract", extract_stage, params=extract_params,
+              inputs=lambda: sorted(glob.glob(os.path.join(VIDEO_DIR, "*.webm")))),
+        Stage("label", auto_label_frames, inputs=[IMAGES_DIR],
+              params=lambda: {"labeler": current_labeler_key()}),
+    ]
+    if PACK_DATASET:
+        stages.append(Stage("pack", pack_dataset, inputs=[IMAGES_DIR, LABELS_DIR],
+                            outputs=[os.path.join(PACKED_TRAIN_DIR, "pack.json")],
+                            params=lambda: {"labeler": current_labeler_key(), "remove": PACK_REMOVE_LOOSE}))
+    if DECODED_CACHE:
+        stages.append(Stage("decode_cache", cache_decoded_frames, inputs=training_data,
+                            outputs=[DECODED_CACHE_PATH + ".idx.npy"], params={"imgsz": TRAIN_IMGSZ}))
+    stages += [
+        Stage("train", train_stage, inputs=training_data, outputs=[train_output], params=train_params),
+        Stage("export", export_model,
+              params={"mode": TRAIN_MODE, "sizes": EXPORT_SIZES, "formats": EXPORT_FORMATS,
+                      "tolerance": EXPORT_MAP_TOLERANCE, "frames": BENCH_FRAMES},
+              inputs=lambda: [w for w in [deployed_model(MODEL_DIR)] if w],
+              # Not published.json: nothing is published when no variant keeps accuracy
+              outputs=[os.path.join(EXPORT_DIR, "benchmark.json")]),
+    ]
+    return stages
 
 def main():
     print("🚀 Starting DigitalOcean Training Pipeline")
-    setup_directories()
-    download_videos()
-    process_videos()
-    auto_label_frames()
-    create_yaml()
-    train_model()
+    os.makedirs(DATASET_ROOT, exist_ok=True)
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    report = RunReport(PERF_REPORT_DIR, history=PERF_HISTORY, config={
+        "labeler": LABELER, "train_mode": TRAIN_MODE, "imgsz": TRAIN_IMGSZ, "sampling": SAMPLING_MODE,
+        "streaming": STREAMING, "packed": PACK_DATASET, "cpus": GOV.cpus, "governor": GOVERNOR,
+    })
+    status = "failed"
+    try:
+        if not run_locked([Stage("setup", setup_directories, always=True)] + pipeline_stages(),
+                          PIPELINE_STATE, PIPELINE_LOCK, force=FORCE_STAGES, report=report):
+            return
+        status = "ok"
+    finally:
+        # Lock held by another run: nothing ran, nothing to report
+        if report.stages:
+            report.config["budgets"] = GOV.summary()
+            report.save(status)
+            GOV.learn(report.stages)
     print("🏁 Pipeline Finished Successfully")
 
 if __name__ == "__main__":